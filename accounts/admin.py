@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from airline.paginator import EstimatedCountPaginator
 from .models import User, Customer, UserRole,  Administrator, Token
 
 
@@ -11,6 +12,8 @@ class CustomUserAdmin(UserAdmin):
     sortable_by = ('date_of_creation',)
     ordering = ('-date_joined',)
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'groups')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     fieldsets = (
         (None, {'fields': ('username', 'password')}),
@@ -31,8 +34,16 @@ class CustomUserAdmin(UserAdmin):
     #     return super(UserAdmin, self).get_readonly_fields(request, obj) if obj else ()
 
 
+class UserRelatedAdmin(admin.ModelAdmin):
+    # `__str__` of these models is the username
+    list_select_related = ('user', )
+    raw_id_fields = ('user', )
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 admin.site.register(User, CustomUserAdmin)
-admin.site.register(Customer)
+admin.site.register(Customer, UserRelatedAdmin)
 admin.site.register(UserRole)
-admin.site.register(Administrator)
-admin.site.register(Token)
+admin.site.register(Administrator, UserRelatedAdmin)
+admin.site.register(Token, UserRelatedAdmin)
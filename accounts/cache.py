@@ -0,0 +1,109 @@
+import time
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+
+class Principal(namedtuple('Principal', ('user_id', 'role', 'customer_id', 'administrator_id', 'company_id'))):
+    """The authenticated user with its role, customer & administrator profiles and the company it manages."""
+
+    __slots__ = ()
+
+    @property
+    def is_admin(self):
+        return self.administrator_id is not None
+
+    @property
+    def is_customer(self):
+        return self.customer_id is not None
+
+    @property
+    def is_manager(self):
+        return self.company_id is not None
+
+
+class LRUCache:
+    """
+    Bounded in-process cache, least recently used entries are evicted once `maxsize` is reached and entries expire
+    after `ttl` seconds. Entries can be tagged (e.g. by user id) to invalidate all of them at once.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires, tag, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, tag=None):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, tag, value)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            for key in self._tags.pop(tag, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def _remove(self, key):
+        _, tag, _ = self._entries.pop(key)
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+# Token name (or `('user', id)` for sessions) -> Principal, tagged by user id
+token_cache = LRUCache(
+    maxsize=getattr(settings, 'TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 300)
+)
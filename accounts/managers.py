@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import UserManager
 
+from .cache import Principal
+
 
 class CustomerManager(models.Manager):
 
@@ -11,3 +13,10 @@ class CustomerManager(models.Manager):
 class CustomUserManager(UserManager):
     def get_user_by_username(self, username: str):
         return self.get(username=username)
+
+    def get_principal(self, **filters):
+        """`Principal` of the user matching `filters`, fetched with its profiles & managed company in one query."""
+        row = self.filter(**filters).values_list(
+            'id', 'role__name', 'customer__id', 'administrator__id', 'manager__id'
+        ).first()
+        return Principal(*row) if row is not None else None
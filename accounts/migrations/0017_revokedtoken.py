@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_alter_customer_credit_card'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token_id', models.BigIntegerField()),
+                ('revoked_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -1,8 +1,8 @@
 import os
 import binascii
 
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils.text import slugify
 from django.core.validators import RegexValidator
@@ -10,6 +10,8 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.validators import UnicodeUsernameValidator
 
+from .cache import token_cache
+from .tokens import revoke_signed_tokens, revoke_user_signed_tokens
 from .managers import CustomUserManager, CustomerManager
 
 
@@ -65,6 +67,13 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Role the user was loaded with, signed tokens carry it
+        instance._loaded_role_id = instance.__dict__.get('role_id')
+        return instance
+
 
 class Customer(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="customer")
@@ -113,6 +122,17 @@ class Token(models.Model):
     def username(self):
         return self.user.username
 
+
+class RevokedToken(models.Model):
+    """Signed tokens of `token_id` issued before `revoked_at` are rejected, rows are kept for the tokens lifetime."""
+
+    token_id = models.BigIntegerField()
+    revoked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.token_id} revoked at {self.revoked_at}"
+
+
 # booking twice               | T |
 # auto generation token       | T |
 # credit card while booking   | T |
@@ -126,3 +146,47 @@ def create_token(sender, instance, created, **kwargs):
         Token.objects.create(
             user=instance
         )
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Administrator)
+@receiver(post_delete, sender=Administrator)
+def invalidate_token_cache(sender, instance, **kwargs):
+    user_id = instance.pk if sender is User else instance.user_id
+    token_cache.invalidate_tag(user_id)
+    # A concurrent request may have cached the old state before this transaction commits
+    transaction.on_commit(lambda: token_cache.invalidate_tag(user_id))
+
+
+@receiver(post_delete, sender=Token)
+def revoke_deleted_token(sender, instance, **kwargs):
+    revoke_signed_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+def revoke_regenerated_token(sender, instance, created, **kwargs):
+    # Saving an existing token is how its key is regenerated
+    if not created:
+        revoke_signed_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Administrator)
+@receiver(post_delete, sender=Administrator)
+def revoke_role_tokens(sender, instance, created=False, **kwargs):
+    # Signed tokens carry the roles of the user, they have to be signed again once a role is granted or removed
+    if created or kwargs.get('signal') is post_delete:
+        revoke_user_signed_tokens(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_role_tokens(sender, instance, created, **kwargs):
+    if not created and instance.role_id != getattr(instance, '_loaded_role_id', instance.role_id):
+        revoke_user_signed_tokens(instance.pk)
+    instance._loaded_role_id = instance.role_id
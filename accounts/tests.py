@@ -1,7 +1,10 @@
 from django.urls import reverse
+from django.utils import timezone
 from django.test import TestCase, Client
 
-from .models import User, UserRole, Customer, Administrator, Token
+from .cache import Principal
+from .models import User, UserRole, Customer, Administrator, Token, RevokedToken
+from .tokens import is_signed_token, issue_signed_token, verify_signed_token, revocations
 
 
 class BaseTest(TestCase):
@@ -18,8 +21,8 @@ class BaseTest(TestCase):
         Customer.objects.create(user=User.objects.get(username="customer"), first_name="customer_1",  last_name="customer_2",
                                 address="2end street", phone_number="1234556891", credit_card="123456784523456")
 
-        Token.objects.create(user=User.objects.get(username="admin"))
-        Token.objects.create(user=User.objects.get(username="customer"))
+        Token.objects.get_or_create(user=User.objects.get(username="admin"))
+        Token.objects.get_or_create(user=User.objects.get(username="customer"))
 
 
 class TokenTest(BaseTest):
@@ -43,3 +46,58 @@ class TokenTest(BaseTest):
                                        HTTP_ACCEPT='application/json')
         self.assertEqual(customer_response.status_code, 200)
         self.assertEqual(customer_token.name, str(customer_response.json()['token']))
+
+
+class SignedTokenTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        revocations.clear()
+
+    def signed_token(self, username: str):
+        user = User.objects.get(username=username)
+        response = Client().get(reverse('accounts:user_token'),
+                                {'username': user.username, 'password': user.password, 'signed': '1'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['token']
+
+    def test_signed_token_is_verified_without_queries(self):
+        token = self.signed_token("admin")
+        self.assertTrue(is_signed_token(token))
+
+        revocations.refresh()
+        with self.assertNumQueries(0):
+            info = verify_signed_token(token)
+        admin = User.objects.get(username="admin")
+        self.assertEqual(info, Principal(user_id=admin.id, role="admin", customer_id=None,
+                                         administrator_id=admin.administrator.id, company_id=None))
+        self.assertEqual(verify_signed_token(self.signed_token("customer")).is_customer, True)
+
+        self.assertIsNone(verify_signed_token(token[:-1] + ('A' if token[-1] != 'A' else 'B')))
+        expired = issue_signed_token(Token.objects.get(user__username="admin"), info, ttl=-1)
+        self.assertIsNone(verify_signed_token(expired))
+
+    def test_signed_token_is_revoked_with_its_token(self):
+        token = self.signed_token("admin")
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.get(user__username="admin").delete()
+        self.assertIsNone(verify_signed_token(token))
+
+        # Without the commit hook of this process, a revocation is seen on the next refresh
+        token = self.signed_token("customer")
+        self.assertIsNotNone(verify_signed_token(token))
+        Customer.objects.get(user__username="customer").delete()
+        self.assertIsNotNone(verify_signed_token(token))
+        revocations.refresh()
+        self.assertIsNone(verify_signed_token(token))
+        self.assertEqual(verify_signed_token(self.signed_token("customer")).is_customer, False)
+
+    def test_late_committed_revocations_are_seen(self):
+        token = self.signed_token("admin")
+        RevokedToken.objects.create(id=100, token_id=0, revoked_at=timezone.now())
+        revocations.refresh()
+        # A row with a lower id, committed after the last refresh
+        RevokedToken.objects.create(id=50, token_id=Token.objects.get(user__username="admin").id,
+                                    revoked_at=timezone.now())
+        revocations.refresh()
+        self.assertIsNone(verify_signed_token(token))
@@ -0,0 +1,110 @@
+import time
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+
+from .cache import Principal
+
+
+SIGNED_TOKEN_SALT = 'accounts.signed-token'
+SIGNED_TOKEN_TTL = getattr(settings, 'SIGNED_TOKEN_TTL', 60 * 60)
+REVOCATION_REFRESH = getattr(settings, 'SIGNED_TOKEN_REVOCATION_REFRESH', 5)
+REVOCATION_OVERLAP = getattr(settings, 'SIGNED_TOKEN_REVOCATION_OVERLAP', 60)
+
+
+def is_signed_token(value: str):
+    # Opaque tokens are hex strings, signed ones are `payload:signature`
+    return ':' in value
+
+
+def issue_signed_token(token, principal: Principal, ttl: int = SIGNED_TOKEN_TTL):
+    """Signs the principal of `token` (a `Token`), valid for `ttl` seconds or until the `Token` is revoked."""
+    now = time.time()
+    payload = {'p': list(principal), 't': token.pk, 'i': now, 'e': int(now + ttl)}
+    return signing.dumps(payload, salt=SIGNED_TOKEN_SALT)
+
+
+def verify_signed_token(value: str):
+    """Returns the `Principal` of a valid signed token, checked with the secret key and the revocation list only."""
+    try:
+        payload = signing.loads(value, salt=SIGNED_TOKEN_SALT)
+        principal = Principal(*payload['p'])
+        token_id, issued_at, expires_at = payload['t'], payload['i'], payload['e']
+    except (signing.BadSignature, TypeError, KeyError):
+        return None
+    if expires_at < time.time() or revocations.is_revoked(token_id, issued_at):
+        return None
+    return principal
+
+
+class RevocationList:
+    """
+    In-memory copy of the recent `RevokedToken` rows, {token id: last revocation time}. Rows are fetched at most every
+    `refresh` seconds, and rows older than the lifetime of signed tokens are dropped, so it stays small.
+    Each refresh reads the rows revoked since the previous one started minus `overlap` seconds: `revoked_at` is set
+    before the row commits, so a slow transaction (or the clock of another server) can make a row appear later than
+    its time. Rows read twice merge into the same entry.
+    """
+
+    def __init__(self, refresh: float = REVOCATION_REFRESH, ttl: float = SIGNED_TOKEN_TTL,
+                 overlap: float = REVOCATION_OVERLAP):
+        self.refresh_every = refresh
+        self.ttl = ttl
+        self.overlap = overlap
+        self.revoked = {}
+        self.watermark = None
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+
+    def add(self, token_id: int, revoked_at: float):
+        with self._lock:
+            self.revoked[token_id] = max(self.revoked.get(token_id, 0), revoked_at)
+
+    def refresh(self):
+        revoked_token = apps.get_model('accounts', 'RevokedToken')
+        now = time.time()
+        expired = now - self.ttl
+        since = expired if self.watermark is None else max(expired, self.watermark - self.overlap)
+        rows = revoked_token.objects.filter(revoked_at__gte=datetime.fromtimestamp(since, dt_timezone.utc))\
+            .values_list('token_id', 'revoked_at')
+        with self._lock:
+            for token_id, revoked_at in rows:
+                revoked_at = revoked_at.timestamp()
+                self.revoked[token_id] = max(self.revoked.get(token_id, 0), revoked_at)
+            self.revoked = {token_id: revoked_at for token_id, revoked_at in self.revoked.items()
+                            if revoked_at >= expired}
+            self.watermark = now
+            self.refreshed_at = time.monotonic()
+
+    def is_revoked(self, token_id: int, issued_at: float):
+        if self.refreshed_at is None or time.monotonic() - self.refreshed_at > self.refresh_every:
+            self.refresh()
+        return self.revoked.get(token_id, -1) >= issued_at
+
+    def clear(self):
+        with self._lock:
+            self.revoked, self.watermark, self.refreshed_at = {}, None, None
+
+
+revocations = RevocationList()
+
+
+def revoke_signed_tokens(token_id: int):
+    """Revokes the signed tokens issued so far for `token_id`, here once committed & elsewhere on the next refresh."""
+    revoked_token = apps.get_model('accounts', 'RevokedToken')
+    now = time.time()
+    revoked_token.objects.create(token_id=token_id, revoked_at=datetime.fromtimestamp(now, dt_timezone.utc))
+    # Tokens signed before the oldest rows have expired anyway
+    revoked_token.objects.filter(revoked_at__lt=datetime.fromtimestamp(now - SIGNED_TOKEN_TTL, dt_timezone.utc))\
+        .delete()
+    transaction.on_commit(lambda: revocations.add(token_id, now))
+
+
+def revoke_user_signed_tokens(user_id: int):
+    token = apps.get_model('accounts', 'Token')
+    for token_id in token.objects.filter(user_id=user_id).values_list('id', flat=True):
+        revoke_signed_tokens(token_id)
@@ -9,6 +9,7 @@ from django.contrib.messages.views import SuccessMessageMixin
 
 from .models import Token
 from .forms import RegistrationForm
+from .tokens import issue_signed_token, SIGNED_TOKEN_TTL
 
 
 User = get_user_model()
@@ -41,6 +42,11 @@ class LogOutView(SuccessMessageMixin, LogoutView):
 
 
 def get_user_token(request):
+    # `signed=1` issues a short lived token verified without a database lookup, revoked with the `Token`
     username, password = request.GET.get('username'), request.GET.get('password')
     token = get_object_or_404(Token, user__username=username, user__password=password)
-    return JsonResponse({'token': token.name})
+    if request.GET.get('signed') not in ('1', 'true'):
+        return JsonResponse({'token': token.name})
+
+    principal = User.objects.get_principal(id=token.user_id)
+    return JsonResponse({'token': issue_signed_token(token, principal), 'expires_in': SIGNED_TOKEN_TTL})
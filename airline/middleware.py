@@ -0,0 +1,206 @@
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .routers import begin_request, end_request, has_written
+
+
+logger = logging.getLogger('airline.metrics')
+
+_current_metrics = ContextVar('request_metrics', default=None)
+
+IN_PLACEHOLDERS = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def normalize_sql(sql: str):
+    # Parameters are already placeholders, only `IN (...)` lists of different lengths have to be folded
+    return IN_PLACEHOLDERS.sub('IN (...)', ' '.join(sql.split()))
+
+
+class RequestMetrics:
+    """Collects the SQL queries and the named timings of the current request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = {}
+        self.statements = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper, works whatever the value of DEBUG is
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.statements[sql] = self.statements.get(sql, 0) + 1
+
+    def repeated_statements(self, threshold: int):
+        counts = {}
+        for sql, count in self.statements.items():
+            sql = normalize_sql(sql)
+            counts[sql] = counts.get(sql, 0) + count
+        return {sql: count for sql, count in counts.items() if count > threshold}
+
+
+@contextmanager
+def measure(name: str):
+    """Adds the time spent in the block to the `name` timing of the current request, if it is sampled."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timings[name] = metrics.timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class RequestMetricsMiddleware:
+    """
+    Records SQL query count, DB time, serialization time and view time of sampled requests, emits them as
+    `Server-Timing` headers, writes them to the `airline.metrics` log and flags N+1 query patterns.
+    Under ASGI queries run in another thread than the one of the request, so only timings are recorded there.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 0.0)
+        self.threshold = getattr(settings, 'REQUEST_METRICS_N_PLUS_ONE_THRESHOLD', 10)
+        if asyncio.iscoroutinefunction(self.get_response):
+            # Mark the instance as a coroutine function, like `MiddlewareMixin` does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def sampled(self):
+        return self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record(request, response, metrics, time.perf_counter() - start, db_tracked=True)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.record(request, response, metrics, time.perf_counter() - start, db_tracked=False)
+
+    def record(self, request, response, metrics: RequestMetrics, view_time: float, db_tracked: bool):
+        timings = {'db': metrics.db_time} if db_tracked else {}
+        timings.update({**metrics.timings, 'view': view_time})
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={duration * 1000:.2f}' + (f';desc="{metrics.queries} queries"' if name == 'db' else '')
+            for name, duration in timings.items()
+        )
+
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **({'queries': metrics.queries} if db_tracked else {}),
+            **{f'{name}_ms': round(duration * 1000, 2) for name, duration in timings.items()},
+        }
+        repeated = metrics.repeated_statements(self.threshold)
+        if repeated:
+            record['repeated_queries'] = repeated
+            logger.warning(json.dumps(record), extra={'metrics': record})
+        else:
+            logger.info(json.dumps(record), extra={'metrics': record})
+        return response
+
+
+class ReadYourWritesMiddleware:
+    """
+    Keeps a client reading from the primary database for `REPLICA_PIN_SECONDS` after one of its requests wrote, with
+    a cookie for browsers and a cache entry per API token for clients without cookies.
+    """
+
+    cookie_name = 'primary_pin'
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    @staticmethod
+    def token_key(request):
+        token = request.GET.get('token') or (request.POST.get('token') if request.method == 'POST' else None)
+        return f'primary-pin:{token}' if token else None
+
+    def pin(self, response):
+        response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        token_key = self.token_key(request)
+        pinned = self.cookie_name in request.COOKIES or (token_key is not None and cache.get(token_key) is not None)
+        tokens = begin_request(pinned)
+        try:
+            response = self.get_response(request)
+            written = has_written()
+        finally:
+            end_request(tokens)
+
+        if written:
+            self.pin(response)
+            if token_key is not None:
+                cache.set(token_key, 1, self.pin_seconds)
+        return response
+
+    async def __acall__(self, request):
+        # The ORM calls of async views run in `sync_to_async` threads, which hand their context variables back
+        token_key = self.token_key(request)
+        pinned = self.cookie_name in request.COOKIES or (token_key is not None
+                                                         and await cache.aget(token_key) is not None)
+        tokens = begin_request(pinned)
+        try:
+            response = await self.get_response(request)
+            written = has_written()
+        finally:
+            end_request(tokens)
+
+        if written:
+            self.pin(response)
+            if token_key is not None:
+                await cache.aset(token_key, 1, self.pin_seconds)
+        return response
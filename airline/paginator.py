@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+ESTIMATED_COUNT_THRESHOLD = getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator of the admin changelists of big tables, an unfiltered changelist reads the row estimate of the
+    planner instead of running `COUNT(*)` over the whole table. Only PostgreSQL keeps such an estimate, other
+    databases and small tables are counted exactly.
+    """
+
+    threshold = ESTIMATED_COUNT_THRESHOLD
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate is not None and estimate >= self.threshold:
+            return estimate
+        return super().count
+
+    def estimate(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet) or queryset.query.where or queryset.query.distinct:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # A never analyzed table reports -1 (PostgreSQL 14+) or 0
+        return int(row[0]) if row and row[0] > 0 else None
@@ -0,0 +1,63 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Reads of the current request have to see the primary (a recent write of the client, or one of its own)
+_pinned = ContextVar('pinned_to_primary', default=False)
+# The current request wrote to the primary
+_written = ContextVar('written_to_primary', default=False)
+# Writes only pin the reads of a request, a management command or a thread outside requests never stays pinned
+_in_request = ContextVar('in_request', default=False)
+
+
+def begin_request(pinned: bool):
+    return _pinned.set(pinned), _written.set(False), _in_request.set(True)
+
+
+def end_request(tokens):
+    pinned_token, written_token, request_token = tokens
+    _pinned.reset(pinned_token)
+    _written.reset(written_token)
+    _in_request.reset(request_token)
+
+
+def has_written():
+    return _written.get()
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads of the `flight` & `accounts` models to `REPLICA_DATABASE` and their writes to the primary.
+    Once a request writes, its remaining reads stay on the primary, and `ReadYourWritesMiddleware` keeps the client
+    on it for `REPLICA_PIN_SECONDS` so it doesn't read a replica that hasn't caught up yet.
+    Reads inside a transaction of the primary stay on it as well. Without a replica every query goes to the primary.
+    """
+
+    route_app_labels = {'flight', 'accounts'}
+
+    def __init__(self):
+        self.replica = getattr(settings, 'REPLICA_DATABASE', None)
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels or not self.replica:
+            return None
+        if _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return self.replica
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label not in self.route_app_labels:
+            return None
+        if _in_request.get():
+            _pinned.set(True)
+            _written.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from django.contrib.messages import constants as messages
 
@@ -53,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'airline.middleware.RequestMetricsMiddleware',
+    'airline.middleware.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,6 +78,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'flight.context_processors.principal',
             ],
         },
     },
@@ -86,10 +90,69 @@ WSGI_APPLICATION = 'airline.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
+# SQLite by default, `DB_ENGINE=postgresql` switches to PostgreSQL configured by the `DB_*` environment variables
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'airline'),
+            'USER': os.environ.get('DB_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Persistent connections, reused by the requests of a worker for this many seconds (0 closes them)
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            # A transaction pooler (`DB_POOLER=pgbouncer` in `pool_mode = transaction`) can't keep server side
+            # cursors open between transactions
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_POOLER') == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Seconds a writer waits for the database lock before `database is locked`
+                'timeout': int(os.environ.get('DB_TIMEOUT', 20)),
+            },
+        }
+    }
+
+# Read replica, `DB_REPLICA_NAME` (and `DB_REPLICA_HOST`/`DB_REPLICA_PORT` for PostgreSQL) adds a `replica` alias which
+# serves the reads of `flight` & `accounts`, a client that wrote reads from the primary for `REPLICA_PIN_SECONDS`
+if os.environ.get('DB_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DB_REPLICA_NAME'],
+        'HOST': os.environ.get('DB_REPLICA_HOST', DATABASES['default'].get('HOST', '')),
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+        # Tests run against the primary only
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASE = 'replica'
+else:
+    REPLICA_DATABASE = None
+
+DATABASE_ROUTERS = ['airline.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Use a shared backend (Memcached, Redis, ...) in production, so invalidations reach every worker process
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
@@ -141,3 +204,99 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = '/'
 AUTH_USER_MODEL = "accounts.User"
+
+# API
+# Keyset pagination & streaming of the list facades
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+API_STREAM_CHUNK_SIZE = 2000
+
+# Maximum number of tickets of one group booking (`add-tickets`)
+TICKETS_BATCH_MAX_SIZE = 100
+
+# Seat holds, a seat is held for `SEAT_HOLD_TTL` seconds from the checkout page, expired holds are released by
+# `release_seat_holds` or lazily once their flight is full
+SEAT_HOLD_TTL = 10 * 60
+
+# Maximum number of flights of one bulk update (`update-flights`)
+FLIGHTS_BATCH_MAX_SIZE = 5000
+
+# Write facades called with an `Idempotency-Key` header replay their first response for this many seconds, expired
+# keys are deleted by `purge_idempotency_keys`. A request in progress holds its key for `IDEMPOTENCY_KEY_LEASE` seconds
+# at most, keep it above the request timeout of the workers
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+IDEMPOTENCY_KEY_LEASE = 60
+
+# Bulk flight schedule import (`import-flights` & `import_flights`), rows validated & inserted per chunk, at most
+# `FLIGHT_IMPORT_MAX_ERRORS` invalid rows are reported
+FLIGHT_IMPORT_CHUNK_SIZE = 1000
+FLIGHT_IMPORT_MAX_ERRORS = 1000
+
+# Streaming exports (`export/<name>` & `export_data`), rows read & encoded per chunk
+EXPORT_CHUNK_SIZE = 2000
+
+# Connection search (`itineraries`), layovers are in minutes and the in-memory flight graph is rebuilt every
+# `ITINERARY_GRAPH_TTL` seconds
+ITINERARY_MIN_LAYOVER = 45
+ITINERARY_MAX_LAYOVER = 12 * 60
+ITINERARY_GRAPH_TTL = 300
+ITINERARY_MAX_RESULTS = 50
+
+# Fare calendar (`fare-calendar`), default & maximum number of days, cached days expire after
+# `FARE_CALENDAR_TIMEOUT` seconds so seats left follow bookings
+FARE_CALENDAR_DAYS = 30
+FARE_CALENDAR_MAX_DAYS = 366
+FARE_CALENDAR_TIMEOUT = 60
+
+# Analytics (`analytics/<day|route|company>`), default & maximum number of days and the load factor percentiles
+ANALYTICS_DAYS = 30
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_PERCENTILES = (50, 90)
+
+# Archive (`archive_flights`), flights & their tickets move to the archive tables this many days after landing
+ARCHIVE_RETENTION_DAYS = 365
+
+# Admin, unfiltered changelists of tables bigger than this use the planner's row estimate (PostgreSQL only) & the
+# flight page only renders its latest tickets
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+ADMIN_TICKET_INLINE_LIMIT = 50
+
+# Route the anonymous facade to its native async views (`flight.async_views`), for ASGI deployments
+ASYNC_ANONYMOUS_FACADE = False
+
+# Versioned responses of the reference data facades (countries & airlines), invalidated by model writes
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# In-process cache of API tokens used by `auth_view`
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 300
+
+# Signed API tokens (`user-token/?signed=1`), lifetime in seconds and how often each process fetches new revocations.
+# Each fetch re-reads the last `SIGNED_TOKEN_REVOCATION_OVERLAP` seconds, keep it above the longest transaction and
+# the clock skew between servers
+SIGNED_TOKEN_TTL = 60 * 60
+SIGNED_TOKEN_REVOCATION_REFRESH = 5
+SIGNED_TOKEN_REVOCATION_OVERLAP = 60
+
+# Per request SQL & timing metrics (`Server-Timing` headers & `airline.metrics` log)
+# Fraction of requests measured, 0 turns the instrumentation off
+REQUEST_METRICS_SAMPLE_RATE = 0.0
+# Same normalized SQL run more than this number of times in one request is flagged as N+1
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = 10
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'airline.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -1,30 +1,60 @@
+from django.conf import settings
 from django.contrib import admin
+from django.forms.models import BaseInlineFormSet
 
+from airline.paginator import EstimatedCountPaginator
 from .models import Country, Company, Flight, Ticket
 
 
+TICKET_INLINE_LIMIT = getattr(settings, 'ADMIN_TICKET_INLINE_LIMIT', 50)
+
+
 class CompanyAdmin(admin.ModelAdmin):
     list_display = ('name', 'country', 'manager')
+    list_select_related = ('country', 'manager')
+
+
+class LatestTicketsFormSet(BaseInlineFormSet):
+
+    def get_queryset(self):
+        # Only the latest tickets of the flight are rendered, a popular flight has thousands of them
+        if not hasattr(self, '_queryset'):
+            queryset = super().get_queryset().select_related('customer__user').order_by('-id')
+            self._queryset = queryset[:TICKET_INLINE_LIMIT]
+        return self._queryset
 
 
 class TicketInlineAdmin(admin.TabularInline):
     model = Ticket
+    formset = LatestTicketsFormSet
     readonly_fields = ('customer', )
+    verbose_name_plural = f'Tickets (latest {TICKET_INLINE_LIMIT})'
+    extra = 0
 
 
 class FlightAdmin(admin.ModelAdmin):
     list_display = ('company', 'origin', 'destination', 'departure_time', 'landing_time', 'num_of_tickets', 'price',
                     'count_receive_rickets')
+    list_select_related = ('company', 'origin', 'destination')
     readonly_fields = ('count_receive_rickets', )
     search_fields = ('company__name', 'origin__name', 'destination__name')
     search_help_text = 'You can search by company name, origin country and destination country'
     list_per_page = 10
     list_filter = ('origin', 'destination')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     inlines = (TicketInlineAdmin, )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('company', 'origin', 'destination')
+
 
 class TicketAdmin(admin.ModelAdmin):
     list_display = ('flight', 'customer', 'status')
+    list_select_related = ('flight__origin', 'flight__destination', 'customer__user')
+    raw_id_fields = ('flight', 'customer')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(Country)
@@ -0,0 +1,84 @@
+import numpy as np
+from django.conf import settings
+
+
+ANALYTICS_PERCENTILES = tuple(getattr(settings, 'ANALYTICS_PERCENTILES', (50, 90)))
+
+# Rollup columns each grouping is keyed by
+GROUPS = {
+    'day': ('date', ),
+    'route': ('origin_id', 'destination_id'),
+    'company': ('company_id', ),
+}
+VALUE_COLUMNS = ('flights', 'seats', 'tickets', 'canceled', 'revenue')
+
+
+def ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(denominator > 0, numerator / np.maximum(denominator, 1), np.nan)
+
+
+def rounded(value, digits: int = 4):
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+def summarize(rows, group: str, percentiles=ANALYTICS_PERCENTILES):
+    """
+    Totals, load factor & cancellation rate per group of the rollup `rows` (tuples of the `group` key columns then
+    `VALUE_COLUMNS`), with the percentiles of the load factors of the rollup rows (one company & route on one day)
+    of each group and of all of them.
+    Sums are computed for every group at once with `np.bincount` over the group index of each row.
+    """
+    width = len(GROUPS[group])
+    rows = list(rows)
+    keys = [row[:width] for row in rows]
+    values = np.array([row[width:] for row in rows], dtype=float).reshape(len(rows), len(VALUE_COLUMNS))
+    flights, seats, tickets, canceled, revenue = values.T
+    booked = tickets - canceled
+
+    # Group index of every row, groups in key order
+    unique = sorted(set(keys), key=lambda key: tuple((value is None, value) for value in key))
+    index = {key: position for position, key in enumerate(unique)}
+    groups = np.array([index[key] for key in keys], dtype=np.intp)
+    totals = {name: np.bincount(groups, weights=column, minlength=len(unique))
+              for name, column in zip(VALUE_COLUMNS, values.T)}
+
+    # Daily load factors of each group, in one sort
+    load_factors = ratio(booked, seats)
+    order = np.lexsort((load_factors, groups))
+    bounds = np.searchsorted(groups[order], np.arange(len(unique) + 1))
+
+    def distribution(samples):
+        samples = samples[~np.isnan(samples)]
+        if not samples.size:
+            return {f'load_factor_p{p}': None for p in percentiles}
+        return {f'load_factor_p{p}': rounded(value) for p, value in zip(percentiles, np.percentile(samples, percentiles))}
+
+    group_load_factors = ratio(totals['tickets'] - totals['canceled'], totals['seats'])
+    cancellation_rates = ratio(totals['canceled'], totals['tickets'])
+    results = []
+    for position, key in enumerate(unique):
+        results.append({
+            **{column: (value.isoformat() if column == 'date' else value) for column, value in zip(GROUPS[group], key)},
+            'flights': int(totals['flights'][position]),
+            'seats': int(totals['seats'][position]),
+            'tickets': int(totals['tickets'][position]),
+            'canceled': int(totals['canceled'][position]),
+            'revenue': round(float(totals['revenue'][position]), 2),
+            'load_factor': rounded(group_load_factors[position]),
+            'cancellation_rate': rounded(cancellation_rates[position]),
+            **distribution(load_factors[order[bounds[position]:bounds[position + 1]]]),
+        })
+
+    summary = {
+        'flights': int(flights.sum()),
+        'seats': int(seats.sum()),
+        'tickets': int(tickets.sum()),
+        'canceled': int(canceled.sum()),
+        'revenue': round(float(revenue.sum()), 2),
+        'load_factor': rounded(ratio(booked.sum(), seats.sum())),
+        'cancellation_rate': rounded(ratio(canceled.sum(), tickets.sum())),
+        **distribution(load_factors),
+    }
+    return results, summary
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import get_object_or_404
+from django.http.response import JsonResponse, HttpResponseBadRequest
+
+from .cache import cache_response
+from .models import Flight, Company, Country
+from .views import pagination_params, page_response, serialize_model_obj, get_flight_or_archived
+
+
+# Async ORM
+# Django 4.0 has no async queryset interface yet (`aget`, `async for` come with 4.1), these helpers evaluate a query
+# in a single hop to the sync thread, which is what the 4.1 interface does under the hood.
+# - aget_object_or_404
+# - alist
+
+async def aget_object_or_404(klass, **kwargs):
+    return await sync_to_async(get_object_or_404)(klass, **kwargs)
+
+
+async def alist(queryset):
+    return await sync_to_async(list)(queryset)
+
+
+async def queryset_response(request, queryset):
+    try:
+        cursor, limit, fmt = pagination_params(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if fmt is not None:
+        # The ASGI handler of Django 4.0 iterates streaming responses synchronously inside the event loop
+        return HttpResponseBadRequest('Streaming is only available through the sync (WSGI) facade')
+    return page_response(await alist(queryset.filter(id__gt=cursor).order_by('id')[:limit + 1]), limit)
+
+
+# Anonymous Facade (async)
+# Routed instead of the sync views of `flight.views` when `ASYNC_ANONYMOUS_FACADE` is enabled
+# - get_all_flight
+# - get_flight_by_id
+# - get_flights_by_parameters
+# - get_all_airlines
+# - get_airline_by_id
+# - get_airline_by_parameters
+# - get_all_countries
+# - get_country_by_id
+
+async def get_all_flights(request):
+    return await queryset_response(request, Flight.objects.all().values())
+
+
+async def get_flight_by_id(request, flight_id):
+    obj = await sync_to_async(get_flight_or_archived)(flight_id)
+    return JsonResponse(serialize_model_obj(obj), safe=False)
+
+
+async def get_flights_by_parameters(request, origin_country_id: int, destination_country_id: int, date: str):
+    d = datetime.fromisoformat(date)
+    objects = Flight.objects.get_flights_by_parameters(int(origin_country_id), int(destination_country_id), d).values()
+    return await queryset_response(request, objects)
+
+
+@cache_response(Company)
+async def get_all_airlines(request):
+    return await queryset_response(request, Company.objects.all().values())
+
+
+@cache_response(Company)
+async def get_airline_by_id(request, airline_id: int):
+    obj = await aget_object_or_404(Company, id=airline_id)
+    return JsonResponse(serialize_model_obj(obj), safe=False)
+
+
+@cache_response(Company)
+async def get_airline_by_parameters(request, company_name: str):
+    objects = Company.objects.get_airline_by_parameters(company_name).values()
+    return await queryset_response(request, objects)
+
+
+@cache_response(Country)
+async def get_all_countries(request):
+    return await queryset_response(request, Country.objects.all().values())
+
+
+@cache_response(Country)
+async def get_country_by_id(request, country_id: int):
+    obj = await aget_object_or_404(Country, id=country_id)
+    return JsonResponse(serialize_model_obj(obj), safe=False)
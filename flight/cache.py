@@ -0,0 +1,148 @@
+import time
+import asyncio
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http.response import HttpResponse, HttpResponseNotModified
+
+
+RESPONSE_CACHE_TIMEOUT = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24)
+CACHED_HEADERS = ('X-Next-Cursor', )
+
+
+# Generation counters
+# - every cached value embeds the generations it was computed from, bumping a generation makes them unreachable
+
+def generation_key(name: str):
+    return f'generation:{name}'
+
+
+def model_generation_name(model):
+    return model._meta.label_lower
+
+
+def route_generation_name(origin_id, destination_id):
+    return f'route:{origin_id}:{destination_id}'
+
+
+def get_generations(names):
+    keys = [generation_key(name) for name in names]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # A missing (or evicted) counter restarts from a unique value, so it never matches an older one
+            cache.add(key, time.time_ns())
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(name: str):
+    key = generation_key(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_generation_on_commit(name: str):
+    bump_generation(name)
+    # A concurrent request may have cached the old state before this transaction commits
+    transaction.on_commit(lambda: bump_generation(name))
+
+
+# Response cache
+
+async def run_cache_operation(func, *args):
+    # The in-process cache does no I/O, only network backends are worth a hop to the sync thread
+    if isinstance(caches['default'], LocMemCache):
+        return func(*args)
+    return await sync_to_async(func)(*args)
+
+
+def response_cache_key(request, view_name: str, args, kwargs, generations):
+    raw = '|'.join([view_name, repr(args), repr(sorted(kwargs.items())), request.GET.urlencode(),
+                    repr(generations)])
+    return f'response:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def etag_matches(request, etag: str):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    return if_none_match is not None and (if_none_match.strip() == '*' or
+                                          etag in (tag.strip() for tag in if_none_match.split(',')))
+
+
+def cached_entry(key: str, response, timeout: int = RESPONSE_CACHE_TIMEOUT):
+    if response.status_code != 200 or response.streaming:
+        return None
+    etag = f'"{hashlib.sha1(response.content).hexdigest()}"'
+    headers = {header: response[header] for header in CACHED_HEADERS if response.has_header(header)}
+    entry = (response.content, response['Content-Type'], etag, headers)
+    cache.set(key, entry, timeout)
+    return entry
+
+
+def entry_response(request, entry):
+    content, content_type, etag, headers = entry
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type=content_type)
+    for header, value in headers.items():
+        response[header] = value
+    response['ETag'] = etag
+    return response
+
+
+def cache_response(*models):
+    """
+    Caches the serialized responses of a GET view per arguments & query string, until a `post_save`/`post_delete`
+    of one of `models` bumps its generation. Responses carry a strong `ETag`, so clients can get 304s.
+    Works for both sync and async views.
+    """
+
+    names = [model_generation_name(model) for model in models]
+
+    def lookup(request, view_name, args, kwargs):
+        key = response_cache_key(request, view_name, args, kwargs, get_generations(names))
+        return key, cache.get(key)
+
+    def decorator(view_func):
+        view_name = f'{view_func.__module__}.{view_func.__qualname__}'
+
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper_func(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view_func(request, *args, **kwargs)
+
+                key, entry = await run_cache_operation(lookup, request, view_name, args, kwargs)
+                if entry is None:
+                    response = await view_func(request, *args, **kwargs)
+                    entry = await run_cache_operation(cached_entry, key, response)
+                    if entry is None:
+                        return response
+                return entry_response(request, entry)
+
+            return async_wrapper_func
+
+        @wraps(view_func)
+        def wrapper_func(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            key, entry = lookup(request, view_name, args, kwargs)
+            if entry is None:
+                response = view_func(request, *args, **kwargs)
+                entry = cached_entry(key, response)
+                if entry is None:
+                    return response
+            return entry_response(request, entry)
+
+        return wrapper_func
+
+    return decorator
@@ -0,0 +1,8 @@
+from django.utils.functional import SimpleLazyObject
+
+from .decorators import get_principal
+
+
+def principal(request):
+    # Resolved only by the templates using it, shared with `CustomerRequired` views
+    return {'principal': SimpleLazyObject(lambda: get_principal(request))}
@@ -0,0 +1,156 @@
+import random
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import User, UserRole, Customer, Token
+from .models import Country, Company, Flight, Ticket
+from .signals import flights_created
+
+
+# Number of rows generated for `scale=1`
+SCALE_UNIT = {
+    'countries': 50,
+    'companies': 20,
+    'customers': 10000,
+    'flights': 20000,
+    'tickets': 100000,
+}
+MAX_COUNTRIES = 250
+
+
+def scaled_counts(scale: float):
+    counts = {name: max(int(count * scale), 1) for name, count in SCALE_UNIT.items()}
+    counts['countries'] = min(max(counts['countries'], 2), MAX_COUNTRIES)
+    return counts
+
+
+class DataGenerator:
+    """
+    Synthetic data for benchmarks & local load tests, rows are inserted with `bulk_create` in transactions of
+    `batch_size` rows and only ids are kept in memory, so millions of rows can be generated.
+    The same `seed` & `start_date` always produce the same dataset.
+    """
+
+    def __init__(self, seed: int = 0, batch_size: int = 1000, start_date=None, progress=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.progress = progress
+
+        start = datetime.combine(start_date or timezone.now().date(), time.min)
+        self.start = timezone.make_aware(start, dt_timezone.utc) if settings.USE_TZ else start
+
+    def report(self, label: str, done: int, total: int):
+        if self.progress is not None:
+            self.progress(label, done, total)
+
+    def batches(self, label: str, total: int):
+        done = 0
+        self.report(label, done, total)
+        while done < total:
+            size = min(self.batch_size, total - done)
+            yield done, size
+            done += size
+            self.report(label, done, total)
+
+    def token_key(self):
+        return '%040x' % self.random.getrandbits(160)
+
+    def create_users(self, prefix: str, start: int, count: int, role: UserRole):
+        users = User.objects.bulk_create(
+            [User(username=f'{prefix}_{self.seed}_{i}', password=f'{prefix}_{i}', role=role)
+             for i in range(start, start + count)],
+            batch_size=self.batch_size
+        )
+        # `bulk_create` skips the `post_save` signal which creates tokens
+        Token.objects.bulk_create([Token(user=user, name=self.token_key()) for user in users],
+                                  batch_size=self.batch_size)
+        return users
+
+    def create_countries(self, count: int):
+        ids = []
+        for start, size in self.batches('countries', count):
+            countries = Country.objects.bulk_create([Country(name=f'Country {i}') for i in range(start, start + size)])
+            ids += [country.id for country in countries]
+        return ids
+
+    def create_companies(self, count: int, country_ids):
+        role, _ = UserRole.objects.get_or_create(name='admin')
+        ids = []
+        for start, size in self.batches('companies', count):
+            with transaction.atomic():
+                managers = self.create_users('manager', start, size, role)
+                companies = Company.objects.bulk_create(
+                    [Company(name=f'Airline {start + i}', country_id=self.random.choice(country_ids), manager=manager)
+                     for i, manager in enumerate(managers)]
+                )
+            ids += [company.id for company in companies]
+        return ids
+
+    def create_customers(self, count: int):
+        role, _ = UserRole.objects.get_or_create(name='customer')
+        ids = []
+        for start, size in self.batches('customers', count):
+            with transaction.atomic():
+                users = self.create_users('customer', start, size, role)
+                customers = Customer.objects.bulk_create(
+                    [Customer(user=user, first_name=f'first_{start + i}', last_name=f'last_{start + i}',
+                              address=f'{start + i} street', phone_number=f'{self.random.randrange(10 ** 10):010d}',
+                              credit_card=f'{self.random.randrange(10 ** 16):016d}')
+                     for i, user in enumerate(users)]
+                )
+            ids += [customer.id for customer in customers]
+        return ids
+
+    def build_flight(self, company_ids, country_ids, tickets_per_flight: int):
+        origin_id, destination_id = self.random.sample(country_ids, 2)
+        departure_time = self.start + timedelta(minutes=self.random.randrange(-30 * 24 * 60, 180 * 24 * 60, 5))
+        capacity = self.random.randrange(max(tickets_per_flight, 50), max(tickets_per_flight, 50) * 2)
+        return Flight(company_id=self.random.choice(company_ids), origin_id=origin_id, destination_id=destination_id,
+                      departure_time=departure_time,
+                      landing_time=departure_time + timedelta(minutes=self.random.randrange(45, 16 * 60, 5)),
+                      price=Decimal(self.random.randrange(5000, 150000)) / 100, num_of_tickets=capacity)
+
+    def create_flights(self, count: int, company_ids, country_ids, customer_ids, tickets: int):
+        # Flights and their tickets are created batch by batch, so memory does not grow with the dataset
+        tickets_per_flight = min(-(-tickets // count) if count else 0, len(customer_ids))
+        created_tickets = 0
+
+        for _, size in self.batches('flights', count):
+            with transaction.atomic():
+                flights, sold = [], []
+                for _ in range(size):
+                    flights.append(self.build_flight(company_ids, country_ids, tickets_per_flight))
+                    sold.append(self.random.sample(customer_ids, min(tickets_per_flight, tickets - created_tickets)))
+                    created_tickets += len(sold[-1])
+                flights = Flight.objects.bulk_create(flights)
+                # `bulk_create` skips `post_save`, the search projection, itinerary graph, fare calendar & route stats
+                # rollup are kept in sync by the bulk signals instead
+                flights_created.send(sender=Flight, flight_ids=[flight.id for flight in flights])
+                Ticket.objects.bulk_create(
+                    [Ticket(flight_id=flight.id, customer_id=customer_id) for flight, buyers in zip(flights, sold)
+                     for customer_id in buyers],
+                    batch_size=self.batch_size
+                )
+                # One counter update per flight, which sends `seats_changed` for the sold seats
+                for flight, buyers in zip(flights, sold):
+                    if buyers:
+                        Flight.objects.reserve_seats(flight.id, len(buyers), flight)
+        return created_tickets
+
+    def generate(self, countries: int, companies: int, customers: int, flights: int, tickets: int):
+        country_ids = self.create_countries(max(countries, 2))
+        company_ids = self.create_companies(max(companies, 1), country_ids)
+        customer_ids = self.create_customers(customers)
+        num_tickets = self.create_flights(flights, company_ids, country_ids, customer_ids, tickets)
+        return {
+            'countries': len(country_ids),
+            'companies': len(company_ids),
+            'customers': len(customer_ids),
+            'flights': flights,
+            'tickets': num_tickets,
+        }
@@ -4,7 +4,10 @@ from functools import wraps, partial
 from django.contrib.auth.mixins import AccessMixin
 from django.http.response import HttpResponseBadRequest
 
-from accounts.models import User, Customer, Administrator, Token
+from accounts.cache import token_cache
+from accounts.models import User
+from accounts.tokens import is_signed_token, verify_signed_token
+from .idempotency import IDEMPOTENCY_HEADER, idempotent_response
 
 
 VALID_HTTP_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
@@ -25,11 +28,41 @@ def login(username, password):
     return None
 
 
-def login_with_token(token_name: str):
-    token = Token.objects.filter(name=token_name)
-    if token.exists():
-        return token.first().user
-    return None
+# Principals: one query per token or session user, none while cached
+# - resolve_token
+# - resolve_user
+# - get_principal
+
+def resolve_token(token_name: str):
+    if not token_name:
+        return None
+    if is_signed_token(token_name):
+        return verify_signed_token(token_name)
+    principal = token_cache.get(token_name)
+    if principal is None:
+        principal = User.objects.get_principal(auth_token__name=token_name)
+        if principal is None:
+            return None
+        token_cache.set(token_name, principal, tag=principal.user_id)
+    return principal
+
+
+def resolve_user(user_id: int):
+    key = ('user', user_id)
+    principal = token_cache.get(key)
+    if principal is None:
+        principal = User.objects.get_principal(id=user_id)
+        if principal is None:
+            return None
+        token_cache.set(key, principal, tag=user_id)
+    return principal
+
+
+def get_principal(request):
+    """`Principal` of the session user, resolved once per request and kept as `request.principal`."""
+    if not hasattr(request, 'principal'):
+        request.principal = resolve_user(request.user.pk) if request.user.is_authenticated else None
+    return request.principal
 
 
 def auth_view(view_func: Callable = None, method: str = None, messages: dict = None,
@@ -56,12 +89,15 @@ def auth_view(view_func: Callable = None, method: str = None, messages: dict = N
         else:
             token_name = request.GET.get('token')
 
-        user = login_with_token(token_name)
-        if user:
-            if allow_admin_only:
-                admin = Administrator.objects.filter(user=user)
-                if not admin:
-                    return HttpResponseBadRequest(messages.get('allow_admin_only'))
+        principal = resolve_token(token_name)
+        if principal:
+            if allow_admin_only and not principal.is_admin:
+                return HttpResponseBadRequest(messages.get('allow_admin_only'))
+            request.principal = principal
+            # Retries of a write carrying the same `Idempotency-Key` replay its first response
+            key = request.headers.get(IDEMPOTENCY_HEADER) if method == 'POST' else None
+            if key:
+                return idempotent_response(request, key, lambda: view_func(request, *args, **kwargs))
             return view_func(request, *args, **kwargs)
         return HttpResponseBadRequest(messages.get('invalid_info_message'))
 
@@ -70,8 +106,7 @@ def auth_view(view_func: Callable = None, method: str = None, messages: dict = N
 
 class CustomerRequired(AccessMixin):
     def dispatch(self, request, *args, **kwargs):
-        if request.user.is_authenticated:
-            customer = Customer.objects.filter(user=request.user)
-            if customer.exists():
-                return super().dispatch(request, *args, **kwargs)
+        principal = get_principal(request)
+        if principal is not None and principal.is_customer:
+            return super().dispatch(request, *args, **kwargs)
         return self.handle_no_permission()
@@ -0,0 +1,133 @@
+import io
+import csv
+import zlib
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Flight, Ticket
+from accounts.models import Customer
+
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+EXPORT_FORMATS = ('csv', 'ndjson')
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# `columns` maps the exported column names to their lookups, `scope` the lookup of the exporting company if any
+Export = namedtuple('Export', ('model', 'columns', 'scope'))
+
+EXPORTS = {
+    'flights': Export(Flight, {
+        'id': 'id',
+        'company_id': 'company_id',
+        'company': 'company__name',
+        'origin_id': 'origin_id',
+        'origin': 'origin__name',
+        'destination_id': 'destination_id',
+        'destination': 'destination__name',
+        'departure_time': 'departure_time',
+        'landing_time': 'landing_time',
+        'price': 'price',
+        'num_of_tickets': 'num_of_tickets',
+        'seats_sold': 'seats_sold',
+    }, 'company_id'),
+    'tickets': Export(Ticket, {
+        'id': 'id',
+        'flight_id': 'flight_id',
+        'customer_id': 'customer_id',
+        'status': 'status',
+        'origin': 'flight__origin__name',
+        'destination': 'flight__destination__name',
+        'departure_time': 'flight__departure_time',
+    }, 'flight__company_id'),
+    # Credit cards are never exported
+    'customers': Export(Customer, {
+        'id': 'id',
+        'user_id': 'user_id',
+        'username': 'user__username',
+        'email': 'user__email',
+        'first_name': 'first_name',
+        'last_name': 'last_name',
+        'address': 'address',
+        'phone_number': 'phone_number',
+    }, None),
+}
+
+
+def export_columns(name: str, columns=None):
+    """Validated column selection of the export `name`, every column by default."""
+    available = EXPORTS[name].columns
+    if not columns:
+        return list(available)
+    unknown = [column for column in columns if column not in available]
+    if unknown:
+        raise ValueError(f'Unknown columns ({", ".join(unknown)}), available columns are ({", ".join(available)})')
+    return list(columns)
+
+
+def export_queryset(name: str, columns, company_id: int = None):
+    export = EXPORTS[name]
+    queryset = export.model.objects.all()
+    if company_id is not None:
+        queryset = queryset.filter(**{export.scope: company_id})
+    return queryset.order_by('id').values_list(*(export.columns[column] for column in columns))
+
+
+def encode_chunk(rows, fmt: str, first: bool, columns=None, encoder=DjangoJSONEncoder()):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+    if columns is not None:
+        rows = (dict(zip(columns, row)) for row in rows)
+    rows = [encoder.encode(row) for row in rows]
+    if fmt == 'ndjson':
+        return ''.join(f'{row}\n' for row in rows)
+    return ('' if first else ',') + ','.join(rows)
+
+
+def stream_queryset(queryset, fmt: str = 'json', chunk_size: int = EXPORT_CHUNK_SIZE, columns=None):
+    """
+    Encodes the rows of `queryset` as a JSON array, NDJSON or CSV, one chunk of `chunk_size` rows at a time. Rows are
+    dicts (`values()`) or, with `columns`, tuples of a `values_list()` of those columns, which CSV requires as its
+    header.
+
+    Rows are fetched and encoded one chunk at a time, so memory stays flat whatever the table size. This relies on
+    `iterator()` streaming the result: on PostgreSQL with `DISABLE_SERVER_SIDE_CURSORS` (`DB_POOLER=pgbouncer`) there
+    is no server side cursor and the driver buffers the whole result before the first chunk, only the encoding stays
+    chunked.
+    """
+    rows, first = [], True
+
+    if fmt == 'json':
+        yield '['
+    elif fmt == 'csv':
+        yield encode_chunk([columns], fmt, first)
+    for row in queryset.iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) >= chunk_size:
+            yield encode_chunk(rows, fmt, first, columns)
+            rows, first = [], False
+    if rows:
+        yield encode_chunk(rows, fmt, first, columns)
+    if fmt == 'json':
+        yield ']'
+
+
+def gzip_chunks(chunks, level: int = 6):
+    # `wbits=31` writes the gzip header & trailer, each chunk is compressed as soon as it is encoded
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_file_name(name: str, fmt: str, gzip: bool):
+    return f'{name}.{fmt}' + ('.gz' if gzip else '')
@@ -1,7 +1,7 @@
 from django import forms
 import django_filters
 
-from .models import Ticket, Flight, TicketStatus
+from .models import Ticket, Flight, FlightSearch, TicketStatus
 
 
 class CreateTicketForm(forms.ModelForm):
@@ -16,7 +16,7 @@ class FlightFilter(django_filters.FilterSet):
     price__lt = django_filters.NumberFilter(field_name='price', lookup_expr='lt')
 
     class Meta:
-        model = Flight
+        model = FlightSearch
         fields = ('company', 'origin', 'destination', 'price', 'departure_time', 'landing_time')
 
 
@@ -0,0 +1,65 @@
+import hashlib
+
+from django.conf import settings
+from django.http.response import HttpResponse, HttpResponseBadRequest
+
+
+IDEMPOTENCY_KEY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+IDEMPOTENCY_KEY_LEASE = getattr(settings, 'IDEMPOTENCY_KEY_LEASE', 60)
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+def request_fingerprint(request):
+    """SHA-256 of the path, parameters & uploaded files of a request, without its token which may be re-issued."""
+    digest = hashlib.sha256(f'{request.method} {request.path}'.encode())
+    for params in (request.GET, request.POST):
+        for name, values in sorted(params.lists()):
+            if name != 'token':
+                digest.update(repr((name, values)).encode())
+    for name, files in sorted(request.FILES.lists()):
+        for file in files:
+            digest.update(repr((name, file.name, file.size)).encode())
+            for chunk in file.chunks():
+                digest.update(chunk)
+            file.seek(0)
+    return digest.hexdigest()
+
+
+def idempotent_response(request, key: str, view):
+    """
+    Runs `view` (a callable returning the response of `request`) once per `key` of the request user and replays its
+    response on retries of the same request. A retry while the first request runs gets `409 Conflict`, for
+    `IDEMPOTENCY_KEY_LEASE` seconds at most so a worker killed mid-request doesn't hold the key until it expires.
+    Another request with the same key gets `422 Unprocessable Entity`. Server errors & streamed responses aren't kept,
+    so they can be retried.
+    """
+    from .models import IdempotencyKey
+
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return HttpResponseBadRequest(f'{IDEMPOTENCY_HEADER} should be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters')
+    fingerprint = request_fingerprint(request)
+    record, created = IdempotencyKey.objects.begin(request.principal.user_id, key, fingerprint, IDEMPOTENCY_KEY_TTL,
+                                                   IDEMPOTENCY_KEY_LEASE)
+    if not created:
+        if record is not None and record.fingerprint != fingerprint:
+            return HttpResponse(f'{IDEMPOTENCY_HEADER} has already been used by another request', status=422)
+        if record is None or record.status_code is None:
+            return HttpResponse(f'A request with this {IDEMPOTENCY_HEADER} is in progress', status=409)
+        response = HttpResponse(bytes(record.content), status=record.status_code, content_type=record.content_type)
+        response[REPLAYED_HEADER] = 'true'
+        return response
+
+    try:
+        response = view()
+    except BaseException:
+        IdempotencyKey.objects.filter(id=record.id).delete()
+        raise
+    if response.streaming or response.status_code >= 500:
+        IdempotencyKey.objects.filter(id=record.id).delete()
+    else:
+        IdempotencyKey.objects.filter(id=record.id).update(
+            status_code=response.status_code, content=response.content,
+            content_type=response.get('Content-Type', ''), locked_until=None)
+    return response
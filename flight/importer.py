@@ -0,0 +1,152 @@
+import io
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.core.exceptions import ValidationError
+
+from .managers import aware_datetime
+from .models import Country, Flight
+from .signals import flights_created
+
+
+IMPORT_CHUNK_SIZE = getattr(settings, 'FLIGHT_IMPORT_CHUNK_SIZE', 1000)
+IMPORT_MAX_ERRORS = getattr(settings, 'FLIGHT_IMPORT_MAX_ERRORS', 1000)
+IMPORT_FORMATS = ('csv', 'ndjson')
+DEFAULT_NUM_OF_TICKETS = 10
+
+
+def read_csv(stream):
+    # Header row first, row numbers are the line numbers of the file
+    for number, row in enumerate(csv.DictReader(stream), start=2):
+        yield number, row
+
+
+def read_ndjson(stream):
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else None
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+}
+
+
+def text_stream(file):
+    """Decodes an uploaded (binary) file as UTF-8 while it is read."""
+    return io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+
+
+class ScheduleImporter:
+    """
+    Imports the flights of one company from CSV or NDJSON rows of `origin`, `destination` (country id or name),
+    `departure_time`, `landing_time` (ISO 8601), `num_of_tickets` & `price` (optional).
+    Rows are read & validated `chunk_size` at a time and the valid ones of a chunk are inserted by one `bulk_create`
+    in their own transaction. Invalid rows are skipped and reported with their row number, up to `max_errors` of them.
+    """
+
+    def __init__(self, company_id: int, chunk_size: int = IMPORT_CHUNK_SIZE, max_errors: int = IMPORT_MAX_ERRORS,
+                 dry_run: bool = False):
+        self.company_id = company_id
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.dry_run = dry_run
+        self.countries = None
+        self.price_field = Flight._meta.get_field('price')
+        self.tickets_field = Flight._meta.get_field('num_of_tickets')
+
+    def load_countries(self):
+        # Ids and case insensitive names, a name shared by several countries can only be referenced by id
+        countries = {}
+        for country_id, name in Country.objects.values_list('id', 'name'):
+            countries[str(country_id)] = country_id
+            key = name.strip().casefold()
+            countries[key] = None if key in countries else country_id
+        self.countries = countries
+
+    def country_id(self, value, field: str):
+        key = str(value).strip().casefold() if value is not None else ''
+        if not key:
+            raise ValidationError(f'{field} is required')
+        if key not in self.countries:
+            raise ValidationError(f'{field} country "{value}" does not exist')
+        if self.countries[key] is None:
+            raise ValidationError(f'{field} country "{value}" is ambiguous, use its id')
+        return self.countries[key]
+
+    @staticmethod
+    def datetime(value, field: str):
+        parsed = aware_datetime(value)
+        if parsed is None:
+            raise ValidationError(f'{field} should be an ISO 8601 date time')
+        return parsed
+
+    def build(self, row):
+        if row is None:
+            raise ValidationError('Row should be a JSON object')
+        errors = []
+
+        def clean(func, *args):
+            try:
+                return func(*args)
+            except ValidationError as e:
+                errors.extend(e.messages)
+
+        tickets = row.get('num_of_tickets')
+        price = row.get('price')
+        flight = Flight(
+            company_id=self.company_id,
+            origin_id=clean(self.country_id, row.get('origin'), 'origin'),
+            destination_id=clean(self.country_id, row.get('destination'), 'destination'),
+            departure_time=clean(self.datetime, row.get('departure_time'), 'departure_time'),
+            landing_time=clean(self.datetime, row.get('landing_time'), 'landing_time'),
+            num_of_tickets=clean(self.tickets_field.clean, tickets if tickets not in (None, '') else
+                                 DEFAULT_NUM_OF_TICKETS, None),
+            price=clean(self.price_field.clean, price, None) if price not in (None, '') else None,
+        )
+        if errors:
+            raise ValidationError(errors)
+        flight.validate_schedule()
+        return flight
+
+    def insert(self, flights):
+        if self.dry_run or not flights:
+            return len(flights)
+        with transaction.atomic():
+            flights = Flight.objects.bulk_create(flights)
+            flights_created.send(sender=Flight, flight_ids=[flight.id for flight in flights])
+        return len(flights)
+
+    def run(self, rows):
+        """Imports `rows`, an iterable of (row number, dict or None), and returns the report."""
+        if self.countries is None:
+            self.load_countries()
+        report = {'created': 0, 'failed': 0, 'errors': []}
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return report
+            flights = []
+            for number, row in chunk:
+                try:
+                    flights.append(self.build(row))
+                except ValidationError as e:
+                    report['failed'] += 1
+                    if len(report['errors']) < self.max_errors:
+                        report['errors'].append({'row': number, 'errors': e.messages})
+            report['created'] += self.insert(flights)
+
+
+def import_schedule(stream, fmt: str, company_id: int, **options):
+    """Imports the `fmt` (`csv` or `ndjson`) schedule read from the text `stream` for the company `company_id`."""
+    return ScheduleImporter(company_id, **options).run(READERS[fmt](stream))
@@ -0,0 +1,250 @@
+import heapq
+import time
+import threading
+from bisect import bisect_left, insort
+from collections import namedtuple
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+
+MIN_LAYOVER = getattr(settings, 'ITINERARY_MIN_LAYOVER', 45) * 60
+MAX_LAYOVER = getattr(settings, 'ITINERARY_MAX_LAYOVER', 12 * 60) * 60
+GRAPH_TTL = getattr(settings, 'ITINERARY_GRAPH_TTL', 300)
+MAX_STOPS = 2
+SORT_KEYS = ('duration', 'price')
+
+Leg = namedtuple('Leg', ('id', 'company_id', 'origin_id', 'destination_id', 'departure_time', 'landing_time',
+                         'price', 'seats_left', 'departure', 'landing'))
+
+
+def build_leg(row):
+    # `departure` & `landing` are epoch seconds, cheaper to compare & bisect than datetimes
+    flight_id, company_id, origin_id, destination_id, departure_time, landing_time, price, seats_left = row
+    return Leg(flight_id, company_id, origin_id, destination_id, departure_time, landing_time, price, seats_left,
+               departure_time.timestamp(), landing_time.timestamp())
+
+
+class FlightGraph:
+    """
+    Time-expanded graph of the future flights, in memory: for every country, and every (origin, destination) pair,
+    the flights leaving it sorted by departure time, so the flights of a layover window are found with a bisect.
+    It is built from the search projection, updated by signals once their transaction commits and rebuilt every
+    `ITINERARY_GRAPH_TTL` seconds, which also bounds how stale the graph of other worker processes can be.
+    """
+
+    columns = ('flight_id', 'company_id', 'origin_id', 'destination_id', 'departure_time', 'landing_time', 'price',
+               'seats_left')
+
+    def __init__(self, ttl: float = GRAPH_TTL, min_layover: float = MIN_LAYOVER, max_layover: float = MAX_LAYOVER):
+        self.ttl = ttl
+        self.min_layover = min_layover
+        self.max_layover = max_layover
+        self.built_at = None
+        self.legs = {}
+        self.departures = {}
+        self.routes = {}
+        self._lock = threading.RLock()
+        self._built = threading.Condition(self._lock)
+        self._building = False
+        self._written = None
+
+    def rows(self, **filters):
+        flight_search = apps.get_model('flight', 'FlightSearch')
+        return flight_search.objects.filter(**filters).order_by().values_list(*self.columns)
+
+    def build(self):
+        with self._lock:
+            # Flights written while the projection is read are read again once the new graph is in place
+            self._written = set()
+        legs, departures, routes = {}, {}, {}
+        for row in self.rows(departure_time__gte=timezone.now()).iterator(chunk_size=5000):
+            leg = build_leg(row)
+            legs[leg.id] = leg
+            departures.setdefault(leg.origin_id, []).append((leg.departure, leg.id))
+            routes.setdefault((leg.origin_id, leg.destination_id), []).append((leg.departure, leg.id))
+        for entries in (*departures.values(), *routes.values()):
+            entries.sort()
+        with self._lock:
+            self.legs, self.departures, self.routes = legs, departures, routes
+            self.built_at = time.monotonic()
+            written, self._written = self._written, None
+        if written:
+            self.refresh_flights(written)
+
+    def ensure_built(self):
+        """
+        Rebuilds the graph once it is older than `ttl`. One thread builds, outside the lock, while the others keep
+        searching the previous graph, only the very first build is waited for.
+        """
+        with self._lock:
+            if self.built_at is not None and time.monotonic() - self.built_at <= self.ttl:
+                return
+            if self._building:
+                if self.built_at is None:
+                    self._built.wait_for(lambda: not self._building)
+                return
+            self._building = True
+        try:
+            self.build()
+        finally:
+            with self._lock:
+                self._building = False
+                self._built.notify_all()
+
+    def clear(self):
+        with self._lock:
+            self.legs, self.departures, self.routes = {}, {}, {}
+            self.built_at = None
+
+    # Incremental updates
+
+    def _add(self, leg):
+        self.legs[leg.id] = leg
+        insort(self.departures.setdefault(leg.origin_id, []), (leg.departure, leg.id))
+        insort(self.routes.setdefault((leg.origin_id, leg.destination_id), []), (leg.departure, leg.id))
+
+    def _remove(self, flight_id: int):
+        leg = self.legs.pop(flight_id, None)
+        if leg is None:
+            return
+        for entries in (self.departures.get(leg.origin_id), self.routes.get((leg.origin_id, leg.destination_id))):
+            index = bisect_left(entries, (leg.departure, leg.id))
+            if index < len(entries) and entries[index] == (leg.departure, leg.id):
+                del entries[index]
+
+    def track_writes(self, flight_ids):
+        with self._lock:
+            if self._written is not None:
+                self._written.update(flight_ids)
+
+    def refresh_flight(self, flight_id: int):
+        self.track_writes([flight_id])
+        if self.built_at is None:
+            return
+        row = self.rows(flight_id=flight_id).first()
+        with self._lock:
+            self._remove(flight_id)
+            if row is not None and row[4] >= timezone.now():
+                self._add(build_leg(row))
+
+    def refresh_flights(self, flight_ids):
+        flight_ids = list(flight_ids)
+        self.track_writes(flight_ids)
+        if self.built_at is None:
+            return
+        rows = list(self.rows(flight_id__in=flight_ids))
+        now = timezone.now()
+        with self._lock:
+            for flight_id in flight_ids:
+                self._remove(flight_id)
+            for row in rows:
+                if row[4] >= now:
+                    self._add(build_leg(row))
+
+    def change_seats(self, flight_id: int, count: int):
+        self.track_writes([flight_id])
+        with self._lock:
+            leg = self.legs.get(flight_id)
+            if leg is not None:
+                self.legs[flight_id] = leg._replace(seats_left=leg.seats_left - count)
+
+    # Search
+
+    def window(self, entries, start: float, end: float):
+        # Bookable flights of `entries` departing in [start, end]
+        if not entries:
+            return
+        for index in range(bisect_left(entries, (start, )), len(entries)):
+            departure, flight_id = entries[index]
+            if departure > end:
+                return
+            leg = self.legs[flight_id]
+            if leg.seats_left > 0:
+                yield leg
+
+    def connections(self, origin_id: int, destination_id: int, start: float, end: float, max_stops: int):
+        for first in self.window(self.departures.get(origin_id), start, end):
+            stop = first.destination_id
+            if stop == destination_id:
+                yield first,
+                continue
+            if max_stops < 1 or stop == origin_id:
+                continue
+
+            earliest, latest = first.landing + self.min_layover, first.landing + self.max_layover
+            for second in self.window(self.routes.get((stop, destination_id)), earliest, latest):
+                yield first, second
+            if max_stops < 2:
+                continue
+            for second in self.window(self.departures.get(stop), earliest, latest):
+                if second.destination_id in (origin_id, destination_id, stop):
+                    continue
+                for third in self.window(self.routes.get((second.destination_id, destination_id)),
+                                         second.landing + self.min_layover, second.landing + self.max_layover):
+                    yield first, second, third
+
+    def search(self, origin_id: int, destination_id: int, start, end, max_stops: int = MAX_STOPS,
+               sort: str = 'duration', limit: int = 20):
+        """
+        Itineraries from `origin_id` to `destination_id` whose first flight departs in [start, end), with up to
+        `max_stops` connections respecting the layover bounds, ranked by total `duration` or `price`.
+        """
+        self.ensure_built()
+        start = max(start, timezone.now()).timestamp()
+        end = end.timestamp()
+
+        def duration(legs):
+            return legs[-1].landing - legs[0].departure
+
+        def price(legs):
+            prices = [leg.price for leg in legs]
+            # Itineraries with an unknown fare go last
+            return (None in prices, sum(price for price in prices if price is not None))
+
+        key = (lambda legs: (duration(legs), price(legs))) if sort == 'duration' else \
+            (lambda legs: (price(legs), duration(legs)))
+        with self._lock:
+            # `end` is exclusive, departures are whole seconds
+            found = heapq.nsmallest(limit, self.connections(origin_id, destination_id, start, end - 0.001, max_stops),
+                                    key=key)
+        return [serialize_itinerary(legs) for legs in found]
+
+    def stats(self):
+        with self._lock:
+            return {'flights': len(self.legs), 'countries': len(self.departures), 'routes': len(self.routes),
+                    'age': None if self.built_at is None else round(time.monotonic() - self.built_at, 3)}
+
+
+def serialize_itinerary(legs):
+    prices = [leg.price for leg in legs]
+    return {
+        'stops': len(legs) - 1,
+        'departure_time': legs[0].departure_time,
+        'landing_time': legs[-1].landing_time,
+        'duration_minutes': int(legs[-1].landing - legs[0].departure) // 60,
+        'price': None if None in prices else sum(prices, Decimal(0)),
+        'flights': [{'id': leg.id, 'company': leg.company_id, 'origin': leg.origin_id,
+                     'destination': leg.destination_id, 'departure_time': leg.departure_time,
+                     'landing_time': leg.landing_time, 'price': leg.price, 'seats_left': leg.seats_left}
+                    for leg in legs],
+    }
+
+
+flight_graph = FlightGraph()
+
+
+def refresh_flight_on_commit(flight_id: int):
+    transaction.on_commit(lambda: flight_graph.refresh_flight(flight_id))
+
+
+def refresh_flights_on_commit(flight_ids):
+    flight_ids = list(flight_ids)
+    transaction.on_commit(lambda: flight_graph.refresh_flights(flight_ids))
+
+
+def change_seats_on_commit(flight_id: int, count: int):
+    transaction.on_commit(lambda: flight_graph.change_seats(flight_id, count))
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Flight Models
+ArchivedFlight = apps.get_model("flight", "ArchivedFlight")
+
+
+class Command(BaseCommand):
+    help = 'Move the flights landed before the retention window and their tickets to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-d', '--days', default=getattr(settings, 'ARCHIVE_RETENTION_DAYS', 365), type=int,
+                            help='Number of days flights are kept after landing')
+        parser.add_argument('-b', '--batch-size', default=1000, type=int,
+                            help='Number of flights archived per transaction')
+
+    def handle(self, *args, **kwargs):
+        days = kwargs.get('days')
+        batch_size = kwargs.get('batch_size')
+        if days < 0 or batch_size < 1:
+            raise CommandError("Days can't be negative and the batch size must be positive")
+
+        landed_before = timezone.now() - timedelta(days=days)
+        self.stdout.write(f"Archiving flights landed before {landed_before:%Y-%m-%d %H:%M} ....")
+        try:
+            flights, tickets = ArchivedFlight.objects.archive(landed_before, batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(
+                f"Archiving Is Done Successfully, {flights} flight(s) & {tickets} ticket(s) archived !!"))
+        except OperationalError:
+            raise CommandError(f"Archiving Failed, try first to run migrations then migrate")
+        except Exception as e:
+            raise CommandError(f"Archiving Failed Due To: {e}")
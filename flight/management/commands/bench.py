@@ -0,0 +1,328 @@
+import json
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import connection, connections
+from django.urls import reverse, get_resolver
+from django.utils import timezone
+from django.test import Client
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment, CaptureQueriesContext
+)
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from flight.datagen import DataGenerator
+
+
+# Accounts Models
+User = apps.get_model("accounts", "User")
+Token = apps.get_model("accounts", "Token")
+UserRole = apps.get_model("accounts", "UserRole")
+Customer = apps.get_model("accounts", "Customer")
+Administrator = apps.get_model("accounts", "Administrator")
+
+# Flight Models
+Country = apps.get_model("flight", "Country")
+Company = apps.get_model("flight", "Company")
+Flight = apps.get_model("flight", "Flight")
+Ticket = apps.get_model("flight", "Ticket")
+RouteDailyStats = apps.get_model("flight", "RouteDailyStats")
+
+
+def percentile(sorted_values, p: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Endpoint:
+    """
+    A route driven by the benchmark, `prepare` is called before every request (outside of the measured time) and
+    returns the url kwargs & the request params of that request.
+    """
+
+    def __init__(self, name: str, prepare, method: str = 'GET', client: str = 'anonymous'):
+        self.name = name
+        self.prepare = prepare
+        self.method = method
+        self.client = client
+
+
+class Fixtures:
+    """Principals & objects the endpoints act on, created on top of the generated dataset."""
+
+    def __init__(self):
+        self.counter = 0
+        admin_role, _ = UserRole.objects.get_or_create(name='admin')
+        customer_role, _ = UserRole.objects.get_or_create(name='customer')
+
+        self.admin = User.objects.create(username='bench_admin', password='bench_admin123', role=admin_role)
+        Administrator.objects.create(user=self.admin, first_name='bench', last_name='admin')
+        self.admin_token = Token.objects.get(user=self.admin).name
+
+        self.customer_user = User.objects.create(username='bench_customer', password='bench_customer123',
+                                                 role=customer_role)
+        self.customer = Customer.objects.create(user=self.customer_user, first_name='bench', last_name='customer',
+                                                phone_number='1234567890', credit_card='1234567812345678')
+        self.customer_token = Token.objects.get(user=self.customer_user).name
+        self.customer_role = customer_role
+
+        self.origin, self.destination = Country.objects.order_by('id')[:2]
+        self.company = Company.objects.create(name='Bench Airline', country=self.origin, manager=self.admin)
+        self.flight = self.create_flight(num_of_tickets=10 ** 6)
+        self.batch = [self.create_flight() for _ in range(50)]
+        self.ticket = Ticket.objects.create(flight=self.create_flight(), customer=self.customer)
+
+    def next(self):
+        self.counter += 1
+        return self.counter
+
+    def create_flight(self, num_of_tickets: int = 100):
+        departure_time = timezone.now() + timedelta(days=1)
+        return Flight.objects.create(company=self.company, origin=self.origin, destination=self.destination,
+                                     departure_time=departure_time, landing_time=departure_time + timedelta(hours=3),
+                                     num_of_tickets=num_of_tickets)
+
+    def create_user(self):
+        return User.objects.create(username=f'bench_user_{self.next()}', password='bench_user123',
+                                   role=self.customer_role)
+
+    def create_customer(self):
+        return Customer.objects.create(user=self.create_user(), phone_number='1234567890',
+                                       credit_card='1234567812345678')
+
+    def schedule_file(self, rows: int = 100):
+        departure_time = self.flight.departure_time
+        lines = ['origin,destination,departure_time,landing_time,num_of_tickets']
+        lines += [f'{self.origin.id},{self.destination.id},{(departure_time + timedelta(minutes=i)).isoformat()},'
+                  f'{(departure_time + timedelta(hours=3, minutes=i)).isoformat()},100' for i in range(rows)]
+        return SimpleUploadedFile('schedule.csv', '\n'.join(lines).encode(), content_type='text/csv')
+
+
+def build_endpoints(f: Fixtures):
+    admin, customer = {'token': f.admin_token}, {'token': f.customer_token}
+    departure_date = f.flight.departure_time.date().isoformat()
+    # The generated flights depart from 30 days ago to 180 days ahead
+    today = timezone.localdate()
+    analytics_range = {'start': (today - timedelta(days=30)).isoformat(),
+                       'end': (today + timedelta(days=180)).isoformat()}
+    return [
+        # Anonymous Facade
+        Endpoint('flight:all_flights', lambda: ({}, {})),
+        Endpoint('flight:flight_by_id', lambda: ({'flight_id': f.flight.id}, {})),
+        Endpoint('flight:flight_by_parameters', lambda: ({'origin_country_id': f.origin.id,
+                                                          'destination_country_id': f.destination.id,
+                                                          'date': departure_date}, {})),
+        Endpoint('flight:itineraries', lambda: ({'origin_country_id': f.origin.id,
+                                                 'destination_country_id': f.destination.id,
+                                                 'date': departure_date}, {'max_stops': 2})),
+        Endpoint('flight:fare_calendar', lambda: ({'origin_country_id': f.origin.id,
+                                                   'destination_country_id': f.destination.id}, {})),
+        Endpoint('flight:all_airlines', lambda: ({}, {})),
+        Endpoint('flight:airline_by_id', lambda: ({'airline_id': f.company.id}, {})),
+        Endpoint('flight:airline_by_parameters', lambda: ({'company_name': 'Airline'}, {})),
+        Endpoint('flight:all_countries', lambda: ({}, {})),
+        Endpoint('flight:country_by_id', lambda: ({'country_id': f.origin.id}, {})),
+
+        # Customer Facade
+        Endpoint('flight:update_customer', lambda: ({'customer': f.customer.id}, {**customer, 'address': 'street'}),
+                 method='POST'),
+        Endpoint('flight:add_ticket', lambda: ({}, {**customer, 'flight': f.flight.id,
+                                                    'customer': f.create_customer().id}), method='POST'),
+        Endpoint('flight:add_tickets', lambda: ({}, {**admin, 'tickets': json.dumps(
+            [{'flight': f.flight.id, 'customer': f.create_customer().id} for _ in range(5)])}), method='POST'),
+        Endpoint('flight:remove_ticket', lambda: ({'ticket_id': Ticket.objects.create(
+            flight=f.create_flight(), customer=f.customer).id}, customer), method='POST'),
+        Endpoint('flight:own_tickets', lambda: ({}, customer)),
+
+        # Airline Facade
+        Endpoint('flight:own_flights', lambda: ({}, admin)),
+        Endpoint('flight:update_airline', lambda: ({'airline': f.company.id}, {**admin, 'name': 'Bench Airline'}),
+                 method='POST'),
+        Endpoint('flight:add_flight', lambda: ({}, {**admin, 'origin': f.origin.id, 'destination': f.destination.id,
+                                                    'departure_time': f.flight.departure_time.isoformat(),
+                                                    'landing_time': f.flight.landing_time.isoformat()}),
+                 method='POST'),
+        Endpoint('flight:update_flight', lambda: ({'flight': f.flight.id}, {**admin, 'num_of_tickets': 10 ** 6}),
+                 method='POST'),
+        Endpoint('flight:update_flights', lambda: ({}, {**admin, 'flights': json.dumps(
+            [{'id': flight.id, 'num_of_tickets': 100 + f.next() % 100} for flight in f.batch])}), method='POST'),
+        Endpoint('flight:remove_flight', lambda: ({'flight': f.create_flight().id}, admin), method='POST'),
+        Endpoint('flight:import_flights', lambda: ({}, {**admin, 'schedule': f.schedule_file()}), method='POST'),
+
+        # Admin Facade
+        Endpoint('flight:all_customers', lambda: ({}, admin)),
+        Endpoint('flight:add_airline', lambda: ({}, {**admin, 'name': 'New Airline', 'country': f.origin.id,
+                                                     'manager': f.create_user().username}), method='POST'),
+        Endpoint('flight:add_customer', lambda: ({}, {**admin, 'user': f.create_user().username, 'first_name': 'bench',
+                                                      'last_name': 'customer', 'address': 'street',
+                                                      'phone_number': '1234567890',
+                                                      'credit_card': '1234567812345678'}), method='POST'),
+        Endpoint('flight:add_administrator', lambda: ({}, {**admin, 'user': f.create_user().username,
+                                                           'first_name': 'bench', 'last_name': 'admin'}),
+                 method='POST'),
+        Endpoint('flight:remove_airline', lambda: ({'airline': Company.objects.create(name='Removed').id}, admin),
+                 method='POST'),
+        Endpoint('flight:remove_customer', lambda: ({'customer': f.create_customer().id}, admin), method='POST'),
+        Endpoint('flight:remove_administrator', lambda: ({'administrator': Administrator.objects.create(
+            user=f.create_user()).id}, admin), method='POST'),
+        Endpoint('flight:cache_stats', lambda: ({}, admin)),
+        Endpoint('flight:export_data', lambda: ({'name': 'flights'}, admin)),
+        Endpoint('flight:analytics', lambda: ({'group': 'route'}, {**admin, **analytics_range})),
+
+        # Views
+        Endpoint('flight:search_flight', lambda: ({}, {'origin': f.origin.id, 'destination': f.destination.id})),
+        Endpoint('flight:create_ticket', lambda: ({'pk': f.flight.id}, {}), client='customer'),
+        Endpoint('flight:update_status_ticket', lambda: ({'pk': f.ticket.id}, {}), client='customer'),
+        Endpoint('flight:list_ticket', lambda: ({}, {}), client='customer'),
+
+        # Accounts
+        Endpoint('accounts:login', lambda: ({}, {})),
+        Endpoint('accounts:logout', lambda: ({}, {})),
+        Endpoint('accounts:register', lambda: ({}, {})),
+        Endpoint('accounts:user_token', lambda: ({}, {'username': f.admin.username, 'password': f.admin.password})),
+    ]
+
+
+def route_names(*namespaces):
+    resolver = get_resolver()
+    names = []
+    for namespace in namespaces:
+        _, sub_resolver = resolver.namespace_dict[namespace]
+        names += [f'{namespace}:{pattern.name}' for pattern in sub_resolver.url_patterns if pattern.name]
+    return names
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every flight & accounts end point against a generated dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--iterations', default=50, type=int, help='Measured requests per end point')
+        parser.add_argument('-w', '--warmup', default=3, type=int, help='Unmeasured requests per end point')
+        parser.add_argument('--countries', default=50, type=int, help='Number of generated countries')
+        parser.add_argument('--companies', default=10, type=int, help='Number of generated airline companies')
+        parser.add_argument('--customers', default=500, type=int, help='Number of generated customers')
+        parser.add_argument('--flights', default=2000, type=int, help='Number of generated flights')
+        parser.add_argument('--tickets', default=5000, type=int, help='Number of generated tickets')
+        parser.add_argument('--seed', default=0, type=int, help='Seed of the generated dataset')
+        parser.add_argument('--only', nargs='*', default=None, help='Benchmark only these url names')
+        parser.add_argument('-o', '--output', default=None, type=str, help='Write the JSON report to this file')
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Reuse the test databases of a previous run (their data is flushed) instead of '
+                                 'creating them')
+
+    def measure(self, client: Client, endpoint: Endpoint, iterations: int, warmup: int):
+        for _ in range(warmup):
+            self.request(client, endpoint, *endpoint.prepare())
+
+        latencies, statuses = [], set()
+        for _ in range(iterations):
+            kwargs, params = endpoint.prepare()
+            start = time.perf_counter()
+            status = self.request(client, endpoint, kwargs, params)
+            latencies.append(time.perf_counter() - start)
+            statuses.add(status)
+
+        # Queries & memory are measured on a separate request, tracing would distort the latencies
+        kwargs, params = endpoint.prepare()
+        tracemalloc.start()
+        with ExitStack() as stack:
+            # Reads may be routed to the replica, every alias is counted
+            queries = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            self.request(client, endpoint, kwargs, params)
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencies.sort()
+        total = sum(latencies)
+        return {
+            'iterations': iterations,
+            'status_codes': sorted(statuses),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+            'requests_per_sec': round(iterations / total, 2) if total else None,
+            'queries': sum(len(captured) for captured in queries),
+            'peak_memory_kb': round(peak_memory / 1024, 1),
+        }
+
+    @staticmethod
+    def request(client: Client, endpoint: Endpoint, kwargs: dict, params: dict):
+        url = reverse(endpoint.name, kwargs=kwargs)
+        response = client.post(url, params) if endpoint.method == 'POST' else client.get(url, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def run(self, options):
+        self.stderr.write("Generating data ....")
+        generator = DataGenerator(seed=options['seed'])
+        dataset = generator.generate(countries=options['countries'], companies=options['companies'],
+                                     customers=options['customers'], flights=options['flights'],
+                                     tickets=options['tickets'])
+        # Analytics read the rollup only, timing them over an empty one would be meaningless
+        if dataset['flights'] and not RouteDailyStats.objects.exists():
+            raise CommandError('The route stats rollup of the generated flights is empty')
+        fixtures = Fixtures()
+
+        endpoints = build_endpoints(fixtures)
+        covered = {endpoint.name for endpoint in endpoints}
+        for name in route_names('flight', 'accounts'):
+            if name not in covered:
+                self.stderr.write(self.style.WARNING(f"No benchmark for {name}"))
+        if options['only']:
+            endpoints = [endpoint for endpoint in endpoints if endpoint.name in options['only']]
+
+        clients = {'anonymous': Client(), 'customer': Client()}
+        clients['customer'].force_login(fixtures.customer_user)
+
+        results = {}
+        for endpoint in endpoints:
+            self.stderr.write(f"Benchmarking {endpoint.name} ....")
+            results[endpoint.name] = self.measure(clients[endpoint.client], endpoint, options['iterations'],
+                                                  options['warmup'])
+        return {'database': connection.vendor, 'dataset': dataset, 'endpoints': results}
+
+    def handle(self, *args, **options):
+        try:
+            setup_test_environment()
+            nested = False
+        except RuntimeError:
+            # Called from the test suite, whose test environment & databases are used as they are
+            nested = True
+        old_config = None
+        try:
+            if not nested:
+                # Throwaway test databases, the replica alias mirrors the default one as in the test suite
+                old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+            if options['keepdb'] and not nested:
+                for alias in connections:
+                    if not connections[alias].settings_dict['TEST'].get('MIRROR'):
+                        call_command('flush', database=alias, interactive=False, verbosity=0)
+            report = self.run(options)
+        except Exception as e:
+            raise CommandError(f"Benchmark Failed Due To: {e}")
+        finally:
+            if old_config is not None:
+                teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+            if not nested:
+                teardown_test_environment()
+
+        for name, result in report['endpoints'].items():
+            self.stderr.write(f"{name:<36} p50 {result['p50_ms']:>9.3f}ms  p95 {result['p95_ms']:>9.3f}ms  "
+                              f"p99 {result['p99_ms']:>9.3f}ms  {result['requests_per_sec']:>9} req/s  "
+                              f"{result['queries']:>4} queries  {result['peak_memory_kb']:>9} KB")
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+            self.stderr.write(self.style.SUCCESS(f"Report has been written to {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,107 @@
+import json
+import time
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.test import AsyncRequestFactory
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.core.management.base import BaseCommand, CommandError
+
+from flight import views, async_views
+from flight.datagen import DataGenerator
+from .bench import Fixtures, percentile
+
+
+ANONYMOUS_FACADE = (
+    'get_all_flights', 'get_flight_by_id', 'get_flights_by_parameters', 'get_all_airlines',
+    'get_airline_by_id', 'get_airline_by_parameters', 'get_all_countries', 'get_country_by_id',
+)
+
+
+def view_kwargs(f: Fixtures):
+    return {
+        'get_all_flights': {},
+        'get_flight_by_id': {'flight_id': f.flight.id},
+        'get_flights_by_parameters': {'origin_country_id': f.origin.id, 'destination_country_id': f.destination.id,
+                                      'date': f.flight.departure_time.date().isoformat()},
+        'get_all_airlines': {},
+        'get_airline_by_id': {'airline_id': f.company.id},
+        'get_airline_by_parameters': {'company_name': 'Airline'},
+        'get_all_countries': {},
+        'get_country_by_id': {'country_id': f.origin.id},
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare the throughput of the sync & async anonymous facade under concurrent ASGI requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--requests', default=500, type=int, help='Requests per view & mode')
+        parser.add_argument('-c', '--concurrency', default=50, type=int, help='Requests in flight at once')
+        parser.add_argument('--flights', default=2000, type=int, help='Number of generated flights')
+        parser.add_argument('--seed', default=0, type=int, help='Seed of the generated dataset')
+        parser.add_argument('-o', '--output', default=None, type=str, help='Write the JSON report to this file')
+
+    @staticmethod
+    async def drive(view, kwargs: dict, requests: int, concurrency: int):
+        # Sync views are adapted exactly like the ASGI handler adapts them, one hop to the sync thread per request
+        handler = view if asyncio.iscoroutinefunction(view) else sync_to_async(view)
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                await handler(factory.get('/'), **kwargs)
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'requests_per_sec': round(requests / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        }
+
+    async def compare(self, fixtures: Fixtures, requests: int, concurrency: int):
+        results = {}
+        for name, kwargs in view_kwargs(fixtures).items():
+            self.stderr.write(f"Benchmarking {name} ....")
+            results[name] = {
+                'sync': await self.drive(getattr(views, name), kwargs, requests, concurrency),
+                'async': await self.drive(getattr(async_views, name), kwargs, requests, concurrency),
+            }
+        return results
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        try:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            self.stderr.write("Generating data ....")
+            DataGenerator(seed=options['seed']).generate(countries=50, companies=10, customers=100,
+                                                         flights=options['flights'], tickets=0)
+            fixtures = Fixtures()
+            results = asyncio.run(self.compare(fixtures, options['requests'], options['concurrency']))
+        except Exception as e:
+            raise CommandError(f"Benchmark Failed Due To: {e}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stderr.write(f"{name:<28} sync {result['sync']['requests_per_sec']:>9} req/s  "
+                              f"async {result['async']['requests_per_sec']:>9} req/s")
+
+        report = json.dumps({'database': connection.vendor, 'concurrency': options['concurrency'],
+                             'views': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
@@ -0,0 +1,113 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.db import connection, connections, OperationalError
+from django.utils import timezone
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.core.management.base import BaseCommand, CommandError
+
+from flight.datagen import DataGenerator
+from flight.models import Flight, Ticket
+from .bench import percentile
+
+
+class Command(BaseCommand):
+    help = 'Measure the booking throughput of the configured database under concurrent writers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-t', '--threads', default=8, type=int, help='Number of concurrent writers')
+        parser.add_argument('-n', '--bookings', default=200, type=int, help='Bookings per writer')
+        parser.add_argument('--flights', default=1, type=int,
+                            help='Number of flights the bookings are spread over, 1 makes a single hot row')
+        parser.add_argument('--seed', default=0, type=int, help='Seed of the generated dataset')
+        parser.add_argument('-o', '--output', default=None, type=str, help='Write the JSON report to this file')
+
+    @staticmethod
+    def prepare(threads: int, bookings: int, flights: int, seed: int):
+        generator = DataGenerator(seed=seed)
+        origin_id, destination_id = generator.create_countries(2)
+        customer_ids = generator.create_customers(threads * bookings)
+        departure_time = timezone.now() + timedelta(days=1)
+        flight_ids = [
+            Flight.objects.create(origin_id=origin_id, destination_id=destination_id, departure_time=departure_time,
+                                  landing_time=departure_time + timedelta(hours=3),
+                                  num_of_tickets=threads * bookings).id
+            for _ in range(flights)
+        ]
+        # Every writer books its own customers, so bookings never collide on the (flight, customer) constraint
+        return [[(flight_ids[(writer * bookings + i) % flights], customer_ids[writer * bookings + i])
+                 for i in range(bookings)] for writer in range(threads)]
+
+    @staticmethod
+    def book(items, latencies: list, errors: list):
+        try:
+            for flight_id, customer_id in items:
+                start = time.perf_counter()
+                try:
+                    Ticket.objects.create(flight_id=flight_id, customer_id=customer_id)
+                except OperationalError as e:
+                    # SQLite gives up with `database is locked` once its busy timeout is reached
+                    errors.append(str(e))
+                    continue
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connections.close_all()
+
+    def run(self, options):
+        self.stderr.write("Generating data ....")
+        work = self.prepare(options['threads'], options['bookings'], options['flights'], options['seed'])
+        latencies, errors = [], []
+        writers = [threading.Thread(target=self.book, args=(items, latencies, errors)) for items in work]
+
+        self.stderr.write("Booking ....")
+        start = time.perf_counter()
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        booked = Ticket.objects.count()
+        return {
+            'database': connection.vendor,
+            'threads': options['threads'],
+            'flights': options['flights'],
+            'booked': booked,
+            'errors': len(errors),
+            'bookings_per_sec': round(booked / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+            'seats_sold': sum(Flight.objects.values_list('seats_sold', flat=True)),
+        }
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        if connection.vendor == 'sqlite' and not old_test_name:
+            # Writers need their own connections, an in-memory test database would be shared through one cache
+            test_settings['NAME'] = os.path.join(tempfile.gettempdir(), 'airline_bench_booking.sqlite3')
+        try:
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            report = self.run(options)
+        except Exception as e:
+            raise CommandError(f"Benchmark Failed Due To: {e}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+            teardown_test_environment()
+
+        self.stderr.write(f"{report['database']}: {report['bookings_per_sec']} bookings/s, {report['booked']} booked, "
+                          f"{report['errors']} errors, p50 {report['p50_ms']}ms, p99 {report['p99_ms']}ms")
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,55 @@
+import sys
+import time
+from functools import partial
+
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+
+from flight.exporter import EXPORTS, EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_columns, export_queryset, gzip_chunks, \
+    stream_queryset
+
+
+class Command(BaseCommand):
+    help = 'Stream the flights, tickets or customers to a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('-o', '--output', default='-', help='Output file, - writes to the standard output')
+        parser.add_argument('-f', '--format', default='csv', choices=EXPORT_FORMATS)
+        parser.add_argument('--columns', default='', help='Comma separated columns (default all of them)')
+        parser.add_argument('--company', default=None, type=int, help='Only export the rows of this airline company')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('-b', '--chunk-size', default=EXPORT_CHUNK_SIZE, type=int,
+                            help='Number of rows fetched & encoded at a time')
+
+    def handle(self, *args, **kwargs):
+        name, fmt, output = kwargs['name'], kwargs['format'], kwargs['output']
+        if kwargs['company'] is not None and EXPORTS[name].scope is None:
+            raise CommandError(f"{name} can't be exported per company")
+        try:
+            columns = export_columns(name, [column for column in kwargs['columns'].split(',') if column])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        queryset = export_queryset(name, columns, kwargs['company'])
+        chunks = stream_queryset(queryset, fmt, kwargs['chunk_size'], columns)
+        if kwargs['gzip']:
+            chunks = gzip_chunks(chunks)
+        started = time.perf_counter()
+        try:
+            if output == '-':
+                write = sys.stdout.buffer.write if kwargs['gzip'] else partial(self.stdout.write, ending='')
+                for chunk in chunks:
+                    write(chunk)
+            else:
+                options = {} if kwargs['gzip'] else {'encoding': 'utf-8', 'newline': ''}
+                with open(output, 'wb' if kwargs['gzip'] else 'w', **options) as file:
+                    for chunk in chunks:
+                        file.write(chunk)
+        except OperationalError:
+            raise CommandError(f"Exporting Failed, try first to run migrations then migrate")
+        except Exception as e:
+            raise CommandError(f"Exporting Failed Due To: {e}")
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(
+                f"Exporting Is Done Successfully, {name} written to {output} in {time.perf_counter() - started:.1f}s !!"))
@@ -0,0 +1,55 @@
+import sys
+import time
+from contextlib import nullcontext
+
+from django.apps import apps
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+
+from flight.importer import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, import_schedule
+
+
+# Flight Models
+Company = apps.get_model("flight", "Company")
+
+
+class Command(BaseCommand):
+    help = 'Import the flight schedule of an airline from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Schedule file, - reads it from the standard input')
+        parser.add_argument('-c', '--company', required=True, type=int, help='Id of the airline company')
+        parser.add_argument('-f', '--format', default=None, choices=IMPORT_FORMATS,
+                            help='Format of the file (default from its extension)')
+        parser.add_argument('-b', '--chunk-size', default=IMPORT_CHUNK_SIZE, type=int,
+                            help='Number of rows validated & inserted per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the rows without inserting them')
+
+    def handle(self, *args, **kwargs):
+        path, fmt = kwargs['path'], kwargs['format'] or kwargs['path'].rpartition('.')[2].lower()
+        if fmt not in IMPORT_FORMATS:
+            raise CommandError(f"Unknown format, use --format ({', '.join(IMPORT_FORMATS)})")
+
+        self.stdout.write("Importing flights ....")
+        try:
+            if not Company.objects.filter(id=kwargs['company']).exists():
+                raise CommandError(f"Company {kwargs['company']} does not exist")
+            started = time.perf_counter()
+            stream = nullcontext(sys.stdin) if path == '-' else open(path, encoding='utf-8-sig', newline='')
+            with stream as stream:
+                report = import_schedule(stream, fmt, kwargs['company'], chunk_size=kwargs['chunk_size'],
+                                         dry_run=kwargs['dry_run'])
+            elapsed = time.perf_counter() - started
+        except OperationalError:
+            raise CommandError(f"Importing Failed, try first to run migrations then migrate")
+        except CommandError:
+            raise
+        except Exception as e:
+            raise CommandError(f"Importing Failed Due To: {e}")
+
+        for error in report['errors']:
+            self.stderr.write(f"row {error['row']}: {'; '.join(error['errors'])}")
+        verb = 'validated' if kwargs['dry_run'] else 'imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"Importing Is Done Successfully, {report['created']} flight(s) {verb} & {report['failed']} row(s) "
+            f"rejected in {elapsed:.1f}s !!"))
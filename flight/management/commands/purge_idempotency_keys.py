@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Flight Models
+IdempotencyKey = apps.get_model("flight", "IdempotencyKey")
+
+
+class Command(BaseCommand):
+    help = 'Delete the expired idempotency keys of the write facades, meant to run periodically (cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', default=10000, type=int, help='Number of keys deleted per query')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs.get('batch_size')
+
+        self.stdout.write("Purging expired idempotency keys ....")
+        try:
+            purged = IdempotencyKey.objects.purge(batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Purging Is Done Successfully, {purged} key(s) purged !!"))
+        except OperationalError:
+            raise CommandError(f"Purging Failed, try first to run migrations then migrate")
+        except Exception as e:
+            raise CommandError(f"Purging Failed Due To: {e}")
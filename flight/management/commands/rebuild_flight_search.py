@@ -0,0 +1,27 @@
+from django.apps import apps
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Flight Models
+FlightSearch = apps.get_model("flight", "FlightSearch")
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the flight search projection from the flights'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', default=1000, type=int,
+                            help='Number of flights rebuilt per transaction')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs.get('batch_size')
+
+        self.stdout.write("Rebuilding flight search ....")
+        try:
+            rebuilt = FlightSearch.objects.rebuild(batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilding Is Done Successfully, {rebuilt} flight(s) indexed !!"))
+        except OperationalError:
+            raise CommandError(f"Rebuilding Failed, try first to run migrations then migrate")
+        except Exception as e:
+            raise CommandError(f"Rebuilding Failed Due To: {e}")
@@ -0,0 +1,73 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+
+from flight.models import TicketStatus
+
+
+# Flight Models
+Flight = apps.get_model("flight", "Flight")
+Ticket = apps.get_model("flight", "Ticket")
+RouteDailyStats = apps.get_model("flight", "RouteDailyStats")
+ArchivedFlight = apps.get_model("flight", "ArchivedFlight")
+ArchivedTicket = apps.get_model("flight", "ArchivedTicket")
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily route stats rollup from the flights & tickets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', default=1000, type=int, help='Number of rows inserted per query')
+
+    @staticmethod
+    def rollup():
+        # Grouped queries over the flights & tickets, live and archived, merged by (day, company, route)
+        rows = {}
+
+        def row(key):
+            return rows.setdefault(key, dict.fromkeys(RouteDailyStats.objects.value_fields, 0))
+
+        canceled = Q(status=TicketStatus.Canceled)
+        for flight_model, ticket_model in ((Flight, Ticket), (ArchivedFlight, ArchivedTicket)):
+            flights = flight_model.objects.annotate(date=TruncDate('departure_time')).order_by()\
+                .values_list('date', 'company_id', 'origin_id', 'destination_id')\
+                .annotate(flights=Count('id'), seats=Sum('num_of_tickets'))
+            for date, company_id, origin_id, destination_id, count, seats in flights.iterator():
+                values = row((date, company_id, origin_id, destination_id))
+                values['flights'] += count
+                values['seats'] += seats
+
+            tickets = ticket_model.objects.filter(flight__isnull=False)\
+                .annotate(date=TruncDate('flight__departure_time')).order_by()\
+                .values_list('date', 'flight__company_id', 'flight__origin_id', 'flight__destination_id')\
+                .annotate(tickets=Count('id'), canceled=Count('id', filter=canceled),
+                          revenue=Sum('flight__price', filter=~canceled))
+            for date, company_id, origin_id, destination_id, count, canceled_count, revenue in tickets.iterator():
+                values = row((date, company_id, origin_id, destination_id))
+                values['tickets'] += count
+                values['canceled'] += canceled_count
+                values['revenue'] += revenue or 0
+        return rows
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs.get('batch_size')
+
+        self.stdout.write("Rebuilding route stats ....")
+        try:
+            rows = self.rollup()
+            with transaction.atomic():
+                RouteDailyStats.objects.all().delete()
+                RouteDailyStats.objects.bulk_create(
+                    [RouteDailyStats(date=date, company_id=company_id, origin_id=origin_id,
+                                     destination_id=destination_id, **values)
+                     for (date, company_id, origin_id, destination_id), values in rows.items()],
+                    batch_size=batch_size
+                )
+            self.stdout.write(self.style.SUCCESS(f"Rebuilding Is Done Successfully, {len(rows)} row(s) built !!"))
+        except OperationalError:
+            raise CommandError(f"Rebuilding Failed, try first to run migrations then migrate")
+        except Exception as e:
+            raise CommandError(f"Rebuilding Failed Due To: {e}")
@@ -0,0 +1,49 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Flight Models
+Flight = apps.get_model("flight", "Flight")
+Ticket = apps.get_model("flight", "Ticket")
+FlightSearch = apps.get_model("flight", "FlightSearch")
+SeatHold = apps.get_model("flight", "SeatHold")
+
+
+class Command(BaseCommand):
+    help = 'Fix drift between the seats sold & held counters of flights and their actual tickets & holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', default=5000, type=int,
+                            help='Number of flights checked per transaction')
+
+    @staticmethod
+    def reconcile(start: int, end: int):
+        def count(model):
+            rows = model.objects.filter(flight=OuterRef('pk')).values('flight').annotate(count=Count('pk'))
+            return Coalesce(Subquery(rows.values('count')), 0)
+
+        sold, held = count(Ticket), count(SeatHold)
+        with transaction.atomic():
+            drifted = list(Flight.objects.filter(id__gt=start, id__lte=end).annotate(sold=sold, held=held)
+                           .exclude(seats_sold=F('sold'), seats_held=F('held')).values_list('id', flat=True))
+            if drifted:
+                Flight.objects.filter(id__in=drifted).update(seats_sold=sold, seats_held=held)
+                FlightSearch.objects.refresh(drifted)
+            return len(drifted)
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs.get('batch_size')
+
+        self.stdout.write("Reconciling seats ....")
+        try:
+            last_id = Flight.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+            fixed = sum(self.reconcile(start, start + batch_size) for start in range(0, last_id, batch_size))
+            self.stdout.write(self.style.SUCCESS(f"Reconciling Is Done Successfully, {fixed} flight(s) fixed !!"))
+        except OperationalError:
+            raise CommandError(f"Reconciling Failed, try first to run migrations then migrate")
+        except Exception as e:
+            raise CommandError(f"Reconciling Failed Due To: {e}")
@@ -0,0 +1,27 @@
+from django.apps import apps
+from django.db.utils import OperationalError
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Flight Models
+SeatHold = apps.get_model("flight", "SeatHold")
+
+
+class Command(BaseCommand):
+    help = 'Release the expired seat holds, meant to run periodically (cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', default=1000, type=int,
+                            help='Number of holds released per transaction')
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs.get('batch_size')
+
+        self.stdout.write("Releasing expired seat holds ....")
+        try:
+            released = SeatHold.objects.sweep(batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f"Releasing Is Done Successfully, {released} hold(s) released !!"))
+        except OperationalError:
+            raise CommandError(f"Releasing Failed, try first to run migrations then migrate")
+        except Exception as e:
+            raise CommandError(f"Releasing Failed Due To: {e}")
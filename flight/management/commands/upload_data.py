@@ -1,10 +1,13 @@
-from datetime import timedelta
+import time
+from datetime import date, timedelta
 
 from django.apps import apps
 from django.utils import timezone
 from django.db.utils import OperationalError
 from django.core.management.base import BaseCommand, CommandError
 
+from flight.datagen import DataGenerator, scaled_counts
+
 
 # Accounts Models
 User = apps.get_model("accounts", "User")
@@ -23,6 +26,36 @@ Ticket = apps.get_model("flight", "Ticket")
 class Command(BaseCommand):
     help = 'Upload Dummy Data To The DataBase'
 
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--scale', default=None, type=float,
+                            help='Generate synthetic data instead, scale 1 is '
+                                 f'{", ".join(f"{v} {k}" for k, v in scaled_counts(1).items())}')
+        parser.add_argument('--seed', default=0, type=int, help='Seed of the generated data')
+        parser.add_argument('--start-date', default=None, type=date.fromisoformat,
+                            help='Date the generated flights are scheduled around (default today)')
+        parser.add_argument('-b', '--batch-size', default=5000, type=int,
+                            help='Number of rows inserted per transaction')
+
+    def show_progress(self, label: str, done: int, total: int):
+        if done == 0:
+            self.stage_started = time.perf_counter()
+        elapsed = time.perf_counter() - self.stage_started
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(f"\r{label:<10} {done:>10}/{total:<10} {rate:>12,.0f} rows/sec", ending='')
+        if done >= total:
+            self.stdout.write('')
+
+    def generate_data(self, scale: float, seed: int, start_date, batch_size: int):
+        counts = scaled_counts(scale)
+        generator = DataGenerator(seed=seed, batch_size=batch_size, start_date=start_date,
+                                  progress=self.show_progress)
+        started = time.perf_counter()
+        created = generator.generate(**counts)
+        elapsed = time.perf_counter() - started
+        rows = sum(created.values())
+        self.stdout.write(f"{rows} rows ({', '.join(f'{v} {k}' for k, v in created.items())}) "
+                          f"in {elapsed:.1f}s, {rows / elapsed:,.0f} rows/sec")
+
     @staticmethod
     def default_data():
         today = timezone.now()
@@ -42,8 +75,8 @@ class Command(BaseCommand):
                                 last_name="customer_2", address="2end street", phone_number="1234556891",
                                 credit_card="123456784523456")
 
-        Token.objects.create(user=User.objects.get(username="admin"))
-        Token.objects.create(user=User.objects.get(username="customer"))
+        Token.objects.get_or_create(user=User.objects.get(username="admin"))
+        Token.objects.get_or_create(user=User.objects.get(username="customer"))
 
         # Flight Data
         Country.objects.create(name="Egypt")
@@ -69,7 +102,10 @@ class Command(BaseCommand):
     def handle(self, *args, **kwargs):
         self.stdout.write("Uploading data ....")
         try:
-            self.default_data()
+            if kwargs.get('scale') is None:
+                self.default_data()
+            else:
+                self.generate_data(kwargs['scale'], kwargs['seed'], kwargs['start_date'], kwargs['batch_size'])
             self.stdout.write(self.style.SUCCESS("Uploading Is Done Successfully !!"))
         except OperationalError:
             raise CommandError(f"Creating Failed, try first to run migrations then migrate")
@@ -1,7 +1,55 @@
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import datetime, time, timedelta
 
-from django.db import models
+from django.apps import apps
+from django.conf import settings
+from django.db import models, router, transaction, IntegrityError
+from django.db.models import F, Q, Min, Count, Sum
+from django.db.models.functions import TruncDate
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.core.exceptions import ValidationError
+
+from .signals import seats_changed, holds_changed, flights_updated, flights_archived
+
+
+SEAT_HOLD_TTL = getattr(settings, 'SEAT_HOLD_TTL', 10 * 60)
+
+
+def day_range(date):
+    # Half-open [start of day, start of next day) in the current timezone, so `departure_time` stays index-friendly
+    day = date.date() if isinstance(date, datetime) else date
+    start = datetime.combine(day, time.min)
+    if settings.USE_TZ:
+        start = timezone.make_aware(start)
+    return start, start + timedelta(days=1)
+
+
+def is_id(value):
+    # JSON `true` is an `int` for Python, ids are plain integers only
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def aware_datetime(value):
+    """Parses an ISO 8601 date time, naive ones are in the current timezone. Returns None if it is not valid."""
+    try:
+        parsed = parse_datetime(str(value).strip()) if value else None
+    except ValueError:
+        # Well formed but impossible, such as February 30th
+        return None
+    if parsed is not None and settings.USE_TZ and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def delete_silently(queryset, using: str):
+    """
+    Deletes the rows of `queryset` with a single DELETE, without `pre_delete`/`post_delete` signals nor cascades, the
+    caller deletes the related rows first. `delete()` would send the signals of every row, and their receivers (seats
+    counters, route stats rollup) must not undo the history the archive keeps. This is the one use of the private
+    `QuerySet._raw_delete`, check it when upgrading Django.
+    """
+    return queryset._raw_delete(using)
 
 
 class CompanyManager(models.Manager):
@@ -19,7 +67,19 @@ class CompanyManager(models.Manager):
 class FlightManager(models.Manager):
 
     def get_flights_by_parameters(self, origin_country_id: int, destination_country_id: int, date: datetime):
-        return self.filter(origin__id=origin_country_id, destination__id=destination_country_id, departure_time__date=date)
+        start, end = day_range(date)
+        return self.filter(origin__id=origin_country_id, destination__id=destination_country_id,
+                           departure_time__gte=start, departure_time__lt=end)
+
+    def get_fare_calendar(self, origin_country_id: int, destination_country_id: int, start, end):
+        # One `GROUP BY` day over the route index, for the days in [start, end]
+        first, _ = day_range(start)
+        _, last = day_range(end)
+        return self.filter(origin__id=origin_country_id, destination__id=destination_country_id,
+                           departure_time__gte=first, departure_time__lt=last)\
+            .annotate(date=TruncDate('departure_time')).order_by('date').values('date')\
+            .annotate(min_price=Min('price'), flights=Count('id'),
+                      seats_left=Sum(F('num_of_tickets') - F('seats_sold') - F('seats_held')))
 
     def get_flights_by_airline_id(self, airline_id: int):
         return self.filter(company__id=airline_id)
@@ -41,14 +101,147 @@ class FlightManager(models.Manager):
         return self.filter(destination__id=country_id)
 
     def get_flights_by_departure_date(self, date: datetime):
-        return self.filter(departure_time__date=date)
+        start, end = day_range(date)
+        return self.filter(departure_time__gte=start, departure_time__lt=end)
 
     def get_flights_by_landing_date(self, date: datetime):
-        return self.filter(landing_time__date=date)
+        start, end = day_range(date)
+        return self.filter(landing_time__gte=start, landing_time__lt=end)
 
     def get_flights_by_customer(self, customer):
         return self.filter(flight__customer=customer)
 
+    def reserve_seats(self, flight_id: int, count: int = 1, flight=None):
+        # Conditional `UPDATE ... WHERE seats_sold + seats_held + count <= num_of_tickets`, no row is touched when the
+        # flight is full
+        updated = self.filter(id=flight_id, seats_sold__lte=F('num_of_tickets') - F('seats_held') - count)\
+            .update(seats_sold=F('seats_sold') + count)
+        if updated:
+            seats_changed.send(sender=self.model, flight_id=flight_id, count=count, flight=flight)
+        return updated == 1
+
+    def release_seats(self, flight_id: int, count: int = 1, flight=None):
+        updated = self.filter(id=flight_id, seats_sold__gte=count).update(seats_sold=F('seats_sold') - count)
+        if updated:
+            seats_changed.send(sender=self.model, flight_id=flight_id, count=-count, flight=flight)
+        return updated == 1
+
+    def hold_seats(self, flight_id: int, count: int = 1):
+        # Same conditional update as `reserve_seats`, held seats count against the capacity until sold or released
+        updated = self.filter(id=flight_id, seats_sold__lte=F('num_of_tickets') - F('seats_held') - count)\
+            .update(seats_held=F('seats_held') + count)
+        if updated:
+            holds_changed.send(sender=self.model, flight_id=flight_id, count=count)
+        return updated == 1
+
+    def release_held_seats(self, flight_id: int, count: int = 1):
+        updated = self.filter(id=flight_id, seats_held__gte=count).update(seats_held=F('seats_held') - count)
+        if updated:
+            holds_changed.send(sender=self.model, flight_id=flight_id, count=-count)
+        return updated == 1
+
+    def sell_held_seats(self, flight_id: int, count: int = 1, flight=None):
+        # The capacity is already taken by the holds, so the seats change counter without any check
+        updated = self.filter(id=flight_id, seats_held__gte=count)\
+            .update(seats_held=F('seats_held') - count, seats_sold=F('seats_sold') + count)
+        if updated:
+            holds_changed.send(sender=self.model, flight_id=flight_id, count=-count)
+            seats_changed.send(sender=self.model, flight_id=flight_id, count=count, flight=flight)
+        return updated == 1
+
+    # Fields of a flight which `update_many` can change
+    patchable_fields = ('origin', 'destination', 'departure_time', 'landing_time', 'num_of_tickets', 'price')
+
+    def update_many(self, company_id: int, changes, batch_size: int = 500):
+        """
+        Applies `changes`, a list of (flight id, {field: value}), to flights of the company `company_id` as a unit,
+        either all of them are updated or none. Flights are locked & checked with one query, validated in memory and
+        written with `bulk_update` of the changed columns only. Returns whether they were updated and a result per
+        change.
+        """
+        country_model = self.model._meta.get_field('origin').related_model
+        results = [{'id': flight_id, 'status': 'updated'} for flight_id, _ in changes]
+
+        def fail(result, errors):
+            result.update(status='error', errors=errors)
+
+        with transaction.atomic():
+            flight_ids = sorted({flight_id for flight_id, _ in changes})
+            flights = {flight.id: flight for flight in self.select_for_update().filter(id__in=flight_ids).order_by('id')}
+            country_ids = {fields[name] for _, fields in changes for name in ('origin', 'destination')
+                           if is_id(fields.get(name))}
+            countries = set(country_model.objects.filter(id__in=country_ids).values_list('id', flat=True))
+
+            changed, seen = set(), set()
+            for result, (flight_id, fields) in zip(results, changes):
+                flight = flights.get(flight_id)
+                if flight is None:
+                    fail(result, ['Flight does not exist'])
+                elif flight.company_id is None or flight.company_id != company_id:
+                    fail(result, ['Your company is not the owner of this flight'])
+                elif flight_id in seen:
+                    fail(result, ['Duplicated flight'])
+                else:
+                    seen.add(flight_id)
+                    errors = self.patch(flight, fields, countries)
+                    if errors:
+                        fail(result, errors)
+                    else:
+                        changed.update(name for name in fields if name in self.patchable_fields)
+
+            if any(result['status'] != 'updated' for result in results):
+                transaction.set_rollback(True)
+                return False, results
+
+            updated = [flights[flight_id] for flight_id in flight_ids]
+            if changed:
+                # `created` is the `auto_now` field, which `bulk_update` doesn't set by itself
+                now = timezone.now()
+                for flight in updated:
+                    flight.created = now
+                fields = [self.model._meta.get_field(name).attname for name in self.patchable_fields
+                          if name in changed]
+                self.bulk_update(updated, fields + ['created'], batch_size=batch_size)
+                flights_updated.send(sender=self.model, flights=updated)
+        return True, results
+
+    def patch(self, flight, fields, countries):
+        """Sets `fields` on `flight` in memory and returns the validation errors, if any."""
+        errors = []
+        for name, value in fields.items():
+            if name not in self.patchable_fields:
+                errors.append(f'{name} can not be updated')
+            elif name in ('origin', 'destination'):
+                if not is_id(value) or value not in countries:
+                    errors.append(f'{name} country does not exist')
+                else:
+                    setattr(flight, f'{name}_id', value)
+            elif name in ('departure_time', 'landing_time'):
+                parsed = aware_datetime(value)
+                if parsed is None:
+                    errors.append(f'{name} should be an ISO 8601 date time')
+                else:
+                    setattr(flight, name, parsed)
+            else:
+                try:
+                    value = self.model._meta.get_field(name).clean(value, flight) if value is not None else None
+                except ValidationError as e:
+                    errors.extend(f'{name}: {message}' for message in e.messages)
+                else:
+                    if value is None and name == 'num_of_tickets':
+                        errors.append(f'{name} is required')
+                    else:
+                        setattr(flight, name, value)
+        if errors:
+            return errors
+        try:
+            flight.validate_schedule()
+        except ValidationError as e:
+            return e.messages
+        if flight.num_of_tickets < flight.seats_sold + flight.seats_held:
+            return ['Number of tickets cant be less than the tickets sold & held']
+        return []
+
     def available(self):
         data = timezone.now()
         return self.filter(departure_time__gte=data)
@@ -58,3 +251,304 @@ class TicketsManager(models.Manager):
 
     def get_tickets_by_customer(self, customer_id: int):
         return self.filter(customer__id=customer_id)
+
+    def book_many(self, items):
+        """
+        Books a ticket for every (flight id, customer id) pair of `items` as a unit, either all of them are booked or
+        none. Returns whether they were booked and a result per item.
+        """
+        flight_model = self.model._meta.get_field('flight').related_model
+        customer_model = self.model._meta.get_field('customer').related_model
+        results = [{'flight': flight_id, 'customer': customer_id, 'status': 'booked'} for flight_id, customer_id in items]
+
+        def fail(result, error):
+            result.update(status='error', error=error)
+
+        with transaction.atomic():
+            flight_ids = sorted({flight_id for flight_id, _ in items})
+            # Flights are locked in id order, so concurrent group bookings can't deadlock each other
+            flights = {flight.id: flight for flight in flight_model.objects.select_for_update()
+                       .filter(id__in=flight_ids).order_by('id').only(*flight_model.stats_fields)}
+            customers = set(customer_model.objects.filter(id__in={customer_id for _, customer_id in items})
+                            .values_list('id', flat=True))
+            booked = set(self.filter(flight_id__in=list(flights), customer_id__in=customers)
+                         .values_list('flight_id', 'customer_id'))
+
+            needed, seen = Counter(), set()
+            for result, item in zip(results, items):
+                flight_id, customer_id = item
+                if flight_id not in flights:
+                    fail(result, 'Flight does not exist')
+                elif customer_id not in customers:
+                    fail(result, 'Customer does not exist')
+                elif item in booked:
+                    fail(result, 'Customer has already booked this flight')
+                elif item in seen:
+                    fail(result, 'Duplicated ticket')
+                else:
+                    seen.add(item)
+                    needed[flight_id] += 1
+
+            # Seats the customers held on the checkout page are sold first, then the capacity of every flight is
+            # checked & taken with one conditional update per flight
+            hold_model = flight_model._meta.get_field('holds').related_model
+            held = hold_model.objects.convert_many(seen, flights)
+            for flight_id in sorted(needed):
+                missing = needed[flight_id] - held[flight_id]
+                if missing and not flight_model.objects.reserve_seats(flight_id, missing, flights[flight_id]):
+                    for result in results:
+                        if result['flight'] == flight_id and result['status'] == 'booked':
+                            fail(result, 'Max number of tickets has been reached')
+
+            if all(result['status'] == 'booked' for result in results):
+                try:
+                    tickets = self.bulk_create([self.model(flight_id=flight_id, customer_id=customer_id)
+                                                for flight_id, customer_id in items])
+                except IntegrityError:
+                    # Another request booked one of these tickets in the meantime
+                    transaction.set_rollback(True)
+                    for result in results:
+                        fail(result, 'Customer has already booked this flight')
+                    return False, results
+                for result, ticket in zip(results, tickets):
+                    result['ticket'] = ticket.id
+                return True, results
+
+            transaction.set_rollback(True)
+            for result in results:
+                if result['status'] == 'booked':
+                    result.update(status='not_booked', error='Another ticket of the group could not be booked')
+            return False, results
+
+
+class SeatHoldManager(models.Manager):
+
+    def take(self, flight_id: int, customer_id: int, ttl: int = SEAT_HOLD_TTL):
+        """
+        Holds a seat of the flight for the customer during `ttl` seconds, or extends the hold they already have.
+        Returns when the hold expires, or None if the flight is full.
+        """
+        flight_model = self.model._meta.get_field('flight').related_model
+        expires_at = timezone.now() + timedelta(seconds=ttl)
+        with transaction.atomic():
+            if self.filter(flight_id=flight_id, customer_id=customer_id).update(expires_at=expires_at):
+                return expires_at
+            if not flight_model.objects.hold_seats(flight_id):
+                # Expired holds of a full flight are released lazily, before anyone is turned away
+                if not self.sweep(flight_id=flight_id) or not flight_model.objects.hold_seats(flight_id):
+                    return None
+            try:
+                with transaction.atomic():
+                    self.create(flight_id=flight_id, customer_id=customer_id, expires_at=expires_at)
+            except IntegrityError:
+                # Taken by another request of the customer in the meantime
+                flight_model.objects.release_held_seats(flight_id)
+                self.filter(flight_id=flight_id, customer_id=customer_id).update(expires_at=expires_at)
+            return expires_at
+
+    def convert(self, flight_id: int, customer_id: int, flight=None):
+        """Sells the seat the customer holds on the flight, returns False if they hold none."""
+        flight_model = self.model._meta.get_field('flight').related_model
+        # An expired hold which isn't released yet still has its seat
+        with transaction.atomic():
+            deleted, _ = self.filter(flight_id=flight_id, customer_id=customer_id).delete()
+            return bool(deleted) and flight_model.objects.sell_held_seats(flight_id, flight=flight)
+
+    def convert_many(self, items, flights=None):
+        """
+        Sells the seats held for the (flight id, customer id) pairs of `items`, returns their number per flight.
+        `flights` are the loaded flights by id, if any.
+        """
+        flights = flights or {}
+        flight_model = self.model._meta.get_field('flight').related_model
+        items = set(items)
+        holds = [(hold_id, flight_id) for hold_id, flight_id, customer_id in self.filter(
+            flight_id__in={flight_id for flight_id, _ in items}, customer_id__in={customer_id for _, customer_id in items}
+        ).values_list('id', 'flight_id', 'customer_id') if (flight_id, customer_id) in items]
+        held = Counter()
+        if holds:
+            self.filter(id__in=[hold_id for hold_id, _ in holds]).delete()
+            held.update(flight_id for _, flight_id in holds)
+            for flight_id in sorted(held):
+                flight_model.objects.sell_held_seats(flight_id, held[flight_id], flights.get(flight_id))
+        return held
+
+    def release(self, batch_size: int = 1000, **filters):
+        """
+        Releases the holds matching `filters`, `batch_size` per transaction with one update per flight, and returns
+        their number.
+        """
+        flight_model = self.model._meta.get_field('flight').related_model
+        released = 0
+        while True:
+            with transaction.atomic():
+                # Locked so a hold converted concurrently is either sold or released, never both
+                holds = list(self.select_for_update().filter(**filters).order_by('expires_at')
+                             .values_list('id', 'flight_id')[:batch_size])
+                if not holds:
+                    return released
+                self.filter(id__in=[hold_id for hold_id, _ in holds]).delete()
+                held = Counter(flight_id for _, flight_id in holds)
+                for flight_id in sorted(held):
+                    flight_model.objects.release_held_seats(flight_id, held[flight_id])
+            released += len(holds)
+
+    def sweep(self, flight_id: int = None, batch_size: int = 1000):
+        """Releases the expired holds, of one flight or of all of them."""
+        filters = {'expires_at__lte': timezone.now()}
+        if flight_id is not None:
+            filters['flight_id'] = flight_id
+        return self.release(batch_size=batch_size, **filters)
+
+
+class FlightSearchManager(models.Manager):
+
+    def build(self, flight):
+        return self.model(
+            flight_id=flight.id, company_id=flight.company_id, origin_id=flight.origin_id,
+            destination_id=flight.destination_id,
+            company_name=flight.company.name if flight.company_id else '',
+            origin_name=flight.origin.name if flight.origin_id else '',
+            destination_name=flight.destination.name if flight.destination_id else '',
+            departure_time=flight.departure_time, landing_time=flight.landing_time, price=flight.price,
+            seats_left=flight.num_of_tickets - flight.seats_sold - flight.seats_held,
+        )
+
+    def flights(self, flight_ids):
+        flight_model = self.model._meta.get_field('flight').related_model
+        return flight_model.objects.select_related('company', 'origin', 'destination').filter(id__in=flight_ids)
+
+    def refresh(self, flight_ids):
+        """Rebuilds the rows of `flight_ids` from their flights, one delete & one insert whatever their number."""
+        flight_ids = list(flight_ids)
+        with transaction.atomic():
+            self.filter(flight_id__in=flight_ids).delete()
+            return len(self.bulk_create([self.build(flight) for flight in self.flights(flight_ids)]))
+
+    def rebuild(self, batch_size: int = 1000):
+        flight_model = self.model._meta.get_field('flight').related_model
+        self.all().delete()
+        rebuilt = 0
+        last_id = 0
+        while True:
+            flight_ids = list(flight_model.objects.filter(id__gt=last_id).order_by('id')
+                              .values_list('id', flat=True)[:batch_size])
+            if not flight_ids:
+                return rebuilt
+            rebuilt += self.refresh(flight_ids)
+            last_id = flight_ids[-1]
+
+
+class RouteDailyStatsManager(models.Manager):
+
+    key_fields = ('date', 'company_id', 'origin_id', 'destination_id')
+    value_fields = ('flights', 'seats', 'tickets', 'canceled', 'revenue')
+
+    def add(self, date, company_id, origin_id, destination_id, **deltas):
+        """Adds `deltas` to the counters of one (day, company, route) row, created on its first change."""
+        deltas = {name: value for name, value in deltas.items() if value}
+        if not deltas:
+            return
+        key = {'date': date, 'company_id': company_id, 'origin_id': origin_id, 'destination_id': destination_id}
+        changes = {name: F(name) + value for name, value in deltas.items()}
+        if self.filter(**key).update(**changes):
+            return
+        try:
+            with transaction.atomic():
+                self.create(**key, **deltas)
+        except IntegrityError:
+            # Created by a concurrent transaction in the meantime
+            self.filter(**key).update(**changes)
+
+    def reassign(self, replacement: dict, **filters):
+        """Moves the rows matching `filters` to the key updated with `replacement`, merged with the rows there."""
+        for row in list(self.filter(**filters).values(*self.key_fields, *self.value_fields)):
+            self.add(**{**row, **replacement})
+        self.filter(**filters).delete()
+
+
+class ArchivedFlightManager(models.Manager):
+
+    flight_fields = ('id', 'company_id', 'origin_id', 'destination_id', 'departure_time', 'landing_time', 'price',
+                     'num_of_tickets', 'seats_sold', 'created', 'modified')
+
+    def archive(self, landed_before, batch_size: int = 1000):
+        """
+        Moves the flights landed before `landed_before` and their tickets to the archive, `batch_size` flights per
+        transaction, and returns the number of flights & tickets moved.
+        """
+        flight_model = apps.get_model('flight', 'Flight')
+        flights = tickets = 0
+        last_id = 0
+        while True:
+            flight_ids = list(flight_model.objects.filter(id__gt=last_id, landing_time__lt=landed_before)
+                              .order_by('id').values_list('id', flat=True)[:batch_size])
+            if not flight_ids:
+                return flights, tickets
+            archived_flights, archived_tickets = self.archive_batch(flight_ids, landed_before)
+            flights += archived_flights
+            tickets += archived_tickets
+            last_id = flight_ids[-1]
+
+    def archive_batch(self, flight_ids, landed_before):
+        flight_model = apps.get_model('flight', 'Flight')
+        ticket_model = apps.get_model('flight', 'Ticket')
+        search_model = apps.get_model('flight', 'FlightSearch')
+        hold_model = apps.get_model('flight', 'SeatHold')
+        ticket_archive = self.model._meta.get_field('tickets').related_model
+        using = router.db_for_write(flight_model)
+        with transaction.atomic(using=using):
+            # Locked so a concurrent booking either lands before the copy or fails to reserve its seat afterwards
+            flights = list(flight_model.objects.select_for_update()
+                           .filter(id__in=flight_ids, landing_time__lt=landed_before)
+                           .order_by('id').only(*self.flight_fields))
+            if not flights:
+                return 0, 0
+            flight_ids = [flight.id for flight in flights]
+            now = timezone.now()
+            self.bulk_create([
+                self.model(archived_at=now, **{name: getattr(flight, name) for name in self.flight_fields})
+                for flight in flights
+            ])
+            tickets = ticket_model.objects.filter(flight_id__in=flight_ids)
+            archived = ticket_archive.objects.bulk_create([ticket_archive(**ticket) for ticket in tickets.values(
+                'id', 'flight_id', 'customer_id', 'status')])
+            delete_silently(tickets, using)
+            delete_silently(search_model.objects.filter(flight_id__in=flight_ids), using)
+            delete_silently(hold_model.objects.filter(flight_id__in=flight_ids), using)
+            delete_silently(flight_model.objects.filter(id__in=flight_ids), using)
+            flights_archived.send(sender=flight_model, flights=flights)
+        return len(flights), len(archived)
+
+
+class IdempotencyKeyManager(models.Manager):
+
+    def begin(self, user_id: int, key: str, fingerprint: str, ttl: int, lease: int):
+        """
+        Claims `key` for a request of the user, returns (the new record, True), or (the existing record, False) when the
+        key is taken. An expired key, or a claim still in progress after `lease` seconds (its worker died), is claimed
+        again. The record may be None if it was released in the meantime.
+        """
+        now = timezone.now()
+        stale = Q(expires_at__lte=now) | Q(status_code__isnull=True, locked_until__lte=now)
+        for _ in range(2):
+            try:
+                with transaction.atomic():
+                    return self.create(user_id=user_id, key=key, fingerprint=fingerprint,
+                                       locked_until=now + timedelta(seconds=lease),
+                                       expires_at=now + timedelta(seconds=ttl)), True
+            except IntegrityError:
+                # One insert is all a new key costs, a stale one is deleted only once it is found taken
+                if not self.filter(stale, user_id=user_id, key=key).delete()[0]:
+                    return self.filter(user_id=user_id, key=key).first(), False
+        return self.filter(user_id=user_id, key=key).first(), False
+
+    def purge(self, batch_size: int = 10000):
+        """Deletes the expired keys, `batch_size` per query, and returns their number."""
+        now = timezone.now()
+        purged = 0
+        while True:
+            ids = list(self.filter(expires_at__lte=now).order_by('expires_at').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return purged
+            purged += self.filter(id__in=ids).delete()[0]
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:07
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_seats_sold(apps, schema_editor):
+    Flight = apps.get_model('flight', 'Flight')
+    Ticket = apps.get_model('flight', 'Ticket')
+    sold = Ticket.objects.filter(flight=OuterRef('pk')).values('flight').annotate(count=Count('pk')).values('count')
+    Flight.objects.update(seats_sold=Coalesce(Subquery(sold), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flight', '0005_alter_ticket_customer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='seats_sold',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_seats_sold, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flight', '0006_flight_seats_sold'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['origin', 'destination', 'departure_time'], name='flight_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['company', 'departure_time'], name='flight_company_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_flight_search(apps, schema_editor):
+    Flight = apps.get_model('flight', 'Flight')
+    FlightSearch = apps.get_model('flight', 'FlightSearch')
+    rows = []
+    for flight in Flight.objects.select_related('company', 'origin', 'destination').iterator(chunk_size=2000):
+        rows.append(FlightSearch(
+            flight_id=flight.id, company_id=flight.company_id, origin_id=flight.origin_id,
+            destination_id=flight.destination_id,
+            company_name=flight.company.name if flight.company_id else '',
+            origin_name=flight.origin.name if flight.origin_id else '',
+            destination_name=flight.destination.name if flight.destination_id else '',
+            departure_time=flight.departure_time, landing_time=flight.landing_time, price=flight.price,
+            seats_left=flight.num_of_tickets - flight.seats_sold,
+        ))
+        if len(rows) == 2000:
+            FlightSearch.objects.bulk_create(rows)
+            rows = []
+    FlightSearch.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flight', '0007_flight_route_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightSearch',
+            fields=[
+                ('flight', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search', serialize=False, to='flight.flight')),
+                ('company_name', models.CharField(blank=True, max_length=200)),
+                ('origin_name', models.CharField(blank=True, max_length=50)),
+                ('destination_name', models.CharField(blank=True, max_length=50)),
+                ('departure_time', models.DateTimeField()),
+                ('landing_time', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('seats_left', models.IntegerField()),
+                ('company', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.company')),
+                ('destination', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.country')),
+                ('origin', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.country')),
+            ],
+            options={
+                'verbose_name': 'Flights Search',
+                'verbose_name_plural': 'Flights Search',
+                'ordering': ('departure_time', 'flight'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='flightsearch',
+            index=models.Index(fields=['departure_time', 'flight'], name='search_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flightsearch',
+            index=models.Index(fields=['origin', 'destination', 'departure_time'], name='search_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flightsearch',
+            index=models.Index(fields=['company', 'departure_time'], name='search_company_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flightsearch',
+            index=models.Index(fields=['price'], name='search_price_idx'),
+        ),
+        migrations.RunPython(backfill_flight_search, migrations.RunPython.noop),
+    ]
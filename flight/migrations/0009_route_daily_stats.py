@@ -0,0 +1,82 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:35
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_route_daily_stats(apps, schema_editor):
+    Flight = apps.get_model('flight', 'Flight')
+    Ticket = apps.get_model('flight', 'Ticket')
+    RouteDailyStats = apps.get_model('flight', 'RouteDailyStats')
+    rows = {}
+
+    def row(key):
+        return rows.setdefault(key, {'flights': 0, 'seats': 0, 'tickets': 0, 'canceled': 0, 'revenue': 0})
+
+    flights = Flight.objects.annotate(date=TruncDate('departure_time')).order_by()\
+        .values_list('date', 'company_id', 'origin_id', 'destination_id')\
+        .annotate(flights=Count('id'), seats=Sum('num_of_tickets'))
+    for *key, count, seats in flights:
+        row(tuple(key)).update(flights=count, seats=seats)
+
+    canceled = Q(status='Canceled')
+    tickets = Ticket.objects.filter(flight__isnull=False).annotate(date=TruncDate('flight__departure_time'))\
+        .order_by().values_list('date', 'flight__company_id', 'flight__origin_id', 'flight__destination_id')\
+        .annotate(tickets=Count('id'), canceled=Count('id', filter=canceled),
+                  revenue=Sum('flight__price', filter=~canceled))
+    for *key, count, canceled_count, revenue in tickets:
+        row(tuple(key)).update(tickets=count, canceled=canceled_count, revenue=revenue or 0)
+
+    RouteDailyStats.objects.bulk_create(
+        [RouteDailyStats(date=date, company_id=company_id, origin_id=origin_id, destination_id=destination_id, **values)
+         for (date, company_id, origin_id, destination_id), values in rows.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flight', '0008_flight_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RouteDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('flights', models.IntegerField(default=0)),
+                ('seats', models.IntegerField(default=0)),
+                ('tickets', models.IntegerField(default=0)),
+                ('canceled', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('company', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.company')),
+                ('destination', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.country')),
+                ('origin', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.country')),
+            ],
+            options={
+                'verbose_name': 'Route Daily Stats',
+                'verbose_name_plural': 'Route Daily Stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='routedailystats',
+            index=models.Index(fields=['date'], name='stats_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routedailystats',
+            index=models.Index(fields=['company', 'date'], name='stats_company_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='routedailystats',
+            index=models.Index(fields=['origin', 'destination', 'date'], name='stats_route_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='routedailystats',
+            constraint=models.UniqueConstraint(fields=('date', 'company', 'origin', 'destination'), name='stats_unique_key'),
+        ),
+        migrations.RunPython(backfill_route_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_revokedtoken'),
+        ('flight', '0009_route_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedFlight',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('departure_time', models.DateTimeField()),
+                ('landing_time', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, null=True)),
+                ('num_of_tickets', models.PositiveIntegerField()),
+                ('seats_sold', models.PositiveIntegerField(default=0, editable=False)),
+                ('created', models.DateTimeField(editable=False)),
+                ('modified', models.DateTimeField(editable=False)),
+                ('archived_at', models.DateTimeField(editable=False)),
+                ('company', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.company')),
+                ('destination', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.country')),
+                ('origin', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='flight.country')),
+            ],
+            options={
+                'verbose_name': 'Archived Flights',
+                'verbose_name_plural': 'Archived Flights',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTicket',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('Booked', 'Booked'), ('Canceled', 'Canceled')], default='Booked', max_length=50)),
+                ('customer', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.customer')),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tickets', to='flight.archivedflight')),
+            ],
+            options={
+                'verbose_name': 'Archived Tickets',
+                'verbose_name_plural': 'Archived Tickets',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedticket',
+            index=models.Index(fields=['customer'], name='archive_ticket_customer_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedflight',
+            index=models.Index(fields=['company', 'departure_time'], name='archive_company_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedflight',
+            index=models.Index(fields=['origin', 'destination', 'departure_time'], name='archive_route_departure_idx'),
+        ),
+    ]
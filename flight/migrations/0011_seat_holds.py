@@ -0,0 +1,41 @@
+# Generated by Django 4.0.4 on 2026-10-18 04:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_revokedtoken'),
+        ('flight', '0010_flight_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='seats_held',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='SeatHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expires_at', models.DateTimeField()),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='seat_holds', to='accounts.customer')),
+                ('flight', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='flight.flight')),
+            ],
+            options={
+                'verbose_name': 'Seat Holds',
+                'verbose_name_plural': 'Seat Holds',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='seathold',
+            index=models.Index(fields=['expires_at'], name='hold_expires_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='seathold',
+            constraint=models.UniqueConstraint(fields=('flight', 'customer'), name='hold_unique_key'),
+        ),
+    ]
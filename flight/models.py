@@ -1,9 +1,23 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.utils import timezone
 from django.urls import reverse
+from django.dispatch import receiver
+from django.db.models import F, Count, Q
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.core.validators import ValidationError, MinValueValidator
 
+from accounts.cache import token_cache
 from accounts.models import User, Customer
-from .managers import CompanyManager, FlightManager, TicketsManager
+from accounts.tokens import revoke_user_signed_tokens
+from .cache import bump_generation_on_commit, model_generation_name, route_generation_name
+from .itinerary import refresh_flight_on_commit, refresh_flights_on_commit, change_seats_on_commit
+from .managers import (
+    CompanyManager, FlightManager, TicketsManager, SeatHoldManager, FlightSearchManager, RouteDailyStatsManager,
+    ArchivedFlightManager, IdempotencyKeyManager
+)
+from .signals import seats_changed, holds_changed, flights_created, flights_updated, flights_archived
 
 
 class TicketStatus(models.TextChoices):
@@ -42,6 +56,13 @@ class Company(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Manager the company was loaded with, handing it over changes the principal of both users
+        instance._loaded_manager_id = instance.__dict__.get('manager_id')
+        return instance
+
     def get_single_api_absolut_url(self):
         return reverse('flight:airline_by_id', args=[self.id, ])
 
@@ -60,6 +81,8 @@ class Flight(models.Model):
 
     price = models.DecimalField(null=True, decimal_places=2, max_digits=10)
     num_of_tickets = models.PositiveIntegerField(validators=[MinValueValidator(1), ])
+    seats_sold = models.PositiveIntegerField(default=0, editable=False)
+    seats_held = models.PositiveIntegerField(default=0, editable=False)
 
     created = models.DateTimeField(auto_now=True)
     modified = models.DateTimeField(auto_now_add=True)
@@ -69,17 +92,54 @@ class Flight(models.Model):
     def __str__(self):
         return f"From {self.origin.name} to {self.destination.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Route the flight was loaded with, saving it on another route has to invalidate both
+        instance._loaded_route = (instance.__dict__.get('origin_id'), instance.__dict__.get('destination_id'))
+        # Rollup key & counters the flight was loaded with, so a change can be moved between rollup rows
+        instance._loaded_stats = instance.stats_state() if 'departure_time' in instance.__dict__ else None
+        return instance
+
+    # Fields `stats_state` reads, loaded together so `from_db` doesn't fetch a deferred one
+    stats_fields = ('departure_time', 'company_id', 'origin_id', 'destination_id', 'num_of_tickets', 'price')
+
+    def stats_key(self):
+        # Naive date times are saved in the default timezone, which is the current one outside of requests
+        departure = self.departure_time
+        day = timezone.localdate(departure) if timezone.is_aware(departure) else departure.date()
+        return day, self.company_id, self.origin_id, self.destination_id
+
+    def stats_state(self):
+        return self.stats_key(), self.num_of_tickets, self.price
+
     class Meta:
         verbose_name = 'Flights'
         verbose_name_plural = 'Flights'
+        indexes = [
+            models.Index(fields=['origin', 'destination', 'departure_time'], name='flight_route_departure_idx'),
+            models.Index(fields=['company', 'departure_time'], name='flight_company_departure_idx'),
+        ]
 
-    def save(self, *args, **kwargs):
+    def validate_schedule(self):
         if self.num_of_tickets < 1:
             raise ValidationError('Number of tickets cant be negative')
-        if self.origin == self.destination:
+        if self.origin_id == self.destination_id:
             raise ValidationError('Origin country cant be same as destination country')
         if self.departure_time >= self.landing_time:
             raise ValidationError('Departure time must be less than landing time')
+
+    # Counters only moved by the conditional updates of `FlightManager`, saving a loaded flight must not write back the
+    # values it was loaded with over the bookings made since
+    counter_fields = ('seats_sold', 'seats_held')
+
+    def save(self, *args, **kwargs):
+        self.validate_schedule()
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in self.counter_fields
+                                       and field.attname not in deferred]
         super(Flight, self).save(*args, **kwargs)
 
     def get_single_api_absolut_url(self):
@@ -89,9 +149,10 @@ class Flight(models.Model):
         return reverse('flight:all_flights')
 
     def count_receive_rickets(self):
-        return Ticket.objects.filter(flight=self).count()
+        return self.seats_sold
 
     count_receive_rickets.short_description = 'Received tickets'
+    count_receive_rickets.admin_order_field = 'seats_sold'
 
 
 class Ticket(models.Model):
@@ -101,20 +162,461 @@ class Ticket(models.Model):
 
     objects = TicketsManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     class Meta:
         verbose_name = 'Tickets'
         verbose_name_plural = 'Tickets'
         unique_together = ('flight', 'customer')
 
     def save(self, *args, **kwargs):
-        max_num_tickets = self.flight.num_of_tickets
-        current_num_tickets = Ticket.objects.filter(flight=self.flight).count()
-        if current_num_tickets + 1 > max_num_tickets:
-            raise ValidationError('Max number of tickets has been reached')
-        super(Ticket, self).save(*args, **kwargs)
+        if not self._state.adding:
+            return super(Ticket, self).save(*args, **kwargs)
+        # The seat is taken and the ticket inserted in the same transaction, so a failing insert gives it back. The seat
+        # the customer held on the checkout page is sold first, otherwise a free one
+        with transaction.atomic():
+            flight = self.flight if self._meta.get_field('flight').is_cached(self) else None
+            if not SeatHold.objects.convert(self.flight_id, self.customer_id, flight) \
+                    and not Flight.objects.reserve_seats(self.flight_id, flight=flight):
+                raise ValidationError('Max number of tickets has been reached')
+            super(Ticket, self).save(*args, **kwargs)
 
     # def get_single_api_absolut_url(self):
     #     return reverse('flight:flight_by_id', args=[self.id, ])
     #
     # def get_all_api_absolut_url(self):
     #     return reverse('flight:all_flights')
+
+
+class SeatHold(models.Model):
+    """
+    Seat of a flight held for a customer between the checkout page and the payment, counted by `Flight.seats_held`
+    until it is sold with the ticket or released once expired.
+    """
+
+    flight = models.ForeignKey(Flight, on_delete=models.CASCADE, related_name='holds')
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='seat_holds')
+    expires_at = models.DateTimeField()
+
+    objects = SeatHoldManager()
+
+    class Meta:
+        verbose_name = 'Seat Holds'
+        verbose_name_plural = 'Seat Holds'
+        constraints = [
+            models.UniqueConstraint(fields=['flight', 'customer'], name='hold_unique_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='hold_expires_idx'),
+        ]
+
+
+class FlightSearch(models.Model):
+    """Denormalized copy of the searchable columns of a flight, so flight search needs no join."""
+
+    flight = models.OneToOneField(Flight, on_delete=models.CASCADE, primary_key=True, related_name='search')
+
+    company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, related_name='+')
+    origin = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, related_name='+')
+    destination = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, related_name='+')
+
+    company_name = models.CharField(max_length=200, blank=True)
+    origin_name = models.CharField(max_length=50, blank=True)
+    destination_name = models.CharField(max_length=50, blank=True)
+
+    departure_time = models.DateTimeField()
+    landing_time = models.DateTimeField()
+    price = models.DecimalField(null=True, decimal_places=2, max_digits=10)
+    seats_left = models.IntegerField()
+
+    objects = FlightSearchManager()
+
+    class Meta:
+        verbose_name = 'Flights Search'
+        verbose_name_plural = 'Flights Search'
+        ordering = ('departure_time', 'flight')
+        indexes = [
+            models.Index(fields=['departure_time', 'flight'], name='search_departure_idx'),
+            models.Index(fields=['origin', 'destination', 'departure_time'], name='search_route_departure_idx'),
+            models.Index(fields=['company', 'departure_time'], name='search_company_departure_idx'),
+            models.Index(fields=['price'], name='search_price_idx'),
+        ]
+
+    def __str__(self):
+        return f"From {self.origin_name} to {self.destination_name}"
+
+
+class RouteDailyStats(models.Model):
+    """
+    Daily rollup of the flights of a company on a route, by departure day, kept up to date by the flight & ticket
+    signals. `tickets` counts every ticket like `Flight.seats_sold`, `revenue` is the price of the booked ones.
+    """
+
+    date = models.DateField()
+    company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, related_name='+')
+    origin = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, related_name='+')
+    destination = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, related_name='+')
+
+    flights = models.IntegerField(default=0)
+    seats = models.IntegerField(default=0)
+    tickets = models.IntegerField(default=0)
+    canceled = models.IntegerField(default=0)
+    revenue = models.DecimalField(default=0, decimal_places=2, max_digits=14)
+
+    objects = RouteDailyStatsManager()
+
+    class Meta:
+        verbose_name = 'Route Daily Stats'
+        verbose_name_plural = 'Route Daily Stats'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'company', 'origin', 'destination'], name='stats_unique_key'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='stats_date_idx'),
+            models.Index(fields=['company', 'date'], name='stats_company_date_idx'),
+            models.Index(fields=['origin', 'destination', 'date'], name='stats_route_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.origin_id} to {self.destination_id}"
+
+
+class ArchivedFlight(models.Model):
+    """
+    Cold copy of a flight landed before the retention window, moved here with its tickets by `archive_flights`.
+    The flight keeps its id, so reads by id fall back to the archive.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    company = models.ForeignKey(Company, on_delete=models.SET_NULL, null=True, related_name='+')
+    origin = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, related_name='+')
+    destination = models.ForeignKey(Country, on_delete=models.SET_NULL, null=True, related_name='+')
+
+    departure_time = models.DateTimeField()
+    landing_time = models.DateTimeField()
+
+    price = models.DecimalField(null=True, decimal_places=2, max_digits=10)
+    num_of_tickets = models.PositiveIntegerField()
+    seats_sold = models.PositiveIntegerField(default=0, editable=False)
+
+    created = models.DateTimeField(editable=False)
+    modified = models.DateTimeField(editable=False)
+    archived_at = models.DateTimeField(editable=False)
+
+    objects = ArchivedFlightManager()
+
+    class Meta:
+        verbose_name = 'Archived Flights'
+        verbose_name_plural = 'Archived Flights'
+        indexes = [
+            models.Index(fields=['company', 'departure_time'], name='archive_company_departure_idx'),
+            models.Index(fields=['origin', 'destination', 'departure_time'], name='archive_route_departure_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.departure_time:%Y-%m-%d} {self.origin_id} to {self.destination_id}"
+
+
+class ArchivedTicket(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    flight = models.ForeignKey(ArchivedFlight, on_delete=models.CASCADE, related_name='tickets')
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, related_name='+')
+    status = models.CharField(max_length=50, choices=TicketStatus.choices, default=TicketStatus.Booked)
+
+    class Meta:
+        verbose_name = 'Archived Tickets'
+        verbose_name_plural = 'Archived Tickets'
+        indexes = [
+            models.Index(fields=['customer'], name='archive_ticket_customer_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    First response of a write facade called with an `Idempotency-Key`, per user, replayed on the retries of the
+    request until `expires_at`. `status_code` stays null while the first request runs, which holds the key until
+    `locked_until` only, so a request whose worker died doesn't block its retries.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content = models.BinaryField(default=b'')
+    content_type = models.CharField(max_length=100, blank=True)
+
+    locked_until = models.DateTimeField(null=True)
+    expires_at = models.DateTimeField()
+
+    objects = IdempotencyKeyManager()
+
+    class Meta:
+        verbose_name = 'Idempotency Keys'
+        verbose_name_plural = 'Idempotency Keys'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_unique_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+
+@receiver(post_delete, sender=Ticket)
+def release_ticket_seat(sender, instance, **kwargs):
+    if instance.flight_id:
+        flight = instance.flight if sender._meta.get_field('flight').is_cached(instance) else None
+        Flight.objects.release_seats(instance.flight_id, flight=flight)
+
+
+@receiver(post_save, sender=Country)
+@receiver(post_delete, sender=Country)
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_reference_data(sender, instance, **kwargs):
+    bump_generation_on_commit(model_generation_name(sender))
+    if sender is Country and kwargs.get('signal') is post_delete:
+        # Deleting a country sets the country of its companies to null without sending their signals
+        bump_generation_on_commit(model_generation_name(Company))
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_manager_principal(sender, instance, created=False, **kwargs):
+    # Principals carry the managed company, cached & signed ones of the old and new manager are dropped
+    manager_id = instance.manager_id if kwargs.get('signal') is post_save else None
+    loaded_manager_id = None if created else getattr(instance, '_loaded_manager_id', instance.manager_id)
+    if manager_id != loaded_manager_id:
+        for user_id in {manager_id, loaded_manager_id} - {None}:
+            token_cache.invalidate_tag(user_id)
+            transaction.on_commit(lambda user_id=user_id: token_cache.invalidate_tag(user_id))
+            revoke_user_signed_tokens(user_id)
+    instance._loaded_manager_id = manager_id
+
+
+# Flight search projection
+
+@receiver(post_save, sender=Flight)
+def sync_flight_search(sender, instance, **kwargs):
+    FlightSearch.objects.refresh([instance.id])
+
+
+@receiver(flights_created, sender=Flight)
+def sync_created_flights_search(sender, flight_ids, **kwargs):
+    FlightSearch.objects.refresh(flight_ids)
+
+
+@receiver(flights_updated, sender=Flight)
+def sync_updated_flights_search(sender, flights, **kwargs):
+    FlightSearch.objects.refresh([flight.id for flight in flights])
+
+
+@receiver(seats_changed, sender=Flight)
+@receiver(holds_changed, sender=Flight)
+def sync_flight_search_seats(sender, flight_id, count, **kwargs):
+    FlightSearch.objects.filter(flight_id=flight_id).update(seats_left=F('seats_left') - count)
+
+
+@receiver(post_save, sender=Company)
+def sync_flight_search_company(sender, instance, **kwargs):
+    FlightSearch.objects.filter(company_id=instance.id).exclude(company_name=instance.name)\
+        .update(company_name=instance.name)
+
+
+@receiver(post_save, sender=Country)
+def sync_flight_search_country(sender, instance, **kwargs):
+    FlightSearch.objects.filter(origin_id=instance.id).exclude(origin_name=instance.name)\
+        .update(origin_name=instance.name)
+    FlightSearch.objects.filter(destination_id=instance.id).exclude(destination_name=instance.name)\
+        .update(destination_name=instance.name)
+
+
+# The deletion sets the foreign keys to null by itself, names are cleared before they can't be matched anymore
+
+@receiver(pre_delete, sender=Company)
+def clear_flight_search_company(sender, instance, **kwargs):
+    FlightSearch.objects.filter(company_id=instance.id).update(company_name='')
+
+
+@receiver(pre_delete, sender=Country)
+def clear_flight_search_country(sender, instance, **kwargs):
+    FlightSearch.objects.filter(origin_id=instance.id).update(origin_name='')
+    FlightSearch.objects.filter(destination_id=instance.id).update(destination_name='')
+
+
+# Itinerary graph
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+def sync_flight_graph(sender, instance, **kwargs):
+    refresh_flight_on_commit(instance.id)
+
+
+@receiver(flights_created, sender=Flight)
+def sync_created_flights_graph(sender, flight_ids, **kwargs):
+    refresh_flights_on_commit(flight_ids)
+
+
+@receiver(flights_updated, sender=Flight)
+def sync_updated_flights_graph(sender, flights, **kwargs):
+    refresh_flights_on_commit([flight.id for flight in flights])
+
+
+@receiver(seats_changed, sender=Flight)
+@receiver(holds_changed, sender=Flight)
+def sync_flight_graph_seats(sender, flight_id, count, **kwargs):
+    change_seats_on_commit(flight_id, count)
+
+
+# Fare calendar
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+def invalidate_fare_calendar(sender, instance, **kwargs):
+    route = (instance.origin_id, instance.destination_id)
+    for origin_id, destination_id in {route, getattr(instance, '_loaded_route', route)}:
+        bump_generation_on_commit(route_generation_name(origin_id, destination_id))
+    instance._loaded_route = route
+
+
+@receiver(flights_created, sender=Flight)
+def invalidate_created_flights_fare_calendar(sender, flight_ids, **kwargs):
+    routes = Flight.objects.filter(id__in=flight_ids).values_list('origin_id', 'destination_id').distinct()
+    for origin_id, destination_id in routes:
+        bump_generation_on_commit(route_generation_name(origin_id, destination_id))
+
+
+@receiver(flights_archived, sender=Flight)
+def invalidate_archived_flights_fare_calendar(sender, flights, **kwargs):
+    for origin_id, destination_id in {(flight.origin_id, flight.destination_id) for flight in flights}:
+        bump_generation_on_commit(route_generation_name(origin_id, destination_id))
+
+
+@receiver(flights_updated, sender=Flight)
+def invalidate_updated_flights_fare_calendar(sender, flights, **kwargs):
+    routes = set()
+    for flight in flights:
+        route = (flight.origin_id, flight.destination_id)
+        routes.update({route, getattr(flight, '_loaded_route', route)})
+        flight._loaded_route = route
+    for origin_id, destination_id in routes:
+        bump_generation_on_commit(route_generation_name(origin_id, destination_id))
+
+
+# Route daily stats
+
+def flights_ticket_stats(flight_ids):
+    # {flight id: (tickets, canceled tickets)} with one grouped query
+    rows = Ticket.objects.filter(flight_id__in=flight_ids).order_by().values_list('flight_id')\
+        .annotate(tickets=Count('id'), canceled=Count('id', filter=Q(status=TicketStatus.Canceled)))
+    return {flight_id: (tickets, canceled) for flight_id, tickets, canceled in rows}
+
+
+def sync_flights_stats(flights, created: bool = False):
+    """Moves the changes of `flights` since they were loaded (or their creation) to their rollup rows."""
+    deltas = {}
+
+    def add(key, **values):
+        row = deltas.setdefault(key, Counter())
+        row.update(values)
+
+    moved = []
+    for flight in flights:
+        key, seats, price = state = flight.stats_state()
+        loaded = None if created else getattr(flight, '_loaded_stats', None)
+        if created:
+            add(key, flights=1, seats=seats)
+        elif loaded is not None and loaded != state:
+            if loaded[0] == key and loaded[2] == price:
+                add(key, seats=seats - loaded[1])
+            else:
+                moved.append((flight.id, loaded, state))
+        flight._loaded_stats = state
+
+    tickets = flights_ticket_stats([flight_id for flight_id, _, _ in moved]) if moved else {}
+    for flight_id, (loaded_key, loaded_seats, loaded_price), (key, seats, price) in moved:
+        sold, canceled = tickets.get(flight_id, (0, 0))
+        add(loaded_key, flights=-1, seats=-loaded_seats, tickets=-sold, canceled=-canceled,
+            revenue=-(loaded_price or 0) * (sold - canceled))
+        add(key, flights=1, seats=seats, tickets=sold, canceled=canceled, revenue=(price or 0) * (sold - canceled))
+
+    for key, values in deltas.items():
+        RouteDailyStats.objects.add(*key, **values)
+
+
+@receiver(post_save, sender=Flight)
+def sync_route_stats_flight(sender, instance, created, **kwargs):
+    sync_flights_stats([instance], created)
+
+
+@receiver(flights_created, sender=Flight)
+def sync_route_stats_created_flights(sender, flight_ids, **kwargs):
+    sync_flights_stats(Flight.objects.filter(id__in=flight_ids), created=True)
+
+
+@receiver(flights_updated, sender=Flight)
+def sync_route_stats_updated_flights(sender, flights, **kwargs):
+    sync_flights_stats(flights)
+
+
+@receiver(pre_delete, sender=Flight)
+def remove_route_stats_flight(sender, instance, **kwargs):
+    # Before its tickets lose their flight, from the stored row as the instance may be stale
+    flight = Flight.objects.filter(id=instance.id).first()
+    if flight is None:
+        return
+    key, seats, price = flight.stats_state()
+    sold, canceled = flights_ticket_stats([instance.id]).get(instance.id, (0, 0))
+    RouteDailyStats.objects.add(*key, flights=-1, seats=-seats, tickets=-sold, canceled=-canceled,
+                                revenue=-(price or 0) * (sold - canceled))
+
+
+@receiver(seats_changed, sender=Flight)
+def sync_route_stats_seats(sender, flight_id, count, flight=None, **kwargs):
+    if flight is None:
+        flight = Flight.objects.only(*Flight.stats_fields).get(id=flight_id)
+    RouteDailyStats.objects.add(*flight.stats_key(), tickets=count, revenue=(flight.price or 0) * count)
+
+
+def sync_ticket_status_stats(flight_id: int, canceled: int):
+    # `canceled` tickets more (or less) on the flight, which don't bring revenue anymore
+    flight = Flight.objects.only(*Flight.stats_fields).get(id=flight_id)
+    RouteDailyStats.objects.add(*flight.stats_key(), canceled=canceled, revenue=-(flight.price or 0) * canceled)
+
+
+@receiver(post_save, sender=Ticket)
+def sync_route_stats_ticket(sender, instance, created, **kwargs):
+    loaded = TicketStatus.Booked if created else getattr(instance, '_loaded_status', instance.status)
+    if instance.flight_id and loaded != instance.status:
+        sync_ticket_status_stats(instance.flight_id, 1 if instance.status == TicketStatus.Canceled else -1)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Ticket)
+def remove_route_stats_ticket(sender, instance, **kwargs):
+    # The released seat removed the revenue of a booked ticket, a canceled one had none
+    if instance.flight_id and instance.status == TicketStatus.Canceled:
+        sync_ticket_status_stats(instance.flight_id, -1)
+
+
+@receiver(pre_delete, sender=Company)
+def reassign_route_stats_company(sender, instance, **kwargs):
+    RouteDailyStats.objects.reassign({'company_id': None}, company_id=instance.id)
+
+
+@receiver(pre_delete, sender=Country)
+def reassign_route_stats_country(sender, instance, **kwargs):
+    RouteDailyStats.objects.reassign({'origin_id': None}, origin_id=instance.id)
+    RouteDailyStats.objects.reassign({'destination_id': None}, destination_id=instance.id)
+
+
+# Seat holds
+
+@receiver(pre_delete, sender=Customer)
+def release_customer_seat_holds(sender, instance, **kwargs):
+    # Before the deletion cascades to the holds, which would keep their seats counted by the flights
+    SeatHold.objects.release(customer_id=instance.id)
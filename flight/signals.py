@@ -0,0 +1,18 @@
+from django.dispatch import Signal
+
+
+# Sent with `flight_id` & `count` whenever the seats sold counter of a flight changes by `count`, and the `flight`
+# instance when the sender has it loaded (None otherwise), so receivers needn't read the row again
+seats_changed = Signal()
+
+# Sent with `flight_id` & `count` whenever the seats held counter of a flight changes by `count`
+holds_changed = Signal()
+
+# Sent with `flight_ids` once flights are inserted with `bulk_create`, which skips `post_save`
+flights_created = Signal()
+
+# Sent with the `flights` written by `bulk_update`, which skips `post_save`
+flights_updated = Signal()
+
+# Sent with the `flights` moved to the archive, their rows are deleted without `pre_delete`/`post_delete`
+flights_archived = Signal()
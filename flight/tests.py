@@ -1,13 +1,41 @@
+import io
+import os
+import asyncio
+import contextvars
+import csv
+import gzip
 import json
+import tempfile
+import threading
 import datetime
 import warnings
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.urls import reverse
-from django.test import TestCase, Client
+from django.utils import timezone
+from django.db import connection
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import TestCase, SimpleTestCase, Client, RequestFactory, AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
 from django.utils.dateparse import parse_datetime
 from django.core.validators import ValidationError
-
-from .models import Country, Company, Flight, Ticket
+from django.contrib.sessions.models import Session
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from . import async_views
+from .decorators import resolve_token
+from .admin import TICKET_INLINE_LIMIT
+from .itinerary import FlightGraph, flight_graph
+from .models import (
+    Country, Company, Flight, Ticket, SeatHold, FlightSearch, RouteDailyStats, TicketStatus, ArchivedFlight,
+    ArchivedTicket, IdempotencyKey
+)
+from accounts.cache import token_cache
+from accounts.tokens import revocations
+from airline.middleware import RequestMetricsMiddleware, ReadYourWritesMiddleware
+from airline.routers import PrimaryReplicaRouter, begin_request, end_request
 from accounts.tests import BaseTest as AccountsBaseTest
 from accounts.models import User, Token, UserRole, Administrator, Customer
 
@@ -15,6 +43,15 @@ from accounts.models import User, Token, UserRole, Administrator, Customer
 warnings.filterwarnings("ignore")
 
 
+def first_id(model):
+    return model.objects.order_by('id').values_list('id', flat=True).first()
+
+
+def missing_id(model):
+    # Ids are not reset between tests on every backend, so an unused id is derived from the current ones
+    return (model.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+
+
 def parse_time_with_replace(t):
     if isinstance(t, str):
         t = parse_datetime(t)
@@ -62,13 +99,14 @@ class AnonymousFacadesTest(BaseTest):
 
     def test_get_flight_by_id(self):
         client = Client()
-        response = client.post(reverse('flight:flight_by_id', kwargs={'flight_id': 1}), HTTP_ACCEPT='application/json')
+        response = client.post(reverse('flight:flight_by_id', kwargs={'flight_id': first_id(Flight)}), HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
     def test_get_flights_by_parameters(self):
         client = Client()
         today = datetime.datetime.today().isoformat()
-        kwargs = {'origin_country_id': 1, 'destination_country_id': 2, 'date': today}
+        kwargs = {'origin_country_id': Country.objects.get(name='Egypt').id,
+                  'destination_country_id': Country.objects.get(name='Morocco').id, 'date': today}
         response = client.post(reverse('flight:flight_by_parameters', kwargs=kwargs), HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
@@ -79,7 +117,7 @@ class AnonymousFacadesTest(BaseTest):
 
     def test_get_airline_by_id(self):
         client = Client()
-        response = client.post(reverse('flight:airline_by_id', kwargs={'airline_id': 1}), HTTP_ACCEPT='application/json')
+        response = client.post(reverse('flight:airline_by_id', kwargs={'airline_id': first_id(Company)}), HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
     def test_get_airline_by_parameters(self):
@@ -95,8 +133,64 @@ class AnonymousFacadesTest(BaseTest):
 
     def test_get_country_by_id(self):
         client = Client()
-        response = client.post(reverse('flight:country_by_id', kwargs={'country_id': 1}), HTTP_ACCEPT='application/json')
+        response = client.post(reverse('flight:country_by_id', kwargs={'country_id': first_id(Country)}), HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+
+
+class PaginationTest(BaseTest):
+
+    def test_cursor_pagination(self):
+        client = Client()
+        ids = list(Flight.objects.order_by('id').values_list('id', flat=True))
+
+        response = client.get(reverse('flight:all_flights'), {'limit': 1}, HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()], ids[:1])
+        self.assertEqual(int(response['X-Next-Cursor']), ids[0])
+
+        response = client.get(reverse('flight:all_flights'), {'limit': 1, 'cursor': response['X-Next-Cursor']},
+                              HTTP_ACCEPT='application/json')
+        self.assertEqual([row['id'] for row in response.json()], ids[1:2])
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+        response = client.get(reverse('flight:all_flights'), {'cursor': 'any'}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_streaming(self):
+        client = Client()
+        ids = list(Flight.objects.order_by('id').values_list('id', flat=True))
+
+        response = client.get(reverse('flight:all_flights'), {'stream': 'json'})
+        self.assertTrue(response.streaming)
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['id'] for row in data], ids)
+
+        response = client.get(reverse('flight:all_flights'), {'stream': 'ndjson', 'cursor': ids[0]})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], ids[1:])
+
+        response = client.get(reverse('flight:all_flights'), {'stream': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FlightSearchIndexTest(BaseTest):
+
+    def test_date_lookup_is_half_open_range(self):
+        today = datetime.datetime.today()
+        egypt, morocco = Country.objects.get(name="Egypt"), Country.objects.get(name="Morocco")
+        queryset = Flight.objects.get_flights_by_parameters(egypt.id, morocco.id, today)
+
+        self.assertEqual(queryset.count(), 1)
+        self.assertEqual(queryset.filter(departure_time__date=today.date()).count(), 1)
+        self.assertNotIn('django_datetime_cast_date', str(queryset.query))
+
+    def test_route_index_is_used(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN is specific to SQLite')
+        queryset = Flight.objects.get_flights_by_parameters(1, 2, datetime.datetime.today())
+        plan = queryset.explain()
+        self.assertIn('USING INDEX flight_route_departure_idx', plan)
+        self.assertIn('departure_time>? AND departure_time<?', plan)
 
 
 class CompanyTest(BaseTest):
@@ -126,7 +220,7 @@ class CompanyTest(BaseTest):
 
         # Second Case - data is incorrect / the country doesn't exist - (Fail)
         params2 = params.copy()
-        params2.update({'country': 5})
+        params2.update({'country': missing_id(Country)})
         response = client.post(reverse('flight:add_airline'), params2, HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 404)
 
@@ -141,14 +235,15 @@ class CompanyTest(BaseTest):
 
         client = Client()
         params = {'token': user_token.name}
+        company_id = first_id(Company)
 
         # First Case - the company id exists - (Success)
-        response = client.post(reverse('flight:remove_airline', kwargs={'airline': 1}), params,
+        response = client.post(reverse('flight:remove_airline', kwargs={'airline': company_id}), params,
                                HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
         # First Case - the company id doesn't  exist - (Fail)
-        response = client.post(reverse('flight:remove_airline', kwargs={'airline': 1}), params,
+        response = client.post(reverse('flight:remove_airline', kwargs={'airline': company_id}), params,
                                HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 404)
 
@@ -156,21 +251,23 @@ class CompanyTest(BaseTest):
         user_token = Token.objects.get(user__username="admin")
 
         client = Client()
-        params = {'token': user_token.name, 'country': 1}
+        params = {'token': user_token.name, 'country': first_id(Country)}
+        company_id = first_id(Company)
 
         # First Case - the company id exists & data is valid - (Success)
-        response = client.post(reverse('flight:update_airline', kwargs={'airline': 1}), params,
+        response = client.post(reverse('flight:update_airline', kwargs={'airline': company_id}), params,
                                HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
         # Second Case - the company id exists & data is not valid- (Fail)
         params2 = params.copy()
-        params2.update({'country': 5})
-        response = client.post(reverse('flight:update_airline', kwargs={'airline': 1}), params2, HTTP_ACCEPT='application/json')
+        params2.update({'country': missing_id(Country)})
+        response = client.post(reverse('flight:update_airline', kwargs={'airline': company_id}), params2,
+                               HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 404)
 
         # Third Case - the company id is not exists - (Fail)
-        response = client.post(reverse('flight:update_airline', kwargs={'airline': 3}), params,
+        response = client.post(reverse('flight:update_airline', kwargs={'airline': missing_id(Company)}), params,
                                HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 404)
 
@@ -185,7 +282,7 @@ class FlightTest(BaseTest):
         response = client.get(reverse('flight:own_flights'), {'token': user_token.name}, HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
-        data = json.loads(response.json())
+        data = response.json()
         data = parse_str_time(data)
         for i, j in zip(data, flights):
             self.assertEqual(i, j)
@@ -230,11 +327,13 @@ class FlightTest(BaseTest):
         params = {'token': user_token.name}
 
         # First Case - the flight id exists - (Success)
-        response = client.post(reverse('flight:remove_flight', kwargs={'flight': 1}), params, HTTP_ACCEPT='application/json')
+        response = client.post(reverse('flight:remove_flight', kwargs={'flight': first_id(Flight)}), params,
+                               HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
         # First Case - the flight id doesn't  exist - (Fail)
-        response = client.post(reverse('flight:remove_flight', kwargs={'flight': 3}), params, HTTP_ACCEPT='application/json')
+        response = client.post(reverse('flight:remove_flight', kwargs={'flight': missing_id(Flight)}), params,
+                               HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 404)
 
     def test_flight_update(self):
@@ -244,17 +343,20 @@ class FlightTest(BaseTest):
         params = {'token': user_token.name,  'num_of_tickets': 15}
 
         # First Case - the flight id exists & data is valid- (Success)
-        response = client.post(reverse('flight:update_flight', kwargs={'flight': 1}), params, HTTP_ACCEPT='application/json')
+        first, second = Flight.objects.order_by('id')[:2]
+        response = client.post(reverse('flight:update_flight', kwargs={'flight': first.id}), params,
+                               HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
         # Second Case - the flight id exists & data is not valid- (Fail)
         params2 = params.copy()
         params2.update({'num_of_tickets': -15})
         with self.assertRaises(ValidationError):
-            client.post(reverse('flight:update_flight', kwargs={'flight': 2}), params2, HTTP_ACCEPT='application/json')
+            client.post(reverse('flight:update_flight', kwargs={'flight': second.id}), params2,
+                        HTTP_ACCEPT='application/json')
 
         # Third Case - the flight id is not exists - (Fail)
-        response = client.post(reverse('flight:update_flight', kwargs={'flight': 3}), params,
+        response = client.post(reverse('flight:update_flight', kwargs={'flight': missing_id(Flight)}), params,
                                HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 404)
 
@@ -271,7 +373,7 @@ class TicketTest(BaseTest):
                               origin=Country.objects.get(name="Morocco"), destination=Country.objects.get(name="Sudan"),
                               num_of_tickets=10)
 
-        Flight.objects.filter(id=2).update(num_of_tickets=1)
+        Flight.objects.filter(id=Flight.objects.order_by('id')[1].id).update(num_of_tickets=1)
 
         Ticket.objects.create(customer=Customer.objects.get(user__username="customer"), flight=Flight.objects.first())
         Ticket.objects.create(customer=Customer.objects.get(user__username="customer"), flight=Flight.objects.last())
@@ -279,7 +381,7 @@ class TicketTest(BaseTest):
     def test_ticket_creation(self):
         customer = Customer.objects.get(user__username="customer")
         customer_token = Token.objects.get(user=customer.user)
-        flight = Flight.objects.get(id=2)
+        flight = Flight.objects.order_by('id')[1]
 
         client = Client()
         params = {
@@ -294,7 +396,7 @@ class TicketTest(BaseTest):
 
         # Second Case - data is incorrect - (Fail)
         params2 = params.copy()
-        params2.update({'customer': 4})
+        params2.update({'customer': missing_id(Customer)})
         response = client.post(reverse('flight:add_ticket'), params2, HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 404)
 
@@ -315,7 +417,7 @@ class TicketTest(BaseTest):
         response = client.get(reverse('flight:own_tickets'), params, HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
-        data = json.loads(response.json())
+        data = response.json()
         for i, j in zip(data, tickets):
             self.assertEqual(i, j)
 
@@ -327,11 +429,13 @@ class TicketTest(BaseTest):
         params = {'token': customer_token.name}
 
         # First Case - the flight id exists - (Success)
-        response = client.post(reverse('flight:remove_ticket', kwargs={'ticket_id': 1}), params, HTTP_ACCEPT='application/json')
+        response = client.post(reverse('flight:remove_ticket', kwargs={'ticket_id': first_id(Ticket)}), params,
+                               HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 200)
 
         # First Case - the flight id doesn't  exist - (Fail)
-        response = client.post(reverse('flight:remove_ticket', kwargs={'ticket_id': 3}), params, HTTP_ACCEPT='application/json')
+        response = client.post(reverse('flight:remove_ticket', kwargs={'ticket_id': missing_id(Ticket)}), params,
+                               HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 404)
 
         # Third Case - the flight id exists & ticket doesn't belong to same customer - (Fail)
@@ -344,3 +448,1044 @@ class TicketTest(BaseTest):
 
         response = client.post(reverse('flight:remove_ticket', kwargs={'ticket_id': ticket.id}), params, HTTP_ACCEPT='application/json')
         self.assertEqual(response.status_code, 403)
+
+
+class SeatsCounterTest(BaseTest):
+
+    def test_booking_updates_counter(self):
+        customer = Customer.objects.get(user__username="customer")
+        flight = Flight.objects.first()
+        Flight.objects.filter(id=flight.id).update(num_of_tickets=1)
+
+        ticket = Ticket.objects.create(customer=customer, flight=flight)
+        flight.refresh_from_db()
+        self.assertEqual(flight.seats_sold, 1)
+
+        # Flight is full, the counter is left untouched
+        with self.assertRaises(ValidationError):
+            Ticket.objects.create(customer=customer, flight=flight)
+        flight.refresh_from_db()
+        self.assertEqual(flight.seats_sold, 1)
+
+        ticket.delete()
+        flight.refresh_from_db()
+        self.assertEqual(flight.seats_sold, 0)
+
+    def test_saving_a_loaded_flight_keeps_the_seats_sold_since(self):
+        customer = Customer.objects.get(user__username="customer")
+        flight = Flight.objects.first()
+        Ticket.objects.create(customer=customer, flight=Flight.objects.get(id=flight.id))
+
+        flight.price = 50
+        flight.save()
+        flight = Flight.objects.get(id=flight.id)
+        self.assertEqual((flight.seats_sold, flight.price), (1, 50))
+        self.assertEqual(FlightSearch.objects.get(flight_id=flight.id).seats_left, flight.num_of_tickets - 1)
+
+    def test_reconcile_seats(self):
+        customer = Customer.objects.get(user__username="customer")
+        flight = Flight.objects.first()
+        Ticket.objects.create(customer=customer, flight=flight)
+        Flight.objects.update(seats_sold=5)
+
+        call_command('reconcile_seats', batch_size=1, stdout=io.StringIO())
+        self.assertEqual(Flight.objects.get(id=flight.id).seats_sold, 1)
+        self.assertEqual(Flight.objects.exclude(id=flight.id).filter(seats_sold=0).count(), Flight.objects.count() - 1)
+
+
+class SeatHoldTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.flight = Flight.objects.order_by('id').first()
+        Flight.objects.filter(id=self.flight.id).update(num_of_tickets=1)
+        FlightSearch.objects.refresh([self.flight.id])
+        self.customer = Customer.objects.get(user__username="customer")
+        user = User.objects.create(username="other", password="other123", role=UserRole.objects.get(name="customer"))
+        self.other = Customer.objects.create(user=user, phone_number="1234556891", credit_card="123456784523456")
+
+    def counters(self):
+        flight = Flight.objects.get(id=self.flight.id)
+        return flight.seats_sold, flight.seats_held, FlightSearch.objects.get(flight_id=flight.id).seats_left
+
+    def test_checkout_holds_the_seat(self):
+        url = reverse('flight:create_ticket', kwargs={'pk': self.flight.id})
+        client, other_client = Client(), Client()
+        client.force_login(self.customer.user)
+        other_client.force_login(self.other.user)
+
+        self.assertEqual(client.get(url).status_code, 200)
+        self.assertEqual(self.counters(), (0, 1, 0))
+        # Coming back to the page extends the hold instead of taking another seat
+        self.assertEqual(client.get(url).status_code, 200)
+        self.assertEqual(other_client.get(url).status_code, 302)
+        with self.assertRaises(ValidationError):
+            Ticket.objects.create(customer=self.other, flight=self.flight)
+
+        client.post(url, {'credit_card': '1234567812345678'})
+        self.assertTrue(Ticket.objects.filter(customer=self.customer, flight=self.flight).exists())
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+    def test_expired_holds_are_released(self):
+        self.assertIsNotNone(SeatHold.objects.take(self.flight.id, self.customer.id))
+        SeatHold.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        # Lazily, once the flight is full
+        self.assertIsNotNone(SeatHold.objects.take(self.flight.id, self.other.id))
+        self.assertEqual(list(SeatHold.objects.values_list('customer_id', flat=True)), [self.other.id])
+        self.assertEqual(self.counters(), (0, 1, 0))
+
+        SeatHold.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        call_command('release_seat_holds', stdout=io.StringIO())
+        self.assertFalse(SeatHold.objects.exists())
+        self.assertEqual(self.counters(), (0, 0, 1))
+
+    def test_editing_a_flight_keeps_the_holds_taken_meanwhile(self):
+        flight = Flight.objects.get(id=self.flight.id)
+        self.assertIsNotNone(SeatHold.objects.take(self.flight.id, self.customer.id))
+        flight.price = 50
+        flight.save()
+        self.assertEqual(self.counters(), (0, 1, 0))
+        # The held seat still counts against the capacity, and its release doesn't drive the counter negative
+        with self.assertRaises(ValidationError):
+            Ticket.objects.create(customer=self.other, flight=self.flight)
+        SeatHold.objects.release(customer_id=self.customer.id)
+        self.assertEqual(self.counters(), (0, 0, 1))
+
+    def test_group_booking_sells_held_seats(self):
+        SeatHold.objects.take(self.flight.id, self.customer.id)
+        booked, _ = Ticket.objects.book_many([(self.flight.id, self.customer.id)])
+        self.assertTrue(booked)
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+        Flight.objects.filter(id=self.flight.id).update(seats_held=3)
+        call_command('reconcile_seats', stdout=io.StringIO())
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+
+class IdempotencyKeyTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.url = reverse('flight:add_ticket')
+        self.data = {'token': Token.objects.get(user__username="customer").name, 'flight': first_id(Flight),
+                     'customer': first_id(Customer)}
+
+    def post(self, data, key='retry-1'):
+        return self.client.post(self.url, data, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retries_replay_the_first_response(self):
+        response = self.post(self.data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+        replayed = self.post(self.data)
+        self.assertEqual((replayed.status_code, replayed.content), (200, response.content))
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual(Ticket.objects.count(), 1)
+        self.assertEqual(Flight.objects.get(id=self.data['flight']).seats_sold, 1)
+
+        other_flight = {**self.data, 'flight': Flight.objects.order_by('id').last().id}
+        self.assertEqual(self.post(other_flight).status_code, 422)
+        # Keys are per user
+        other_user = {**other_flight, 'token': Token.objects.get(user__username="admin").name}
+        self.assertEqual(self.post(other_user).status_code, 200)
+        self.assertEqual(Ticket.objects.count(), 2)
+
+    def test_in_progress_and_expired_keys(self):
+        self.post(self.data)
+        IdempotencyKey.objects.update(status_code=None)
+        self.assertEqual(self.post(self.data).status_code, 409)
+        # The worker of the first request died, its claim is taken over once the lease is over
+        IdempotencyKey.objects.update(locked_until=timezone.now() - datetime.timedelta(seconds=1))
+        Ticket.objects.all().delete()
+        self.assertEqual(self.post(self.data).status_code, 200)
+        self.assertEqual(IdempotencyKey.objects.get().locked_until, None)
+
+        Ticket.objects.all().delete()
+        IdempotencyKey.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.post(self.data).status_code, 200)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+        self.post({**self.data, 'flight': Flight.objects.order_by('id').last().id}, key='retry-2')
+        IdempotencyKey.objects.filter(key='retry-1').update(expires_at=timezone.now())
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['retry-2'])
+
+
+class TokenCacheTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+
+    def test_token_is_cached(self):
+        token = Token.objects.get(user__username="admin")
+
+        with self.assertNumQueries(1):
+            info = resolve_token(token.name)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_token(token.name), info)
+        self.assertTrue(info.is_admin)
+        self.assertFalse(info.is_customer)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+        self.assertIsNone(resolve_token('any'))
+
+    def test_cache_invalidation(self):
+        token = Token.objects.get(user__username="admin")
+        resolve_token(token.name)
+
+        Administrator.objects.filter(user=token.user).get().delete()
+        self.assertFalse(resolve_token(token.name).is_admin)
+
+        client = Client()
+        response = client.get(reverse('flight:all_customers'), {'token': token.name}, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+        token.delete()
+        self.assertIsNone(resolve_token(token.name))
+
+
+class PrincipalTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        token_cache.clear()
+
+    def test_principal_is_resolved_in_one_query(self):
+        admin = User.objects.get(username="admin")
+        token = admin.auth_token.name
+        with self.assertNumQueries(1):
+            principal = resolve_token(token)
+        self.assertEqual(principal.user_id, admin.id)
+        self.assertEqual(principal.role, "admin")
+        self.assertEqual(principal.administrator_id, admin.administrator.id)
+        self.assertEqual(principal.company_id, Company.objects.get(manager=admin).id)
+        self.assertFalse(principal.is_customer)
+
+        # The view's own query only, the principal is cached
+        with self.assertNumQueries(1):
+            response = Client().get(reverse('flight:own_flights'), {'token': token})
+        self.assertEqual(len(response.json()), Flight.objects.count())
+
+        response = Client().get(reverse('flight:own_flights'),
+                                {'token': Token.objects.get(user__username="customer").name})
+        self.assertEqual(response.json(), [])
+
+    def test_company_handover_changes_principals(self):
+        admin, customer = User.objects.get(username="admin"), User.objects.get(username="customer")
+        company = Company.objects.get(manager=admin)
+        resolve_token(admin.auth_token.name)
+        resolve_token(customer.auth_token.name)
+
+        company.manager = customer
+        company.save()
+        self.assertIsNone(resolve_token(admin.auth_token.name).company_id)
+        self.assertEqual(resolve_token(customer.auth_token.name).company_id, company.id)
+
+        response = Client().post(reverse('flight:update_airline', kwargs={'airline': company.id}),
+                                 {'token': admin.auth_token.name})
+        self.assertEqual(response.status_code, 403)
+
+    def test_session_principal_is_cached(self):
+        client = Client()
+        client.force_login(User.objects.get(username="customer"))
+        client.get(reverse('flight:list_ticket'))
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(reverse('flight:list_ticket'))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('accounts_customer' in query['sql'] for query in context.captured_queries))
+        self.assertContains(response, reverse('flight:list_ticket'))
+
+
+class RequestMetricsTest(BaseTest):
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0)
+    def test_server_timing(self):
+        client = Client()
+        with self.assertLogs('airline.metrics', level='INFO') as logs:
+            response = client.get(reverse('flight:all_flights'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+        self.assertIn('view;dur=', response['Server-Timing'])
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], reverse('flight:all_flights'))
+        self.assertEqual(record['queries'], 1)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0, REQUEST_METRICS_N_PLUS_ONE_THRESHOLD=1)
+    def test_n_plus_one_is_flagged(self):
+        def get_response(request):
+            # Lazy loads the origin of every flight
+            return HttpResponse(', '.join(flight.origin.name for flight in Flight.objects.all()))
+
+        with self.assertLogs('airline.metrics', level='WARNING') as logs:
+            RequestMetricsMiddleware(get_response)(RequestFactory().get('/'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertTrue(any('"flight_country"' in sql for sql in record['repeated_queries']))
+
+    def test_sampling_disabled(self):
+        client = Client()
+        response = client.get(reverse('flight:all_flights'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class ResponseCacheTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_response_is_cached_until_write(self):
+        client = Client()
+        url = reverse('flight:all_countries')
+        response = client.get(url)
+        with self.assertNumQueries(0):
+            cached = client.get(url)
+        self.assertEqual(cached.json(), response.json())
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        Country.objects.create(name="Sudan")
+        response = client.get(url)
+        self.assertIn("Sudan", [row['name'] for row in response.json()])
+        self.assertNotEqual(cached['ETag'], response['ETag'])
+
+    def test_country_deletion_invalidates_airlines(self):
+        client = Client()
+        company = Company.objects.first()
+        url = reverse('flight:airline_by_id', kwargs={'airline_id': company.id})
+        self.assertEqual(client.get(url).json()['country'], company.country_id)
+
+        company.country.delete()
+        self.assertIsNone(client.get(url).json()['country'])
+
+    def test_not_modified(self):
+        client = Client()
+        url = reverse('flight:all_airlines')
+        etag = client.get(url)['ETag']
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+        Company.objects.update(name="Renamed")
+        Company.objects.first().save()
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AsyncFacadeTest(BaseTest):
+
+    async def test_async_views(self):
+        factory = AsyncRequestFactory()
+        flight = await async_views.alist(Flight.objects.order_by('id'))
+
+        response = await async_views.get_all_flights(factory.get('/', {'limit': 1}))
+        self.assertEqual([row['id'] for row in json.loads(response.content)], [flight[0].id])
+        self.assertEqual(int(response['X-Next-Cursor']), flight[0].id)
+
+        response = await async_views.get_flight_by_id(factory.get('/'), flight_id=flight[1].id)
+        self.assertEqual(json.loads(response.content)['id'], flight[1].id)
+
+        response = await async_views.get_all_countries(factory.get('/'))
+        self.assertEqual(len(json.loads(response.content)), 2)
+        self.assertTrue(response.has_header('ETag'))
+
+        response = await async_views.get_all_flights(factory.get('/', {'stream': 'json'}))
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkFlightUpdateTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.get(user__username="admin").name
+        self.flights = list(Flight.objects.order_by('id'))
+
+    def update(self, changes):
+        return Client().post(reverse('flight:update_flights'), {'token': self.token, 'flights': json.dumps(changes)})
+
+    def test_schedule_shift(self):
+        shift = datetime.timedelta(hours=2)
+        changes = [{'id': flight.id, 'departure_time': (flight.departure_time + shift).isoformat(),
+                    'landing_time': (flight.landing_time + shift).isoformat()} for flight in self.flights]
+        changes[0]['num_of_tickets'] = 50
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.update(changes)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['updated', 'updated'])
+
+        update = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "flight_flight"')]
+        self.assertEqual(len(update), 1)
+        self.assertNotIn('"origin_id"', update[0])
+        self.assertNotIn('"seats_sold"', update[0])
+
+        for flight in self.flights:
+            updated = Flight.objects.get(id=flight.id)
+            self.assertEqual(updated.departure_time, flight.departure_time + shift)
+            self.assertEqual(FlightSearch.objects.get(flight=flight).departure_time, updated.departure_time)
+        self.assertEqual(FlightSearch.objects.get(flight=self.flights[0]).seats_left, 50)
+
+    def test_all_or_nothing(self):
+        other = Flight.objects.create(company=Company.objects.create(name="Other"), origin=self.flights[0].origin,
+                                      destination=self.flights[0].destination, num_of_tickets=5,
+                                      departure_time=self.flights[0].departure_time,
+                                      landing_time=self.flights[0].landing_time)
+        response = self.update([{'id': self.flights[0].id, 'price': '10.5'}, {'id': other.id, 'price': '1'},
+                                {'id': self.flights[1].id, 'destination': self.flights[1].origin_id},
+                                {'id': missing_id(Flight), 'num_of_tickets': 0}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.json()['results']],
+                         ['updated', 'error', 'error', 'error'])
+        self.assertIsNone(Flight.objects.get(id=self.flights[0].id).price)
+
+        self.assertEqual(self.update([{'id': self.flights[0].id, 'seats_sold': 0}]).status_code, 400)
+        response = self.update([{'id': self.flights[0].id, 'departure_time': '2030-02-30T10:00', 'origin': [1]},
+                                {'id': self.flights[1].id, 'destination': True, 'price': [1]}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['errors'] for result in response.json()['results']], [
+            ['departure_time should be an ISO 8601 date time', 'origin country does not exist'],
+            ['destination country does not exist', 'price: “[1]” value must be a decimal number.'],
+        ])
+        self.assertEqual(self.update({'id': 1}).status_code, 400)
+
+
+class RouteStatsTest(BaseTest):
+
+    @staticmethod
+    def rollup():
+        # Rows emptied by incremental updates are left behind, a rebuild doesn't create them
+        rows = RouteDailyStats.objects.exclude(flights=0, seats=0, tickets=0, canceled=0, revenue=0)
+        return sorted(rows.values_list('date', 'company_id', 'origin_id', 'destination_id', 'flights', 'seats',
+                                       'tickets', 'canceled', 'revenue'), key=str)
+
+    def assertRollupIsConsistent(self):
+        incremental = self.rollup()
+        call_command('rebuild_route_stats', stdout=io.StringIO())
+        self.assertEqual(incremental, self.rollup())
+
+    def test_incremental_rollup_matches_rebuild(self):
+        flight, other = Flight.objects.order_by('id')
+        customer = Customer.objects.first()
+        flight.price = 100
+        flight.save()
+        ticket = Ticket.objects.create(customer=customer, flight=flight)
+        Ticket.objects.book_many([(other.id, customer.id)])
+        self.assertRollupIsConsistent()
+
+        ticket.status = TicketStatus.Canceled
+        ticket.save()
+        flight.refresh_from_db()
+        flight.price = 80
+        flight.save()
+        self.assertEqual(RouteDailyStats.objects.get(origin=flight.origin, destination=flight.destination).canceled, 1)
+        self.assertRollupIsConsistent()
+
+        later = flight.departure_time + datetime.timedelta(days=3)
+        Flight.objects.update_many(flight.company_id, [(flight.id, {'departure_time': later.isoformat(),
+                                                                    'landing_time': (later + datetime.timedelta(
+                                                                        hours=2)).isoformat()})])
+        self.assertRollupIsConsistent()
+
+        Ticket.objects.get(id=ticket.id).delete()
+        Flight.objects.get(id=other.id).delete()
+        Company.objects.first().delete()
+        self.assertRollupIsConsistent()
+
+    def test_bookings_do_not_read_the_flight_again(self):
+        flight, other = Flight.objects.order_by('id')
+        customer = Customer.objects.first()
+        with CaptureQueriesContext(connection) as context:
+            ticket = Ticket.objects.create(customer=customer, flight=flight)
+            Ticket.objects.book_many([(other.id, customer.id)])
+            Ticket.objects.select_related('flight').get(id=ticket.id).delete()
+        flight_reads = [query['sql'] for query in context.captured_queries
+                        if query['sql'].startswith('SELECT') and 'FROM "flight_flight"' in query['sql']]
+        # The lock of the group booking only, the deletion joins the flight to its ticket
+        self.assertEqual(len(flight_reads), 1)
+        self.assertRollupIsConsistent()
+
+    def test_analytics(self):
+        flight = Flight.objects.order_by('id').first()
+        Ticket.objects.create(customer=Customer.objects.first(), flight=flight)
+        day = timezone.localdate(flight.departure_time).isoformat()
+
+        client = Client()
+        response = client.get(reverse('flight:analytics', kwargs={'group': 'route'}),
+                              {'token': Token.objects.get(user__username="admin").name, 'start': day, 'end': day})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual((data['summary']['flights'], data['summary']['seats'], data['summary']['tickets']), (2, 20, 1))
+        self.assertEqual(data['summary']['load_factor'], 0.05)
+        self.assertEqual(data['summary']['load_factor_p90'], 0.09)
+
+        response = client.get(reverse('flight:analytics', kwargs={'group': 'company'}),
+                              {'token': Token.objects.get(user__username="customer").name})
+        self.assertEqual(response.status_code, 403)
+        response = client.get(reverse('flight:analytics', kwargs={'group': 'seat'}),
+                              {'token': Token.objects.get(user__username="admin").name})
+        self.assertEqual(response.status_code, 400)
+
+
+class ArchiveTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.flight, self.other = Flight.objects.order_by('id')
+        Ticket.objects.create(customer=Customer.objects.first(), flight=self.flight)
+        departed = timezone.now() - datetime.timedelta(days=10)
+        Flight.objects.filter(id=self.flight.id).update(departure_time=departed,
+                                                        landing_time=departed + datetime.timedelta(hours=2))
+        call_command('rebuild_route_stats', stdout=io.StringIO())
+
+    def test_landed_flights_are_archived(self):
+        rollup = RouteStatsTest.rollup()
+        call_command('archive_flights', days=1, batch_size=1, stdout=io.StringIO())
+
+        self.assertFalse(Flight.objects.filter(id=self.flight.id).exists())
+        self.assertFalse(FlightSearch.objects.filter(flight_id=self.flight.id).exists())
+        self.assertFalse(Ticket.objects.exists())
+        self.assertTrue(Flight.objects.filter(id=self.other.id).exists())
+        archived = ArchivedFlight.objects.get(id=self.flight.id)
+        self.assertEqual((archived.seats_sold, archived.origin_id), (1, self.flight.origin_id))
+        self.assertEqual(list(ArchivedTicket.objects.values_list('flight_id', 'status')),
+                         [(self.flight.id, TicketStatus.Booked)])
+
+        # The rollup keeps the archived flights, and so does its rebuild
+        self.assertEqual(RouteStatsTest.rollup(), rollup)
+        call_command('rebuild_route_stats', stdout=io.StringIO())
+        self.assertEqual(RouteStatsTest.rollup(), rollup)
+
+    def test_reads_fall_back_to_the_archive(self):
+        client = Client()
+        live = client.get(reverse('flight:flight_by_id', kwargs={'flight_id': self.flight.id})).json()
+        call_command('archive_flights', days=1, stdout=io.StringIO())
+
+        response = client.get(reverse('flight:flight_by_id', kwargs={'flight_id': self.flight.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), live)
+        request = AsyncRequestFactory().get('/')
+        response = async_to_sync(async_views.get_flight_by_id)(request, self.flight.id)
+        self.assertEqual(json.loads(response.content), live)
+        response = client.get(reverse('flight:flight_by_id', kwargs={'flight_id': self.flight.id + 100}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_customers_keep_their_archived_tickets(self):
+        customer = Customer.objects.first()
+        live = Ticket.objects.create(customer=customer, flight=self.other)
+        call_command('archive_flights', days=1, stdout=io.StringIO())
+        archived = ArchivedTicket.objects.get()
+
+        token = Token.objects.get(user=customer.user).name
+        response = Client().get(reverse('flight:own_tickets'), {'token': token})
+        self.assertEqual([ticket['id'] for ticket in response.json()], sorted([archived.id, live.id]))
+        response = Client().get(reverse('flight:own_tickets'), {'token': token, 'limit': 1})
+        self.assertEqual(len(response.json()), 1)
+        response = Client().get(reverse('flight:own_tickets'), {'token': token, 'cursor': response['X-Next-Cursor']})
+        self.assertEqual(len(response.json()), 1)
+
+        client = Client()
+        client.force_login(customer.user)
+        response = client.get(reverse('flight:list_ticket'))
+        self.assertEqual(list(response.context['tickets']), [live])
+        self.assertEqual(list(response.context['archived_tickets']), [archived])
+        self.assertContains(response, 'Past Tickets')
+
+
+class GroupBookingTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.get(user__username="customer").name
+        self.admin_token = Token.objects.get(user__username="admin").name
+        self.customers = [Customer.objects.get(user__username="customer")]
+        for i in range(2):
+            user = User.objects.create(username=f"group_{i}", password="group123", role=UserRole.objects.get(name="customer"))
+            self.customers.append(Customer.objects.create(user=user, phone_number="1234556891",
+                                                          credit_card="123456784523456"))
+
+    def book(self, items, token: str = None):
+        # Admins book for any customer, customers for themselves only
+        client = Client()
+        tickets = json.dumps([{'flight': flight.id, 'customer': customer.id} for flight, customer in items])
+        return client.post(reverse('flight:add_tickets'), {'token': token or self.admin_token, 'tickets': tickets},
+                           HTTP_ACCEPT='application/json')
+
+    def test_customers_book_for_themselves_only(self):
+        flight = Flight.objects.order_by('id').first()
+        response = self.book([(flight, self.customers[0]), (flight, self.customers[1])], token=self.token)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual((Ticket.objects.count(), Flight.objects.get(id=flight.id).seats_sold), (0, 0))
+
+        response = self.book([(flight, self.customers[0])], token=self.token)
+        self.assertEqual(response.status_code, 200)
+
+    def test_group_is_booked(self):
+        first, second = Flight.objects.order_by('id')[:2]
+        response = self.book([(first, customer) for customer in self.customers] + [(second, self.customers[0])])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertTrue(all(result['status'] == 'booked' for result in results))
+        self.assertEqual(Ticket.objects.count(), 4)
+        self.assertEqual(Flight.objects.get(id=first.id).seats_sold, 3)
+        self.assertEqual(Flight.objects.get(id=second.id).seats_sold, 1)
+
+    def test_group_fails_as_a_unit(self):
+        first, second = Flight.objects.order_by('id')[:2]
+        Flight.objects.filter(id=second.id).update(num_of_tickets=1)
+        response = self.book([(first, self.customers[0]), (second, self.customers[1]), (second, self.customers[2])])
+        self.assertEqual(response.status_code, 400)
+
+        statuses = [result['status'] for result in response.json()['results']]
+        self.assertEqual(statuses, ['not_booked', 'error', 'error'])
+        self.assertEqual(Ticket.objects.count(), 0)
+        self.assertEqual(Flight.objects.get(id=first.id).seats_sold, 0)
+
+        response = self.book([(first, self.customers[0]), (first, self.customers[0])])
+        self.assertEqual(response.json()['results'][1]['error'], 'Duplicated ticket')
+
+        client = Client()
+        response = client.post(reverse('flight:add_tickets'), {'token': self.token, 'tickets': '[{"flight": 1}]'},
+                               HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class FlightSearchTest(BaseTest):
+
+    def test_projection_follows_writes(self):
+        flight = Flight.objects.order_by('id').first()
+        row = FlightSearch.objects.get(flight=flight)
+        self.assertEqual((row.company_name, row.origin_name, row.destination_name, row.seats_left),
+                         (flight.company.name, flight.origin.name, flight.destination.name, flight.num_of_tickets))
+
+        Ticket.objects.create(flight=flight, customer=Customer.objects.first())
+        self.assertEqual(FlightSearch.objects.get(flight=flight).seats_left, flight.num_of_tickets - 1)
+        Ticket.objects.filter(flight=flight).first().delete()
+        self.assertEqual(FlightSearch.objects.get(flight=flight).seats_left, flight.num_of_tickets)
+
+        flight.price = 42
+        flight.save()
+        self.assertEqual(FlightSearch.objects.get(flight=flight).price, 42)
+
+        flight.company.name = 'Renamed'
+        flight.company.save()
+        flight.origin.name = 'Somewhere'
+        flight.origin.save()
+        row = FlightSearch.objects.get(flight=flight)
+        self.assertEqual((row.company_name, row.origin_name), ('Renamed', 'Somewhere'))
+
+        flight.origin.delete()
+        row = FlightSearch.objects.get(flight=flight)
+        self.assertEqual((row.origin_id, row.origin_name), (None, ''))
+
+        flight.delete()
+        self.assertFalse(FlightSearch.objects.filter(flight_id=flight.id).exists())
+
+    def test_search_is_one_query(self):
+        flight = Flight.objects.order_by('id').first()
+        client = Client()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(reverse('flight:search_flight'), {'origin': flight.origin_id,
+                                                                    'company': flight.company_id})
+        self.assertContains(response, flight.origin.name)
+        self.assertEqual(len(response.context['object_list']), 1)
+
+        search = [query['sql'] for query in context.captured_queries
+                  if 'FROM "flight_flightsearch"' in query['sql'] and 'COUNT(' not in query['sql']]
+        self.assertEqual(len(search), 1)
+        self.assertNotIn('JOIN', search[0])
+
+    def test_rebuild(self):
+        FlightSearch.objects.all().delete()
+        call_command('rebuild_flight_search', stdout=io.StringIO())
+        self.assertEqual(FlightSearch.objects.count(), Flight.objects.count())
+
+
+class FlightImportTest(BaseTest):
+
+    schedule = (
+        "origin,destination,departure_time,landing_time,num_of_tickets,price\n"
+        "egypt,Morocco,2030-01-01T10:00,2030-01-01T14:00,120,99.5\n"
+        "{morocco},Egypt,2030-01-02T10:00:00+00:00,2030-01-02T14:00:00+00:00,,\n"
+        "Egypt,Egypt,2030-01-03T10:00,2030-01-03T14:00,10,\n"
+        "Atlantis,Egypt,2030-01-03T10:00,soon,0,\n"
+        "Egypt,Morocco,2030-02-30T10:00,2030-03-01T14:00,10,\n"
+    )
+
+    def test_import_endpoint(self):
+        company = Company.objects.first()
+        schedule = self.schedule.format(morocco=Country.objects.get(name="Morocco").id)
+        flights = Flight.objects.count()
+
+        client = Client()
+        response = client.post(reverse('flight:import_flights'), {
+            'token': company.manager.auth_token.name,
+            'schedule': SimpleUploadedFile('schedule.csv', schedule.encode()),
+        })
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (2, 3))
+        self.assertEqual([error['row'] for error in report['errors']], [4, 5, 6])
+        self.assertEqual(len(report['errors'][1]['errors']), 3)
+        self.assertEqual(report['errors'][2]['errors'], ['departure_time should be an ISO 8601 date time'])
+
+        imported = Flight.objects.filter(company=company, departure_time__year=2030).order_by('departure_time')
+        self.assertEqual(Flight.objects.count(), flights + 2)
+        self.assertEqual([flight.num_of_tickets for flight in imported], [120, 10])
+        self.assertEqual(FlightSearch.objects.filter(flight__in=imported).count(), 2)
+
+        response = client.post(reverse('flight:import_flights'), {
+            'token': Token.objects.get(user__username="customer").name,
+            'schedule': SimpleUploadedFile('schedule.csv', schedule.encode()),
+        })
+        self.assertEqual(response.status_code, 403)
+
+    def test_import_command(self):
+        rows = [{'origin': 'Egypt', 'destination': 'Morocco', 'departure_time': f'2030-02-{day:02}T08:00',
+                 'landing_time': f'2030-02-{day:02}T11:00'} for day in range(1, 6)]
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as file:
+            file.write('\n'.join(json.dumps(row) for row in rows) + '\nnot json\n')
+        try:
+            call_command('import_flights', file.name, company=first_id(Company), chunk_size=2, dry_run=True,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+            self.assertFalse(Flight.objects.filter(departure_time__year=2030).exists())
+
+            stderr = io.StringIO()
+            call_command('import_flights', file.name, company=first_id(Company), chunk_size=2,
+                         stdout=io.StringIO(), stderr=stderr)
+        finally:
+            os.unlink(file.name)
+        self.assertEqual(Flight.objects.filter(departure_time__year=2030).count(), 5)
+        self.assertEqual(FlightSearch.objects.filter(departure_time__year=2030).count(), 5)
+        self.assertIn('row 6', stderr.getvalue())
+
+
+class DataGenerationTest(TestCase):
+
+    def test_generated_data_reaches_every_projection(self):
+        call_command('upload_data', scale=0.001, batch_size=7, stdout=io.StringIO())
+        self.assertEqual((Country.objects.count(), Company.objects.count(), Customer.objects.count()), (2, 1, 10))
+        self.assertEqual((Flight.objects.count(), Ticket.objects.count()), (20, 100))
+
+        flights = Flight.objects.order_by('id')
+        self.assertEqual(sum(flight.seats_sold for flight in flights), 100)
+        self.assertEqual(list(FlightSearch.objects.order_by('flight_id').values_list('flight_id', 'seats_left')),
+                         [(flight.id, flight.num_of_tickets - flight.seats_sold) for flight in flights])
+        rollup = RouteStatsTest.rollup()
+        self.assertEqual(sum(row[6] for row in rollup), 100)
+        call_command('rebuild_route_stats', stdout=io.StringIO())
+        self.assertEqual(RouteStatsTest.rollup(), rollup)
+
+
+class BenchTest(TestCase):
+
+    def test_every_end_point_is_benchmarked(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('bench', iterations=1, warmup=0, countries=3, companies=1, customers=5, flights=5, tickets=10,
+                     stdout=stdout, stderr=stderr)
+        report = json.loads(stdout.getvalue())
+        self.assertNotIn('No benchmark for', stderr.getvalue())
+        self.assertEqual(report['dataset'], {'countries': 3, 'companies': 1, 'customers': 5, 'flights': 5,
+                                             'tickets': 10})
+        self.assertIn('flight:analytics', report['endpoints'])
+        for name, result in report['endpoints'].items():
+            self.assertLessEqual({'iterations', 'status_codes', 'p50_ms', 'p95_ms', 'p99_ms', 'requests_per_sec',
+                                  'queries', 'peak_memory_kb'}, set(result), name)
+            self.assertTrue(all(status < 500 for status in result['status_codes']), name)
+        self.assertTrue(RouteDailyStats.objects.exists())
+        self.assertEqual(FlightSearch.objects.filter(flight__company__name__startswith='Airline').count(), 5)
+
+
+class ExportTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.admin_token = Token.objects.get(user__username="admin").name
+        Ticket.objects.create(customer=Customer.objects.first(), flight=Flight.objects.order_by('id').first())
+
+    def export(self, name: str, token: str = None, **params):
+        return Client().get(reverse('flight:export_data', kwargs={'name': name}),
+                            {'token': token or self.admin_token, **params})
+
+    def test_csv_export(self):
+        response = self.export('flights', columns='id,origin,seats_sold')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="flights.csv"')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['id', 'origin', 'seats_sold'])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         [str(flight_id) for flight_id in Flight.objects.order_by('id').values_list('id', flat=True)])
+        self.assertEqual((rows[1][1], rows[1][2]), ("Egypt", "1"))
+
+        self.assertEqual(self.export('flights', columns='id,credit_card').status_code, 400)
+        self.assertEqual(self.export('payments').status_code, 400)
+
+    def test_gzip_ndjson_export(self):
+        response = self.export('tickets', format='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['status'] for line in lines], ['Booked'])
+
+        response = self.export('customers', format='ndjson')
+        self.assertNotIn('credit_card', json.loads(b''.join(response.streaming_content).decode().splitlines()[0]))
+
+    def test_export_scope(self):
+        company = Company.objects.create(name="Second Airline", manager=User.objects.get(username="customer"))
+        token = Token.objects.get(user__username="customer").name
+        response = self.export('flights', token=token)
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines()[1:], [])
+        self.assertEqual(self.export('customers', token=token).status_code, 403)
+
+        stdout = io.StringIO()
+        call_command('export_data', 'flights', columns='id', company=company.id, stdout=stdout)
+        self.assertEqual(stdout.getvalue(), 'id\r\n')
+
+
+class ItineraryTest(TestCase):
+
+    def setUp(self):
+        flight_graph.clear()
+        self.a, self.b, self.c, self.d = (Country.objects.create(name=name) for name in 'ABCD')
+        self.day = (timezone.now() + datetime.timedelta(days=2)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.direct = self.flight(self.a, self.d, 9, 20, 500)
+        self.first = self.flight(self.a, self.b, 8, 10, 100)
+        self.one_stop = self.flight(self.b, self.d, 11, 13, 100)
+        self.too_short = self.flight(self.b, self.d, 10.25, 12, 10)
+        self.flight(self.b, self.c, 12, 13, 50)
+        self.flight(self.c, self.d, 14, 15, 50)
+
+    def flight(self, origin, destination, departure: float, landing: float, price: int):
+        return Flight.objects.create(origin=origin, destination=destination, price=price, num_of_tickets=10,
+                                     departure_time=self.day + datetime.timedelta(hours=departure),
+                                     landing_time=self.day + datetime.timedelta(hours=landing))
+
+    def search(self, **params):
+        url = reverse('flight:itineraries', args=[self.a.id, self.d.id, self.day.date().isoformat()])
+        response = Client().get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [[flight['id'] for flight in itinerary['flights']] for itinerary in response.json()]
+
+    def test_connections_are_ranked(self):
+        by_duration = self.search()
+        self.assertEqual(by_duration[0], [self.first.id, self.one_stop.id])
+        self.assertEqual(len(by_duration), 3)
+        self.assertNotIn(self.too_short.id, sum(by_duration, []))
+        self.assertEqual(self.search(sort='price')[0][0], self.first.id)
+        self.assertEqual(self.search(sort='price')[-1], [self.direct.id])
+        self.assertEqual(self.search(max_stops=0), [[self.direct.id]])
+        self.assertEqual(len(self.search(max_stops=1)), 2)
+
+        response = Client().get(reverse('flight:itineraries', args=[self.a.id, self.d.id, 'tomorrow']))
+        self.assertEqual(response.status_code, 400)
+
+    def test_graph_is_updated_incrementally(self):
+        self.search()
+        with self.captureOnCommitCallbacks(execute=True):
+            late = self.flight(self.b, self.d, 10.75, 11.75, 10)
+        self.assertEqual(self.search()[0], [self.first.id, late.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            late.num_of_tickets = 1
+            late.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(flight=late, customer=None)
+        self.assertNotIn(late.id, sum(self.search(), []))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.one_stop.delete()
+        self.assertEqual(len(self.search(max_stops=1)), 1)
+
+    def test_rebuild_does_not_block_searches(self):
+        test = self
+
+        class Graph(FlightGraph):
+            def rows(self, **filters):
+                if 'departure_time__gte' in filters and self.built_at is not None:
+                    # A search of another thread, and a write, while the graph is rebuilt
+                    searcher = threading.Thread(target=lambda: self.search(test.a.id, test.d.id, test.day,
+                                                                           test.day + datetime.timedelta(days=1)))
+                    searcher.start()
+                    searcher.join(timeout=5)
+                    test.assertFalse(searcher.is_alive())
+                    self.refresh_flight(test.direct.id)
+                return super().rows(**filters)
+
+        graph = Graph(ttl=0)
+        graph.build()
+        FlightSearch.objects.filter(flight_id=self.direct.id).update(seats_left=3)
+        graph.ensure_built()
+        self.assertEqual(graph.legs[self.direct.id].seats_left, 3)
+
+
+class FareCalendarTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.a, self.b, self.c = (Country.objects.create(name=name) for name in 'ABC')
+        self.day = (timezone.now() + datetime.timedelta(days=2)).replace(hour=8, minute=0, second=0, microsecond=0)
+        self.cheap = self.flight(self.day, 100)
+        self.flight(self.day + datetime.timedelta(hours=6), 300)
+        self.flight(self.day + datetime.timedelta(days=1), 200)
+
+    def flight(self, departure, price):
+        return Flight.objects.create(origin=self.a, destination=self.b, price=price, num_of_tickets=10,
+                                     departure_time=departure, landing_time=departure + datetime.timedelta(hours=2))
+
+    def calendar(self, **headers):
+        params = {'start': self.day.date().isoformat(), 'end': (self.day.date() + datetime.timedelta(days=3)).isoformat()}
+        return Client().get(reverse('flight:fare_calendar', args=[self.a.id, self.b.id]), params, **headers)
+
+    def test_calendar_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.calendar()
+        days = response.json()
+        self.assertEqual([(day['date'], float(day['min_price']), day['flights'], day['seats_left']) for day in days], [
+            (self.day.date().isoformat(), 100, 2, 20),
+            ((self.day + datetime.timedelta(days=1)).date().isoformat(), 200, 1, 10),
+        ])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.calendar().json(), days)
+        self.assertEqual(self.calendar(HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(Client().get(reverse('flight:fare_calendar', args=[self.a.id, self.b.id]),
+                                      {'start': self.day.date().isoformat(), 'end': 'soon'}).status_code, 400)
+
+    def test_flight_writes_invalidate_the_route(self):
+        self.calendar()
+        self.cheap = Flight.objects.get(id=self.cheap.id)
+        self.cheap.destination = self.c
+        self.cheap.save()
+        first_day = self.calendar().json()[0]
+        self.assertEqual((float(first_day['min_price']), first_day['flights']), (300, 1))
+
+        response = Client().get(reverse('flight:fare_calendar', args=[self.a.id, self.c.id]),
+                                {'start': self.day.date().isoformat()})
+        self.assertEqual(response.json()[0]['flights'], 1)
+
+
+class AdminTest(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.client.force_login(User.objects.create_superuser(username="root", password="root123"))
+        self.flight = Flight.objects.order_by('id').first()
+        self.flight.num_of_tickets = 100
+        self.flight.save()
+
+    def add_tickets(self, count: int):
+        role = UserRole.objects.get(name="customer")
+        for i in range(count):
+            user = User.objects.create(username=f"admin_test_{Ticket.objects.count()}_{i}", role=role)
+            Ticket.objects.create(flight=self.flight, customer=Customer.objects.create(user=user))
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelists_do_not_scale_with_rows(self):
+        urls = [reverse('admin:flight_flight_changelist'), reverse('admin:flight_ticket_changelist'),
+                reverse('admin:flight_company_changelist'), reverse('admin:accounts_customer_changelist')]
+        self.add_tickets(2)
+        # The first requests also warm the content types cache
+        queries = [self.count_queries(url) for url in urls + urls][len(urls):]
+        self.add_tickets(5)
+        self.assertEqual([self.count_queries(url) for url in urls], queries)
+
+    def test_ticket_inline_is_capped(self):
+        url = reverse('admin:flight_flight_change', args=[self.flight.id])
+        self.add_tickets(3)
+        self.client.get(url)
+        queries = self.count_queries(url)
+        self.add_tickets(TICKET_INLINE_LIMIT)
+        self.assertEqual(self.count_queries(url), queries)
+        response = self.client.get(url)
+        self.assertEqual(response.context['inline_admin_formsets'][0].formset.initial_form_count(), TICKET_INLINE_LIMIT)
+
+
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.router.replica = 'replica'
+        self.tokens = begin_request(False)
+        self.addCleanup(end_request, self.tokens)
+        self.addCleanup(cache.clear)
+
+    def test_reads_follow_writes(self):
+        self.assertEqual(self.router.db_for_read(Flight), 'replica')
+        self.assertEqual(self.router.db_for_read(Session), None)
+        self.router.db_for_write(Session)
+        self.assertEqual(self.router.db_for_read(Flight), 'replica')
+
+        self.assertEqual(self.router.db_for_write(Ticket), 'default')
+        self.assertEqual(self.router.db_for_read(Flight), 'default')
+        self.assertEqual(self.router.db_for_read(Customer), 'default')
+
+        end_request(begin_request(True))
+        self.assertEqual(self.router.db_for_read(Flight), 'default')
+
+    def test_client_is_pinned_after_a_write(self):
+        seen = []
+
+        def get_response(request):
+            seen.append(self.router.db_for_read(Flight))
+            if request.method == 'POST':
+                self.router.db_for_write(Ticket)
+            return HttpResponse()
+
+        middleware = ReadYourWritesMiddleware(get_response)
+        factory = RequestFactory()
+        response = middleware(factory.post('/', {'token': 'abc'}))
+        self.assertIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+
+        middleware(factory.get('/'))
+        middleware(factory.get('/', {'token': 'abc'}))
+        request = factory.get('/')
+        request.COOKIES[ReadYourWritesMiddleware.cookie_name] = '1'
+        middleware(request)
+        self.assertEqual(seen, ['replica', 'replica', 'default', 'default'])
+
+    def test_async_requests_are_pinned_after_a_write(self):
+        async def get_response(request):
+            await sync_to_async(self.router.db_for_write)(Ticket)
+            return HttpResponse()
+
+        middleware = ReadYourWritesMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(AsyncRequestFactory().get('/', {'token': 'abc'}))
+        self.assertIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+        self.assertIsNotNone(cache.get('primary-pin:abc'))
+
+    def test_writes_outside_requests_do_not_pin(self):
+        def command():
+            self.router.db_for_write(Ticket)
+            return self.router.db_for_read(Flight)
+
+        self.assertEqual(contextvars.Context().run(command), 'replica')
+
+
+class SignedTokenAuthTest(BaseTest):
+
+    def test_auth_view_accepts_signed_tokens(self):
+        customer = User.objects.get(username="customer")
+        response = Client().get(reverse('accounts:user_token'),
+                                {'username': customer.username, 'password': customer.password, 'signed': '1'})
+        token = response.json()['token']
+        Ticket.objects.create(customer=Customer.objects.get(user=customer), flight=Flight.objects.first())
+
+        revocations.refresh()
+        with CaptureQueriesContext(connection) as context:
+            response = Client().get(reverse('flight:own_tickets'), {'token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertFalse(any('accounts_token' in query['sql'] for query in context.captured_queries))
+
+        response = Client().get(reverse('flight:all_customers'), {'token': token})
+        self.assertEqual(response.status_code, 400)
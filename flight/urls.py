@@ -1,13 +1,16 @@
+from django.conf import settings
 from django.urls import path
 
 from .views import (
     # Anonymous Facade
     get_all_flights, get_flight_by_id, get_flights_by_parameters, get_all_airlines,
-    get_airline_by_id, get_airline_by_parameters, get_all_countries, get_country_by_id,
+    get_airline_by_id, get_airline_by_parameters, get_all_countries, get_country_by_id, get_itineraries,
+    get_fare_calendar,
 
     # Customer Facade
     update_customer,
     add_ticket,
+    add_tickets,
     remove_ticket,
     get_my_tickets,
 
@@ -15,7 +18,9 @@ from .views import (
     get_my_flights,
     update_airline,
     add_flight,
+    import_flights,
     update_flight,
+    update_flights,
     remove_flight,
 
     # Admin Facade
@@ -26,6 +31,9 @@ from .views import (
     remove_airline,
     remove_customer,
     remove_administrator,
+    get_cache_stats,
+    export_data,
+    get_analytics,
 
     # Custom Views
     SearchFlightView,
@@ -34,6 +42,12 @@ from .views import (
     TicketListView
     )
 
+if getattr(settings, 'ASYNC_ANONYMOUS_FACADE', False):
+    from .async_views import (
+        get_all_flights, get_flight_by_id, get_flights_by_parameters, get_all_airlines,
+        get_airline_by_id, get_airline_by_parameters, get_all_countries, get_country_by_id
+    )
+
 
 app_name = 'flight'
 
@@ -43,6 +57,10 @@ urlpatterns = [
     path('flight-by-id/<int:flight_id>', get_flight_by_id, name='flight_by_id'),
     path('flight-by-parameters/<int:origin_country_id>/<int:destination_country_id>/<str:date>',
          get_flights_by_parameters, name='flight_by_parameters'),
+    path('itineraries/<int:origin_country_id>/<int:destination_country_id>/<str:date>', get_itineraries,
+         name='itineraries'),
+    path('fare-calendar/<int:origin_country_id>/<int:destination_country_id>', get_fare_calendar,
+         name='fare_calendar'),
     path('all-airlines/', get_all_airlines, name='all_airlines'),
     path('airline-by-id/<int:airline_id>', get_airline_by_id, name='airline_by_id'),
     path('airlines-by-parameters/<str:company_name>', get_airline_by_parameters, name='airline_by_parameters'),
@@ -52,6 +70,7 @@ urlpatterns = [
     # Customer Facade
     path('update-customer/<int:customer>', update_customer, name='update_customer'),
     path('add-ticket', add_ticket, name='add_ticket'),
+    path('add-tickets', add_tickets, name='add_tickets'),
     path('remove-ticket/<int:ticket_id>', remove_ticket, name='remove_ticket'),
     path('get-my-tickets', get_my_tickets, name='own_tickets'),
 
@@ -59,7 +78,9 @@ urlpatterns = [
     path('own-flights', get_my_flights, name='own_flights'),
     path('update_airline/<int:airline>', update_airline, name='update_airline'),
     path('add-flight', add_flight, name='add_flight'),
+    path('import-flights', import_flights, name='import_flights'),
     path('update-flight/<int:flight>', update_flight, name='update_flight'),
+    path('update-flights', update_flights, name='update_flights'),
     path('remove-flight/<int:flight>', remove_flight, name='remove_flight'),
 
     # Admin Facade
@@ -70,6 +91,13 @@ urlpatterns = [
     path('remove_airline/<int:airline>', remove_airline, name='remove_airline'),
     path('remove_customer/<int:customer>', remove_customer, name='remove_customer'),
     path('remove_administrator/<int:administrator>', remove_administrator, name='remove_administrator'),
+    path('cache-stats', get_cache_stats, name='cache_stats'),
+
+    # Analytics Facade
+    path('analytics/<str:group>', get_analytics, name='analytics'),
+
+    # Export Facade
+    path('export/<str:name>', export_data, name='export_data'),
 
     # Views
     path('search/', SearchFlightView.as_view(), name='search_flight'),
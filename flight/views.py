@@ -1,38 +1,117 @@
+import csv
 import json
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
+from django.conf import settings
 from django.contrib import messages
+from django.core.cache import cache
+from django.utils import timezone
 from django.urls import reverse_lazy
 from django.forms.models import model_to_dict
 from django.views.generic.list import ListView
 from django.views.generic.edit import UpdateView
 from django.views.generic.detail import DetailView
 from django.shortcuts import redirect, get_object_or_404
-from django.core.serializers.json import DjangoJSONEncoder
-from django.http.response import JsonResponse, HttpResponseForbidden
-
-from .decorators import auth_view, CustomerRequired
+from django.core.validators import ValidationError
+from django.http.response import JsonResponse, StreamingHttpResponse, HttpResponseForbidden, HttpResponseBadRequest
+
+from .analytics import GROUPS, VALUE_COLUMNS, summarize
+from .cache import (
+    cache_response, cached_entry, entry_response, get_generations, response_cache_key, route_generation_name
+)
+from .decorators import auth_view, get_principal, CustomerRequired
 from .forms import FlightFilter, TicketStatusUpdateForm
-from .models import Flight, Company, Country, Ticket
-from accounts.models import Customer, User, Administrator, Token
+from .exporter import (
+    EXPORTS, EXPORT_FORMATS, STREAM_CONTENT_TYPES, export_columns, export_file_name, export_queryset, gzip_chunks,
+    stream_queryset
+)
+from .importer import IMPORT_FORMATS, import_schedule, text_stream
+from .itinerary import flight_graph, MAX_STOPS, SORT_KEYS
+from .managers import day_range
+from .models import (
+    Flight, Company, Country, Ticket, SeatHold, FlightSearch, RouteDailyStats, ArchivedFlight, ArchivedTicket
+)
+from accounts.cache import token_cache
+from accounts.models import Customer, User, Administrator
+from airline.middleware import measure
 
 
 # Serializing Data As Json
-# - serialize_queryset
 # - serialize_model_obj
-
-def serialize_queryset(queryset):
-    return json.dumps(list(queryset), cls=DjangoJSONEncoder)
+# - pagination_params
+# - page_response
+# - queryset_response
+
+PAGE_SIZE = getattr(settings, 'API_PAGE_SIZE', 100)
+MAX_PAGE_SIZE = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+STREAM_CHUNK_SIZE = getattr(settings, 'API_STREAM_CHUNK_SIZE', 2000)
+TICKETS_BATCH_MAX_SIZE = getattr(settings, 'TICKETS_BATCH_MAX_SIZE', 100)
+FLIGHTS_BATCH_MAX_SIZE = getattr(settings, 'FLIGHTS_BATCH_MAX_SIZE', 5000)
+ITINERARY_MAX_RESULTS = getattr(settings, 'ITINERARY_MAX_RESULTS', 50)
+FARE_CALENDAR_DAYS = getattr(settings, 'FARE_CALENDAR_DAYS', 30)
+FARE_CALENDAR_MAX_DAYS = getattr(settings, 'FARE_CALENDAR_MAX_DAYS', 366)
+FARE_CALENDAR_TIMEOUT = getattr(settings, 'FARE_CALENDAR_TIMEOUT', 60)
+ANALYTICS_DAYS = getattr(settings, 'ANALYTICS_DAYS', 30)
+ANALYTICS_MAX_DAYS = getattr(settings, 'ANALYTICS_MAX_DAYS', 366)
+STREAM_FORMATS = ('json', 'ndjson')
 
 
 def serialize_model_obj(obj):
-    return json.dumps(model_to_dict(obj), cls=DjangoJSONEncoder)
+    return model_to_dict(obj)
+
+
+def pagination_params(request):
+    """
+    Keyset pagination over `id` for list facades.
+    - `cursor`: return rows with an id greater than this value (the `X-Next-Cursor` of the previous page)
+    - `limit`: page size, capped by `API_MAX_PAGE_SIZE`
+    - `stream`: `json` or `ndjson`, stream every row after the cursor instead of a single page
+    """
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+        limit = min(int(request.GET.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError('Invalid pagination parameters')
+    if limit < 1:
+        raise ValueError('Invalid pagination parameters')
+
+    fmt = request.GET.get('stream')
+    if fmt is not None and fmt not in STREAM_FORMATS:
+        raise ValueError(f'Invalid stream format, only ({", ".join(STREAM_FORMATS)}) are acceptable')
+    return cursor, limit, fmt
+
+
+def page_response(rows, limit: int):
+    with measure('serialize'):
+        response = JsonResponse(rows[:limit], safe=False)
+    if len(rows) > limit:
+        response['X-Next-Cursor'] = rows[limit - 1]['id']
+    return response
+
+
+def queryset_response(request, queryset, archive=None):
+    try:
+        cursor, limit, fmt = pagination_params(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    queryset = queryset.filter(id__gt=cursor)
+    if archive is not None:
+        # Archived rows keep their id, so the live & archived rows are paginated as one table
+        queryset = queryset.union(archive.filter(id__gt=cursor), all=True)
+    queryset = queryset.order_by('id')
+    if fmt is not None:
+        return StreamingHttpResponse(stream_queryset(queryset, fmt, STREAM_CHUNK_SIZE),
+                                     content_type=STREAM_CONTENT_TYPES[fmt])
+    return page_response(list(queryset[:limit + 1]), limit)
 
 
 # Anonymous Facade
 # - get_all_flight
 # - get_flight_by_id
 # - get_flights_by_parameters
+# - get_itineraries
+# - get_fare_calendar
 # - get_all_airlines
 # - get_airline_by_id
 # - get_airline_by_parameters
@@ -41,12 +120,17 @@ def serialize_model_obj(obj):
 # - create_new_user
 
 def get_all_flights(request):
-    data = serialize_queryset(Flight.objects.all().values())
-    return JsonResponse(data, safe=False)
+    return queryset_response(request, Flight.objects.all().values())
+
+
+def get_flight_or_archived(flight_id):
+    # Flights moved to the archive by `archive_flights` keep their id
+    obj = Flight.objects.filter(id=flight_id).first()
+    return obj if obj is not None else get_object_or_404(ArchivedFlight, id=flight_id)
 
 
 def get_flight_by_id(request, flight_id):
-    obj = get_object_or_404(Flight, id=flight_id)
+    obj = get_flight_or_archived(flight_id)
     data = serialize_model_obj(obj)
     return JsonResponse(data, safe=False)
 
@@ -54,32 +138,74 @@ def get_flight_by_id(request, flight_id):
 def get_flights_by_parameters(request, origin_country_id: int, destination_country_id: int, date: str):
     d = datetime.fromisoformat(date)
     objects = Flight.objects.get_flights_by_parameters(int(origin_country_id), int(destination_country_id), d).values()
-    data = serialize_queryset(objects)
-    return JsonResponse(data, safe=False)
-
-
-def get_all_airlines(response):
-    data = serialize_queryset(Company.objects.all().values())
-    return JsonResponse(data, safe=False)
-
-
+    return queryset_response(request, objects)
+
+
+def get_itineraries(request, origin_country_id: int, destination_country_id: int, date: str):
+    try:
+        start, end = day_range(datetime.fromisoformat(date))
+        max_stops = int(request.GET.get('max_stops', MAX_STOPS))
+        limit = min(int(request.GET.get('limit', 20)), ITINERARY_MAX_RESULTS)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid itinerary parameters')
+    sort = request.GET.get('sort', 'duration')
+    if sort not in SORT_KEYS:
+        return HttpResponseBadRequest(f'Invalid sort, only ({", ".join(SORT_KEYS)}) are acceptable')
+    if not 0 <= max_stops <= MAX_STOPS or limit < 1:
+        return HttpResponseBadRequest('Invalid itinerary parameters')
+
+    itineraries = flight_graph.search(origin_country_id, destination_country_id, start, end, max_stops, sort, limit)
+    with measure('serialize'):
+        return JsonResponse(itineraries, safe=False)
+
+
+def get_fare_calendar(request, origin_country_id: int, destination_country_id: int):
+    # Min price, flights & seats left per day of [start, end], the cached days are dropped by any write of a flight
+    # of the route and seats left may lag bookings by `FARE_CALENDAR_TIMEOUT` seconds
+    try:
+        start = date.fromisoformat(request.GET['start']) if 'start' in request.GET else timezone.localdate()
+        end = date.fromisoformat(request.GET['end']) if 'end' in request.GET else \
+            start + timedelta(days=FARE_CALENDAR_DAYS - 1)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid dates, use YYYY-MM-DD')
+    if not 0 <= (end - start).days < FARE_CALENDAR_MAX_DAYS:
+        return HttpResponseBadRequest(f'Invalid range, at most {FARE_CALENDAR_MAX_DAYS} days are acceptable')
+
+    generations = get_generations([route_generation_name(origin_country_id, destination_country_id)])
+    key = response_cache_key(request, 'fare_calendar', (origin_country_id, destination_country_id), {}, generations)
+    entry = cache.get(key)
+    if entry is None:
+        days = Flight.objects.get_fare_calendar(origin_country_id, destination_country_id, start, end)
+        with measure('serialize'):
+            response = JsonResponse(list(days), safe=False)
+        entry = cached_entry(key, response, FARE_CALENDAR_TIMEOUT)
+    return entry_response(request, entry)
+
+
+@cache_response(Company)
+def get_all_airlines(request):
+    return queryset_response(request, Company.objects.all().values())
+
+
+@cache_response(Company)
 def get_airline_by_id(request, airline_id: int):
     obj = get_object_or_404(Company, id=airline_id)
     data = serialize_model_obj(obj)
     return JsonResponse(data, safe=False)
 
 
+@cache_response(Company)
 def get_airline_by_parameters(request, company_name: str):
     objects = Company.objects.get_airline_by_parameters(company_name).values()
-    data = serialize_queryset(objects)
-    return JsonResponse(data, safe=False)
+    return queryset_response(request, objects)
 
 
+@cache_response(Country)
 def get_all_countries(request):
-    data = serialize_queryset(Country.objects.all().values())
-    return JsonResponse(data, safe=False)
+    return queryset_response(request, Country.objects.all().values())
 
 
+@cache_response(Country)
 def get_country_by_id(request, country_id: int):
     obj = get_object_or_404(Country, id=country_id)
     data = serialize_model_obj(obj)
@@ -94,6 +220,7 @@ def create_new_user(user: dict):
 # Customer Facade
 # - update_customer (customer)
 # - add_ticket (ticket)
+# - add_tickets (tickets)
 # - remove_ticket (ticket)
 # - get_my_tickets ()
 
@@ -118,11 +245,29 @@ def add_ticket(request):
     return JsonResponse({'message': 'Ticket has been created Successfully'})
 
 
+@auth_view(method='POST')
+def add_tickets(request):
+    try:
+        items = [(int(item['flight']), int(item['customer'])) for item in json.loads(request.POST.get('tickets', ''))]
+    except (ValueError, TypeError, KeyError):
+        return HttpResponseBadRequest('Invalid tickets, It should be a JSON list of {"flight": id, "customer": id}')
+    if not 0 < len(items) <= TICKETS_BATCH_MAX_SIZE:
+        return HttpResponseBadRequest(f'Number of tickets should be between 1 and {TICKETS_BATCH_MAX_SIZE}')
+    principal = request.principal
+    if not principal.is_admin and any(customer_id != principal.customer_id for _, customer_id in items):
+        return HttpResponseForbidden('You are only allowed to book tickets for yourself')
+
+    booked, results = Ticket.objects.book_many(items)
+    if not booked:
+        return JsonResponse({'message': 'No ticket has been booked', 'results': results}, status=400)
+    return JsonResponse({'message': 'Tickets have been created Successfully', 'results': results})
+
+
 @auth_view(method='POST')
 def remove_ticket(request, ticket_id: int):
-    obj = get_object_or_404(Ticket, id=ticket_id)
-    token = get_object_or_404(Token, name=request.POST.get('token'))
-    if obj.customer.user != token.user:
+    # The flight is joined for the route stats of the released seat
+    obj = get_object_or_404(Ticket.objects.select_related('flight'), id=ticket_id)
+    if obj.customer_id is None or obj.customer_id != request.principal.customer_id:
         return HttpResponseForbidden('You are not the owner of this company')
     obj.delete()
     return JsonResponse({'message': 'Ticket has been deleted Successfully'})
@@ -130,32 +275,37 @@ def remove_ticket(request, ticket_id: int):
 
 @auth_view(method='GET')
 def get_my_tickets(request):
-    token = get_object_or_404(Token, name=request.GET.get('token'))
-    tickets = Ticket.objects.filter(customer__user=token.user)
-    data = serialize_queryset(tickets.values())
-    return JsonResponse(data, safe=False)
+    principal = request.principal
+    fields = ('id', 'flight_id', 'customer_id', 'status')
+    if not principal.is_customer:
+        return queryset_response(request, Ticket.objects.none().values(*fields))
+    # Tickets of the flights moved by `archive_flights` are listed too
+    tickets = Ticket.objects.filter(customer_id=principal.customer_id).values(*fields)
+    archived = ArchivedTicket.objects.filter(customer_id=principal.customer_id).values(*fields)
+    return queryset_response(request, tickets, archived)
 
 
 # Airline Facade
 # - get_my_flights ()
 # - update_airline (airline)
 # - add_flight (flight)
+# - import_flights (schedule)
 # - update_flight (flight)
+# - update_flights (flights)
 # - remove_flight (flight)
 
 @auth_view(method='GET')
 def get_my_flights(request):
-    token = get_object_or_404(Token, name=request.GET.get('token'))
-    flights = Flight.objects.filter(company__manager=token.user)
-    data = serialize_queryset(flights.values())
-    return JsonResponse(data, safe=False)
+    principal = request.principal
+    flights = Flight.objects.filter(company_id=principal.company_id) if principal.is_manager \
+        else Flight.objects.none()
+    return queryset_response(request, flights.values())
 
 
 @auth_view(method='POST')
 def update_airline(request, airline: int):
     obj = get_object_or_404(Company, id=airline)
-    token = get_object_or_404(Token, name=request.POST.get('token'))
-    if obj.manager != token.user:
+    if obj.id != request.principal.company_id:
         return HttpResponseForbidden('You are not the owner of this company')
     obj.name = request.POST.get('name', obj.name)
     obj.country = get_object_or_404(Country, id=int(request.POST.get('country', obj.country.id)))
@@ -165,10 +315,10 @@ def update_airline(request, airline: int):
 
 @auth_view(method='POST')
 def add_flight(request):
-    token = get_object_or_404(Token, name=request.POST.get('token'))
-    customer = token.user
+    if not request.principal.is_manager:
+        return HttpResponseForbidden('You are not the manager of a company')
     Flight.objects.create(
-        company=customer.manager,
+        company_id=request.principal.company_id,
         origin=get_object_or_404(Country, id=int(request.POST.get('origin'))),
         destination=get_object_or_404(Country, id=int(request.POST.get('destination'))),
         departure_time=datetime.fromisoformat(request.POST.get('departure_time')),
@@ -178,11 +328,30 @@ def add_flight(request):
     return JsonResponse({'message': 'Airline Company Has Updated Successfully'}, safe=False)
 
 
+@auth_view(method='POST')
+def import_flights(request):
+    if not request.principal.is_manager:
+        return HttpResponseForbidden('You are not the manager of a company')
+    schedule = request.FILES.get('schedule')
+    if schedule is None:
+        return HttpResponseBadRequest('A schedule file is required')
+    fmt = request.POST.get('format') or schedule.name.rpartition('.')[2].lower()
+    if fmt not in IMPORT_FORMATS:
+        return HttpResponseBadRequest(f'Invalid format, It should be one of ({", ".join(IMPORT_FORMATS)})')
+
+    try:
+        report = import_schedule(text_stream(schedule.file), fmt, request.principal.company_id)
+    except (UnicodeDecodeError, csv.Error):
+        return HttpResponseBadRequest('The schedule file is not valid UTF-8 ' + fmt.upper())
+    if not report['created']:
+        return JsonResponse({'message': 'No flight has been imported', **report}, status=400)
+    return JsonResponse({'message': 'Flights have been imported Successfully', **report})
+
+
 @auth_view(method='POST')
 def update_flight(request, flight: int):
-    token = get_object_or_404(Token, name=request.POST.get('token'))
     flight = get_object_or_404(Flight, id=flight)
-    if flight.company.manager != token.user:
+    if flight.company_id is None or flight.company_id != request.principal.company_id:
         return HttpResponseForbidden('Your company is not the owner of this flight')
     flight.origin = get_object_or_404(Country, id=int(request.POST.get('origin', flight.origin.id)))
     flight.destination = get_object_or_404(Country, id=int(request.POST.get('destination', flight.destination.id)))
@@ -193,11 +362,27 @@ def update_flight(request, flight: int):
     return JsonResponse({'message': 'Flight Has Updated Successfully'}, safe=False)
 
 
+@auth_view(method='POST')
+def update_flights(request):
+    if not request.principal.is_manager:
+        return HttpResponseForbidden('You are not the manager of a company')
+    try:
+        changes = [(int(item.pop('id')), item) for item in json.loads(request.POST.get('flights', ''))]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return HttpResponseBadRequest('Invalid flights, It should be a JSON list of {"id": id, field: value, ...}')
+    if not 0 < len(changes) <= FLIGHTS_BATCH_MAX_SIZE:
+        return HttpResponseBadRequest(f'Number of flights should be between 1 and {FLIGHTS_BATCH_MAX_SIZE}')
+
+    updated, results = Flight.objects.update_many(request.principal.company_id, changes)
+    if not updated:
+        return JsonResponse({'message': 'No flight has been updated', 'results': results}, status=400)
+    return JsonResponse({'message': 'Flights have been updated Successfully', 'results': results})
+
+
 @auth_view(method='POST')
 def remove_flight(request, flight: int):
-    token = get_object_or_404(Token, name=request.POST.get('token'))
     obj = get_object_or_404(Flight, id=flight)
-    if obj.company.manager != token.user:
+    if obj.company_id is None or obj.company_id != request.principal.company_id:
         return HttpResponseForbidden('Your company is not the owner of this flight')
     obj.delete()
     return JsonResponse({'message': 'Flight has been deleted Successfully'})
@@ -211,11 +396,11 @@ def remove_flight(request, flight: int):
 # - remove_airline (airline)
 # - remove_customer (customer)
 # - remove_administrator (administrator)
+# - get_cache_stats ()
 
 @auth_view(method='GET', allow_admin_only=True)
 def get_all_customers(request):
-    data = serialize_queryset(Customer.objects.all().values())
-    return JsonResponse(data, safe=False)
+    return queryset_response(request, Customer.objects.all().values())
 
 
 @auth_view(method='POST', allow_admin_only=True)
@@ -272,9 +457,90 @@ def remove_administrator(request, administrator: int):
     return JsonResponse({'message': 'Administrator has been deleted Successfully'})
 
 
+@auth_view(method='GET', allow_admin_only=True)
+def get_cache_stats(request):
+    return JsonResponse({'token_cache': token_cache.stats()})
+
+
+# Analytics Facade (admins & airlines)
+# - get_analytics (group)
+
+@auth_view(method='GET')
+def get_analytics(request, group: str):
+    """
+    Load factor, revenue & cancellations per `day`, `route` or `company`, read from the daily route rollup only.
+    - `start` & `end`: departure days (YYYY-MM-DD), the last `ANALYTICS_DAYS` days by default
+    - `origin`, `destination` & `company` (admins): filters, airline managers only see their company
+    """
+    principal = request.principal
+    if group not in GROUPS:
+        return HttpResponseBadRequest(f'Invalid group, only ({", ".join(GROUPS)}) are available')
+    if not principal.is_admin and not principal.is_manager:
+        return HttpResponseForbidden('Only admins & airline managers have access to analytics')
+    try:
+        end = date.fromisoformat(request.GET['end']) if 'end' in request.GET else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if 'start' in request.GET else \
+            end - timedelta(days=ANALYTICS_DAYS - 1)
+        filters = {f'{name}_id': int(request.GET[name]) for name in ('origin', 'destination', 'company')
+                   if name in request.GET}
+    except ValueError:
+        return HttpResponseBadRequest('Invalid parameters, dates are YYYY-MM-DD & filters ids')
+    if not 0 <= (end - start).days < ANALYTICS_MAX_DAYS:
+        return HttpResponseBadRequest(f'Invalid range, at most {ANALYTICS_MAX_DAYS} days are acceptable')
+    if not principal.is_admin:
+        filters['company_id'] = principal.company_id
+
+    rows = RouteDailyStats.objects.filter(date__gte=start, date__lte=end, **filters).order_by()\
+        .values_list(*GROUPS[group], *VALUE_COLUMNS)
+    with measure('serialize'):
+        results, summary = summarize(rows, group)
+        response = JsonResponse({'start': start, 'end': end, 'group': group, 'summary': summary,
+                                 'results': results})
+    return response
+
+
+# Export Facade (admins & airlines)
+# - export_data (name)
+
+@auth_view(method='GET')
+def export_data(request, name: str):
+    """
+    Streams every row of the `flights`, `tickets` or `customers` export, admins export all of them and airline
+    managers the flights & tickets of their company.
+    - `format`: `csv` (default) or `ndjson`
+    - `columns`: comma separated column selection
+    - `gzip=1`: compressed on the fly, as a `.gz` file
+    """
+    principal = request.principal
+    if name not in EXPORTS:
+        return HttpResponseBadRequest(f'Invalid export, only ({", ".join(EXPORTS)}) are available')
+    if principal.is_admin:
+        company_id = None
+    elif principal.is_manager and EXPORTS[name].scope is not None:
+        company_id = principal.company_id
+    else:
+        return HttpResponseForbidden('You are not allowed to export ' + name)
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f'Invalid format, only ({", ".join(EXPORT_FORMATS)}) are acceptable')
+    try:
+        columns = export_columns(name, [column for column in request.GET.get('columns', '').split(',') if column])
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    gzip = request.GET.get('gzip') in ('1', 'true')
+
+    chunks = stream_queryset(export_queryset(name, columns, company_id), fmt, columns=columns)
+    response = StreamingHttpResponse(gzip_chunks(chunks) if gzip else chunks,
+                                     content_type='application/gzip' if gzip else STREAM_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{export_file_name(name, fmt, gzip)}"'
+    return response
+
+
 class SearchFlightView(ListView):
-    model = Flight
+    model = FlightSearch
     filterset_class = FlightFilter
+    paginate_by = 25
     template_name = "flight/search.html"
 
     def get_filterset_class(self):
@@ -284,11 +550,14 @@ class SearchFlightView(ListView):
         queryset = super().get_queryset()
         filterset = self.get_filterset_class()
         self.filterset = filterset(self.request.GET, queryset=queryset)
-        return self.filterset.qs.distinct()
+        return self.filterset.qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        query = self.request.GET.copy()
+        query.pop('page', None)
         context['filterset'] = self.filterset
+        context['querystring'] = query.urlencode()
         return context
 
 
@@ -300,31 +569,38 @@ class CreateTicketView(CustomerRequired, DetailView):
     success_message = "Ticket has been booked Successfully "
 
     def dispatch(self, request, *args, **kwargs):
+        principal = get_principal(request)
         obj = self.get_object()
-        customer_ticket = Ticket.objects.filter(customer__user=request.user, flight=obj)
-        if customer_ticket.exists():
+        if principal is not None and principal.is_customer \
+                and Ticket.objects.filter(customer_id=principal.customer_id, flight=obj).exists():
             messages.error(request, "You have already booked this ticket")
             return redirect("flight:search_flight")
         return super(CreateTicketView, self).dispatch(request, *args, **kwargs)
 
+    def get(self, request, *args, **kwargs):
+        # A seat is held while the customer fills in the payment, so the booking doesn't fail at the last step
+        self.object = self.get_object()
+        hold_expires_at = SeatHold.objects.take(self.object.id, request.principal.customer_id)
+        if hold_expires_at is None:
+            messages.error(request, "Number of tickets exceed the limit")
+            return redirect("flight:search_flight")
+        return self.render_to_response(self.get_context_data(object=self.object, hold_expires_at=hold_expires_at))
+
     def post(self, request, *args, **kwargs):
-        user = request.user
-        customer = Customer.objects.get(user=user)
-        customer.credit_card = request.POST.get('credit_card')
-        customer.save()
+        customer_id = request.principal.customer_id
+        Customer.objects.filter(id=customer_id).update(credit_card=request.POST.get('credit_card'))
 
         flight = self.get_object()
-        count = flight.ticket_set.count()
-        if flight.num_of_tickets > count:
+        try:
             Ticket.objects.create(
-                customer=user.customer,
+                customer_id=customer_id,
                 flight=flight
             )
-            success_message = self.get_success_message()
-            messages.success(self.request, success_message)
-        else:
+        except ValidationError:
             messages.error(request, "Number of tickets exceed the limit")
             return redirect("flight:search_flight")
+        success_message = self.get_success_message()
+        messages.success(self.request, success_message)
 
         return redirect(self.success_url)
 
@@ -349,4 +625,11 @@ class TicketListView(CustomerRequired, ListView):
     template_name = "flight/list.html"
 
     def get_queryset(self):
-        return self.model.objects.filter(customer=self.request.user.customer)
+        return self.model.objects.filter(customer_id=self.request.principal.customer_id)
+
+    def get_context_data(self, **kwargs):
+        # Tickets of the flights moved to the archive by `archive_flights`, read only
+        kwargs['archived_tickets'] = ArchivedTicket.objects.filter(customer_id=self.request.principal.customer_id)\
+            .select_related('flight__company', 'flight__origin', 'flight__destination')\
+            .order_by('-flight__departure_time')
+        return super(TicketListView, self).get_context_data(**kwargs)